@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from motor_backtest import DIAS_UTEIS, JANELA_VOL, volatilidade_movel
+
+# Métricas de desempenho vetorizadas para todas as colunas de uma vez.
+#
+# As funções recebem matrizes (dias x colunas) e rótulos de período por dia
+# (ano, ano*12+mês, ...). As bordas de cada período saem de uma única
+# comparação entre rótulos vizinhos, e o IndiceAcumulado calcula retornos,
+# médias e excessos de todos os períodos e colunas nessas posições, sem
+# groupby/apply.
+
+VOL_MINIMA = 1e-10
+
+
+def rotulos_anuais(datas):
+    return pd.DatetimeIndex(datas).year.to_numpy()
+
+
+def rotulos_mensais(datas):
+    datas = pd.DatetimeIndex(datas)
+    return datas.year.to_numpy() * 12 + datas.month.to_numpy() - 1
+
+
+# Primeira e última posição de cada período contíguo; os rótulos devem vir
+# em ordem cronológica.
+def bordas_periodos(rotulos):
+    rotulos = np.asarray(rotulos)
+    if len(rotulos) == 0:
+        vazio = np.array([], dtype=np.intp)
+        return rotulos[:0], vazio, vazio
+    primeiro = np.flatnonzero(np.r_[True, rotulos[1:] != rotulos[:-1]])
+    ultimo = np.r_[primeiro[1:] - 1, len(rotulos) - 1]
+    return rotulos[primeiro], primeiro, ultimo
+
+
+# Excesso multiplicativo de cada coluna sobre a coluna `benchmark`
+def excesso(retornos, benchmark):
+    retornos = np.asarray(retornos)
+    return (1 + retornos) / (1 + retornos[:, [benchmark]]) - 1
+
+
+def drawdown(nivel):
+    nivel = np.asarray(nivel, dtype=np.float64)
+    return nivel / np.maximum.accumulate(nivel, axis=0) - 1
+
+
+def drawdown_maximo(nivel):
+    return drawdown(nivel).min(axis=0)
+
+
+def _soma_movel(valores, janela):
+    zeros = np.zeros((1,) + valores.shape[1:])
+    acumulado = np.concatenate([zeros, np.cumsum(valores, axis=0)])
+    return acumulado[janela:] - acumulado[:-janela]
+
+
+# Sharpe móvel anualizado do excesso de retorno diário sobre a coluna livre
+# de risco. Como em volatilidade_movel, o retorno da posição 0 não existe e
+# as primeiras `janela` posições ficam NaN.
+def sharpe_movel(retornos, livre_de_risco, janela=JANELA_VOL):
+    retornos = np.asarray(retornos, dtype=np.float64)
+    excedente = retornos - retornos[:, [livre_de_risco]]
+    sharpe = np.full(retornos.shape, np.nan)
+    if len(retornos) <= janela:
+        return sharpe
+    media = _soma_movel(excedente[1:], janela) / janela
+    vol = volatilidade_movel(excedente, janela)[janela:] / np.sqrt(DIAS_UTEIS)
+    # Excesso praticamente constante (ex.: IPCA vs CDI) deixa só ruído de
+    # arredondamento no desvio; nesses casos o Sharpe fica indefinido.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe[janela:] = np.where(vol > VOL_MINIMA, media / vol * np.sqrt(DIAS_UTEIS), np.nan)
+    return sharpe
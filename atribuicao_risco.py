@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import motor_backtest
+from janela_movel import JanelaCovariancia
+from motor_backtest import ALTA, DIAS_UTEIS, JANELA_VOL
+
+# Atribuição de risco móvel: quanto cada ativo contribui para a vol da
+# carteira em cada dia.
+#
+# A covariância da janela é mantida pela JanelaCovariancia (acréscimo e
+# remoção de posto um a cada dia, em O(ativos²)), em vez de reestimada do
+# zero a cada janela. Com os pesos w do dia e a covariância anualizada S:
+#   vol        = sqrt(wᵀ S w)
+#   marginal   = S w / vol          (derivada da vol em relação a cada peso)
+#   componente = w * marginal       (soma das componentes = vol)
+# O resultado cobre todos os dias de uma vez e a consulta de uma data é só
+# um recorte. Quem guarda o da carteira do fundo entre execuções é o LRU de
+# carteiras.py, dentro do orçamento de memória das carteiras.
+
+
+def contribuicoes(retornos, pesos, janela=JANELA_VOL, recalibrar=252):
+    retornos = np.asarray(retornos, dtype=np.float64)
+    pesos = np.asarray(pesos, dtype=np.float64)
+    n_dias, n_ativos = retornos.shape
+    vol = np.full(n_dias, np.nan)
+    marginal = np.full((n_dias, n_ativos), np.nan)
+    componente = np.full((n_dias, n_ativos), np.nan)
+
+    covariancia = JanelaCovariancia(n_ativos, janela, recalibrar)
+    # Como em volatilidade_movel, o retorno da posição 0 não existe
+    for t in range(1, n_dias):
+        covariancia.adicionar(retornos[t])
+        if not covariancia.cheia:
+            continue
+        risco = covariancia.covariancia() @ pesos[t] * DIAS_UTEIS
+        variancia = pesos[t] @ risco
+        if variancia <= 0:
+            continue
+        vol[t] = np.sqrt(variancia)
+        marginal[t] = risco / vol[t]
+        componente[t] = pesos[t] * marginal[t]
+    return {'vol': vol, 'marginal': marginal, 'componente': componente}
+
+
+# Atribuição de uma tabela de preços (datas x ativos) com os pesos vigentes
+# em cada data (último peso conhecido); serve para os ETFs ou para o
+# universo de fundos. Devolve DataFrames indexados pelas datas dos preços.
+def atribuir(precos, pesos, janela=JANELA_VOL):
+    ativos = list(pesos.columns)
+    precos = precos[ativos].ffill()
+    valores = precos.to_numpy(dtype=np.float64)
+    retornos = np.zeros_like(valores)
+    retornos[1:] = valores[1:] / valores[:-1] - 1
+    retornos[~np.isfinite(retornos)] = 0.0
+    alinhados = pesos.reindex(precos.index, method='ffill').fillna(0.0).to_numpy(dtype=np.float64)
+    return tabelas(precos.index, ativos, retornos, alinhados, janela)
+
+
+# contribuicoes em Series/DataFrames indexados por data e ativo
+def tabelas(datas, ativos, retornos, pesos, janela=JANELA_VOL):
+    bruto = contribuicoes(retornos, pesos, janela)
+    return {
+        'vol': pd.Series(bruto['vol'], index=datas),
+        'marginal': pd.DataFrame(bruto['marginal'], index=datas, columns=ativos),
+        'componente': pd.DataFrame(bruto['componente'], index=datas, columns=ativos)
+    }
+
+
+# Contribuições de cada ativo numa data (último pregão até ela)
+def na_data(resultado, data):
+    componente = resultado['componente'].loc[:pd.Timestamp(data)]
+    if len(componente) == 0:
+        return None
+    dia = componente.index[-1]
+    return pd.DataFrame({
+        'marginal': resultado['marginal'].loc[dia],
+        'componente': resultado['componente'].loc[dia],
+        'percentual': resultado['componente'].loc[dia] / resultado['vol'].loc[dia]
+    })
+
+
+# Atribuição da carteira alvo do fundo: em cada fechamento, os pesos da
+# carteira (alta ou baixa vol) escolhida pelo regime. None sem o painel de
+# preços dos ETFs.
+def atribuicao_fundo(parametros=None, janela=JANELA_VOL, caminho_precos=motor_backtest.ARQUIVO_PRECOS,
+                     pesos_alta=motor_backtest.ARQUIVO_PESOS_ALTA, pesos_baixa=motor_backtest.ARQUIVO_PESOS_BAIXA):
+    if not os.path.exists(caminho_precos):
+        return None
+    if parametros is None:
+        parametros = motor_backtest.carregar_parametros()
+    insumos = motor_backtest.preparar_insumos(motor_backtest.carregar_precos(caminho_precos),
+                                              motor_backtest.carregar_pesos(pesos_alta),
+                                              motor_backtest.carregar_pesos(pesos_baixa))
+    sinais = motor_backtest.derivar_sinais(insumos)
+    regime = motor_backtest.calcular_regime(sinais['vol_sinal'], sinais['concentracao'], parametros)
+    pesos = np.where((regime == ALTA)[:, None], insumos['alta'], insumos['baixa'])
+    return tabelas(insumos['datas'], insumos['ativos'], insumos['retornos'], pesos, janela)
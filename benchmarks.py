@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import dados
+import indice_acumulado
+import motor_backtest
+import pesos_esparsos
+from tempo_importacao import APP, PAGINAS
+
+# Benchmarks do carregamento de dados, das contas e das páginas do app.
+#
+# Micro-benchmarks: leitura do CSV de comparação, construção do
+# IndiceAcumulado (rebase, cumprod da taxa de adm e vol móvel), agregações
+# anuais e mensais, tabela do heatmap e médias dos pesos. Páginas: cada
+# página roda num processo novo pelo AppTest do Streamlit (como no
+# tempo_importacao), com a primeira execução (fria) e a mediana das
+# reexecuções (quente); as etapas medidas pelo módulo metricas entram no
+# resultado.
+#
+# Além dos dados reais, roda sobre dados sintéticos escalados em dias ou em
+# ativos (10x, 100x): os retornos diários reais são repetidos com
+# deslocamentos aleatórios, então a distribuição fica a mesma e só o tamanho
+# cresce. Dias e ativos escalam separadamente; os dois juntos a 100x não
+# cabem em memória.
+#
+# Cada execução é anexada a ARQUIVO_HISTORICO e comparada com a anterior
+# da mesma máquina; o script sai com código 1 se algum tempo piorou mais
+# que TOLERANCIA (e mais que PISO segundos).
+#
+#   python benchmarks.py
+#   python benchmarks.py --escalas dias:10 dias:100 --sem-paginas
+
+ARQUIVO_HISTORICO = 'benchmarks.jsonl'
+ESCALAS = [('dias', 1), ('dias', 10), ('dias', 100), ('ativos', 10), ('ativos', 100)]
+ESCALAS_PAGINAS = [('dias', 1), ('dias', 10), ('ativos', 10)]
+REPETICOES = 5
+TOLERANCIA = 0.25
+PISO = 0.002
+SEMENTE = 0
+
+_CODIGO = """
+import json
+import statistics
+import sys
+import time
+from streamlit.testing.v1 import AppTest
+import metricas
+at = AppTest.from_file(sys.argv[1], default_timeout=600)
+inicio = time.perf_counter()
+at.run()
+if sys.argv[2] != 'Home':
+    at.sidebar.radio[0].set_value(sys.argv[2]).run()
+fria = time.perf_counter() - inicio
+metricas.limpar()
+quentes = []
+for _ in range(int(sys.argv[3])):
+    inicio = time.perf_counter()
+    at.run()
+    quentes.append(time.perf_counter() - inicio)
+print(json.dumps({
+    'fria': fria,
+    'quente': statistics.median(quentes),
+    'etapas': {nome: v['p50'] for nome, v in metricas.resumo()['trechos'].items() if not nome.startswith('pagina.')},
+    'erros': [str(e.value) for e in at.exception]
+}))
+"""
+
+
+def _nome_escala(escala):
+    eixo, fator = escala
+    return 'x1' if fator == 1 else f'x{fator}{eixo[0]}'
+
+
+# Retornos logarítmicos (T x C) de uma tabela de níveis, sem NaN
+def _log_retornos(tabela):
+    log_nivel = np.log(tabela.ffill().bfill().to_numpy(dtype=np.float64))
+    return np.nan_to_num(np.diff(log_nivel, axis=0, prepend=log_nivel[:1]))
+
+
+def _deslocados(matriz, n, rng):
+    return [np.roll(matriz, rng.integers(len(matriz)), axis=0) for _ in range(n)]
+
+
+# Tabela de níveis escalada em dias (blocos de retornos um após o outro, em
+# datas corridas a partir de 1700 para caber no intervalo do datetime64[ns])
+# ou em ativos (cópias das colunas com outra ordem dos dias). As colunas
+# originais ficam nas primeiras posições, com os mesmos nomes.
+def escalar_niveis(tabela, escala, semente=SEMENTE):
+    eixo, fator = escala
+    if fator == 1:
+        return tabela
+    rng = np.random.default_rng(semente)
+    retornos = _log_retornos(tabela)
+    if eixo == 'dias':
+        retornos = np.concatenate([retornos] + _deslocados(retornos, fator - 1, rng))
+        datas = pd.date_range('1700-01-01', periods=len(retornos), freq='D', name=tabela.index.name)
+        colunas = list(tabela.columns)
+    else:
+        retornos = np.concatenate([retornos] + _deslocados(retornos, fator - 1, rng), axis=1)
+        datas = tabela.index
+        colunas = list(tabela.columns) + [f'{c} {k}' for k in range(1, fator) for c in tabela.columns]
+    nivel = tabela.ffill().bfill().to_numpy(dtype=np.float64)[0]
+    niveis = np.exp(np.cumsum(retornos, axis=0)) * np.tile(nivel, len(colunas) // len(nivel))
+    return pd.DataFrame(niveis, index=datas, columns=colunas)
+
+
+# Pesos escalados: em dias, a mesma sequência repetida; em ativos, cada peso
+# dividido igualmente entre as cópias do ativo (as linhas continuam somando 1)
+def escalar_pesos(pesos, escala):
+    eixo, fator = escala
+    if fator == 1:
+        return pesos
+    if eixo == 'dias':
+        valores = np.tile(pesos.fillna(0.0).to_numpy(), (fator, 1))
+        datas = pd.date_range('1700-01-01', periods=len(valores), freq='D', name=pesos.index.name)
+        return pd.DataFrame(valores, index=datas, columns=pesos.columns)
+    valores = np.tile(pesos.fillna(0.0).to_numpy() / fator, (1, fator))
+    colunas = list(pesos.columns) + [f'{c} {k}' for k in range(1, fator) for c in pesos.columns]
+    return pd.DataFrame(valores, index=pesos.index, columns=colunas)
+
+
+# Diretório de trabalho com os arquivos do app e as tabelas escaladas
+def preparar_diretorio(escala, destino):
+    origem = os.path.dirname(APP)
+    escalados = {
+        dados.ARQUIVO_COMPARACAO: escalar_niveis(dados.carregar_comparacao(), escala),
+        motor_backtest.ARQUIVO_PESOS_ALTA: escalar_pesos(motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_ALTA), escala),
+        motor_backtest.ARQUIVO_PESOS_BAIXA: escalar_pesos(motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_BAIXA), escala)
+    }
+    for nome in os.listdir(origem):
+        if os.path.isfile(os.path.join(origem, nome)) and nome not in escalados:
+            os.symlink(os.path.join(origem, nome), os.path.join(destino, nome))
+    for nome, tabela in escalados.items():
+        tabela.to_csv(os.path.join(destino, nome), date_format='%Y-%m-%d')
+    return destino
+
+
+def medir(funcao, repeticoes=REPETICOES):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+
+def micro(escala, repeticoes=REPETICOES):
+    comparacao = escalar_niveis(dados.carregar_comparacao(), escala)
+    pesos = escalar_pesos(motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_ALTA), escala)
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = os.path.join(diretorio, 'comparacao.csv')
+        comparacao.to_csv(caminho, date_format='%Y-%m-%d')
+        indice = indice_acumulado.IndiceAcumulado(comparacao, indice_acumulado.TAXA_ADM)
+        historico = pesos_esparsos.HistoricoPesos.de_tabela(pesos)
+        inicio, fim = indice.datas[0], indice.datas[-1]
+        casos = {
+            'carregar_csv': lambda: dados._ler_csv(caminho, True),
+            'indice': lambda: indice_acumulado.IndiceAcumulado(comparacao, indice_acumulado.TAXA_ADM),
+            'vol_movel': lambda: motor_backtest.volatilidade_movel(indice.retornos),
+            'retorno_acumulado': lambda: indice.retorno_acumulado(inicio, fim),
+            'curva': lambda: indice.curva(inicio, fim),
+            'retornos_anuais': lambda: indice.retornos_anuais(inicio, fim),
+            'variacao_media_mensal': lambda: indice.variacao_media_mensal(inicio, fim),
+            'heatmap': lambda: indice.excesso_mensal(inicio, fim),
+            'pesos_media_anual': lambda: historico.media_periodo('anual'),
+            'pesos_giro': historico.giro
+        }
+        return {f'micro.{nome}.{_nome_escala(escala)}': medir(funcao, repeticoes) for nome, funcao in casos.items()}
+
+
+def medir_pagina(pagina, app=APP, repeticoes=REPETICOES):
+    processo = subprocess.run([sys.executable, '-c', _CODIGO, app, pagina, str(repeticoes)],
+                              capture_output=True, text=True, cwd=os.path.dirname(app))
+    if processo.returncode != 0:
+        raise RuntimeError(processo.stderr.strip().splitlines()[-1])
+    resultado = json.loads(processo.stdout.strip().splitlines()[-1])
+    if resultado['erros']:
+        raise RuntimeError(f'{pagina}: {resultado["erros"][0]}')
+    return resultado
+
+
+def paginas(escala, repeticoes=REPETICOES):
+    resultados = {}
+    with tempfile.TemporaryDirectory() as diretorio:
+        app = APP if escala[1] == 1 else os.path.join(preparar_diretorio(escala, diretorio), os.path.basename(APP))
+        for pagina in PAGINAS:
+            resultado = medir_pagina(pagina, app, repeticoes)
+            sufixo = _nome_escala(escala)
+            resultados[f'pagina.{pagina}.fria.{sufixo}'] = resultado['fria']
+            resultados[f'pagina.{pagina}.quente.{sufixo}'] = resultado['quente']
+            for etapa, segundos in resultado['etapas'].items():
+                resultados[f'etapa.{etapa}.{sufixo}'] = segundos
+    return resultados
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(APP)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def carregar_historico(caminho=ARQUIVO_HISTORICO):
+    if not os.path.exists(caminho):
+        return []
+    with open(caminho, 'r') as arquivo:
+        return [json.loads(linha) for linha in arquivo if linha.strip()]
+
+
+def gravar(execucao, caminho=ARQUIVO_HISTORICO):
+    with open(caminho, 'a') as arquivo:
+        arquivo.write(json.dumps(execucao) + '\n')
+
+
+# Tempos que pioraram mais que `tolerancia` (e mais que `piso` segundos) em
+# relação à `referencia`: [(nome, antes, depois)]
+def regressoes(resultados, referencia, tolerancia=TOLERANCIA, piso=PISO):
+    return [(nome, referencia[nome], segundos) for nome, segundos in sorted(resultados.items())
+            if nome in referencia and segundos > referencia[nome] * (1 + tolerancia)
+            and segundos - referencia[nome] > piso]
+
+
+# Razão de cada micro-benchmark em cada escala sobre o tempo nos dados reais
+def curvas_escala(resultados):
+    base = {nome[:-len('.x1')]: s for nome, s in resultados.items() if nome.startswith('micro.') and nome.endswith('.x1')}
+    linhas = []
+    for nome, segundos in resultados.items():
+        prefixo, _, sufixo = nome.rpartition('.')
+        if prefixo in base and sufixo != 'x1':
+            ordem = (prefixo, sufixo[-1], int(sufixo[1:-1]))
+            linhas.append((ordem, f'{prefixo:<36} {sufixo:>6} {segundos / base[prefixo]:>8.1f}x'))
+    return [linha for _, linha in sorted(linhas)]
+
+
+def executar(escalas=ESCALAS, escalas_paginas=ESCALAS_PAGINAS, repeticoes=REPETICOES):
+    resultados = {}
+    for escala in escalas:
+        resultados.update(micro(escala, repeticoes))
+    for escala in escalas_paginas:
+        resultados.update(paginas(escala, repeticoes))
+    return {
+        'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _commit(),
+        'plataforma': platform.platform(),
+        'python': platform.python_version(),
+        'resultados': resultados
+    }
+
+
+def _escala(texto):
+    eixo, _, fator = texto.partition(':')
+    if eixo not in ('dias', 'ativos') or not fator.isdigit():
+        raise argparse.ArgumentTypeError('use dias:N ou ativos:N')
+    return (eixo, int(fator))
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description='Benchmarks de dados, contas e páginas do app.')
+    parser.add_argument('--escalas', nargs='+', type=_escala, default=ESCALAS)
+    parser.add_argument('--escalas-paginas', nargs='+', type=_escala, default=ESCALAS_PAGINAS)
+    parser.add_argument('--sem-paginas', action='store_true')
+    parser.add_argument('--repeticoes', type=int, default=REPETICOES)
+    parser.add_argument('--historico', default=ARQUIVO_HISTORICO)
+    parser.add_argument('--nao-gravar', action='store_true')
+    argumentos = parser.parse_args(argumentos)
+
+    anteriores = [e for e in carregar_historico(argumentos.historico) if e['plataforma'] == platform.platform()]
+    execucao = executar(argumentos.escalas, [] if argumentos.sem_paginas else argumentos.escalas_paginas,
+                        argumentos.repeticoes)
+    resultados = execucao['resultados']
+    referencia = anteriores[-1]['resultados'] if anteriores else {}
+
+    for nome, segundos in sorted(resultados.items()):
+        antes = referencia.get(nome)
+        variacao = f'{segundos / antes - 1:>+8.1%}' if antes else ''
+        print(f'{nome:<56} {segundos * 1000:>10.2f} ms {variacao}')
+    print('\n'.join(['', 'Escala (tempo / tempo nos dados reais):'] + curvas_escala(resultados)))
+
+    if not argumentos.nao_gravar:
+        gravar(execucao, argumentos.historico)
+    piores = regressoes(resultados, referencia)
+    if piores:
+        print('\nREGRESSÕES:')
+        for nome, antes, depois in piores:
+            print(f'{nome}: {antes * 1000:.2f} ms -> {depois * 1000:.2f} ms')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
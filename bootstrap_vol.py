@@ -0,0 +1,97 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from motor_backtest import JANELA_VOL, volatilidade_movel
+
+# Probabilidade de a vol móvel ficar abaixo de um limite (ou dentro de uma
+# banda) por bootstrap estacionário em blocos dos retornos diários do fundo.
+#
+# Cada caminho reamostra a série em blocos de tamanho geométrico (média
+# `bloco_medio` pregões), o que preserva o agrupamento de volatilidade que
+# uma reamostragem dia a dia destruiria. A vol de 21 dias é recalculada em
+# todos os caminhos de uma vez, como uma matriz (dias x caminhos), e a fração
+# do tempo abaixo do limite de cada caminho forma a distribuição da qual saem
+# a estimativa e o intervalo de confiança. Os caminhos são processados em
+# lotes limitados por MEMORIA_LOTE; cada lote tem sua própria semente, então
+# o resultado é o mesmo com um ou vários processos.
+
+N_CAMINHOS = 2000
+BLOCO_MEDIO = JANELA_VOL
+CONFIANCA = 0.95
+MEMORIA_LOTE = 64 * 1024 * 1024
+
+
+# Índices (caminhos x dias) do bootstrap estacionário de Politis-Romano: a
+# cada dia um novo bloco começa com probabilidade 1/bloco_medio num ponto
+# sorteado; senão o bloco segue para o dia seguinte (circularmente).
+def indices_bootstrap(n_dias, n_caminhos, bloco_medio=BLOCO_MEDIO, rng=None):
+    rng = np.random.default_rng(rng)
+    novo_bloco = rng.random((n_caminhos, n_dias)) < 1 / bloco_medio
+    novo_bloco[:, 0] = True
+    inicio = rng.integers(0, n_dias, (n_caminhos, n_dias))
+    dias = np.arange(n_dias)
+    comeco = np.maximum.accumulate(np.where(novo_bloco, dias, 0), axis=1)
+    origem = np.take_along_axis(inicio, comeco, axis=1)
+    return (origem + dias - comeco) % n_dias
+
+
+# Fração dos dias de cada caminho com vol abaixo de `limite` e dentro de
+# [banda[0], banda[1]]
+def fracoes_lote(retornos, n_caminhos, limite, banda, bloco_medio, janela, semente):
+    indices = indices_bootstrap(len(retornos), n_caminhos, bloco_medio, semente)
+    caminhos = retornos[indices].T
+    # volatilidade_movel ignora a primeira linha (o dia sem retorno)
+    caminhos = np.vstack([np.zeros((1, n_caminhos)), caminhos])
+    vol = volatilidade_movel(caminhos, janela)[janela:]
+    abaixo = (vol < limite).mean(axis=0)
+    na_banda = ((vol >= banda[0]) & (vol <= banda[1])).mean(axis=0)
+    return np.stack([abaixo, na_banda], axis=1)
+
+
+def _fracoes_lote(argumentos):
+    return fracoes_lote(*argumentos)
+
+
+def _intervalo(amostras, confianca):
+    cauda = (1 - confianca) / 2 * 100
+    inferior, superior = np.percentile(amostras, [cauda, 100 - cauda])
+    return {'estimativa': float(amostras.mean()), 'inferior': float(inferior), 'superior': float(superior)}
+
+
+# `retornos` são os retornos diários do fundo na janela analisada (sem o dia
+# inicial). Devolve, para "abaixo" e "banda", a fração observada na própria
+# série, a média dos caminhos e o intervalo de confiança percentil.
+def estimar(retornos, limite=0.10, banda=(0.05, 0.12), n_caminhos=N_CAMINHOS, bloco_medio=BLOCO_MEDIO,
+            janela=JANELA_VOL, confianca=CONFIANCA, semente=0, processos=1):
+    retornos = np.asarray(retornos, dtype=np.float64)
+    retornos = retornos[np.isfinite(retornos)]
+    if len(retornos) <= janela:
+        vazio = {'observado': np.nan, 'estimativa': np.nan, 'inferior': np.nan, 'superior': np.nan}
+        return {'abaixo': dict(vazio), 'banda': dict(vazio)}
+
+    # A matriz de índices e os caminhos reamostrados dominam a memória
+    por_caminho = len(retornos) * 8 * 4
+    tamanho_lote = max(1, min(n_caminhos, MEMORIA_LOTE // por_caminho))
+    tamanhos = [min(tamanho_lote, n_caminhos - i) for i in range(0, n_caminhos, tamanho_lote)]
+    sementes = np.random.SeedSequence(semente).spawn(len(tamanhos))
+    lotes = [(retornos, n, limite, banda, bloco_medio, janela, s) for n, s in zip(tamanhos, sementes)]
+
+    processos = processos or os.cpu_count() or 1
+    if processos == 1 or len(lotes) == 1:
+        fracoes = [fracoes_lote(*lote) for lote in lotes]
+    else:
+        with ProcessPoolExecutor(min(processos, len(lotes))) as executor:
+            fracoes = list(executor.map(_fracoes_lote, lotes))
+    fracoes = np.concatenate(fracoes)
+
+    vol = volatilidade_movel(np.r_[0.0, retornos], janela)[janela:]
+    observado = {
+        'abaixo': float((vol < limite).mean()),
+        'banda': float(((vol >= banda[0]) & (vol <= banda[1])).mean())
+    }
+    return {
+        nome: dict(_intervalo(fracoes[:, k], confianca), observado=observado[nome])
+        for k, nome in enumerate(['abaixo', 'banda'])
+    }
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import metricas
+
+# Registro de carteiras servidas pelo mesmo app.
+#
+# Cada carteira é uma configuração em ARQUIVO_CARTEIRAS: arquivos de pesos
+# de alta e baixa vol, parâmetros do gatilho (sobre os do arquivo
+# qualitativo), taxa de administração e, se quiser, outra comparação ou
+# outro painel de preços. Campos omitidos usam os arquivos padrão; sem o
+# arquivo de registro há uma só carteira, NOME_PADRAO, igual ao app de
+# sempre:
+#   {"Moria Defensivo": {"pesos_alta": "pesos_alta_def.csv",
+#                        "parametros": {"vol_gatilho_subir": 0.11},
+#                        "taxa_adm": 1.0}}
+# Pesos e parâmetros próprios só valem com o painel de preços dos ETFs, que
+# o motor usa para recalcular a cota; sem ele, verificar recusa a carteira.
+#
+# Os painéis de benchmarks e de preços vêm de dados.carregar_tabela_mapeada:
+# uma cópia mapeada em memória, somente leitura, para todas as carteiras (e
+# para todos os processos). O que é próprio de cada carteira (a cota
+# recalculada, o índice acumulado com a sua taxa, o resumo) fica num LRU
+# limitado por ORCAMENTO_BYTES, chaveado pela configuração e pelas versões dos
+# arquivos; com dezenas de carteiras a memória fica no orçamento e as menos
+# usadas são recalculadas quando voltam.
+#
+# Este módulo é importado pelo main() do app em todas as páginas, então o
+# pandas e o motor só são importados dentro das funções que calculam algo.
+
+ARQUIVO_CARTEIRAS = 'carteiras.json'
+NOME_PADRAO = 'Fundo Moria'
+ORCAMENTO_BYTES = int(os.environ.get('MORIA_ORCAMENTO_MB', '256')) * 1024 * 1024
+CAMPOS = ['comparacao', 'quali', 'pesos_alta', 'pesos_baixa', 'precos', 'parametros', 'taxa_adm']
+
+_registro = {}
+_derivados = OrderedDict()
+_bytes = 0
+_trava = threading.Lock()
+
+
+def nova_carteira(nome, **campos):
+    desconhecidos = sorted(set(campos) - set(CAMPOS))
+    if desconhecidos:
+        raise ValueError(f'Campos desconhecidos na carteira {nome}: {desconhecidos}')
+    return dict({campo: None for campo in CAMPOS}, **campos, nome=nome)
+
+
+# Carteiras por nome, na ordem do arquivo; relido quando o arquivo muda
+def carregar_registro(caminho=ARQUIVO_CARTEIRAS):
+    if not os.path.exists(caminho):
+        return {NOME_PADRAO: nova_carteira(NOME_PADRAO)}
+    assinatura = os.stat(caminho).st_mtime_ns
+    with _trava:
+        if _registro.get('assinatura') == assinatura:
+            return _registro['carteiras']
+    with open(caminho, 'r', encoding='utf-8') as json_file:
+        configuracao = json.load(json_file)
+    carteiras = {nome: nova_carteira(nome, **campos) for nome, campos in configuracao.items()}
+    with _trava:
+        _registro.update(assinatura=assinatura, carteiras=carteiras)
+    return carteiras
+
+
+# Caminhos efetivos da carteira (os padrões para os campos omitidos)
+def arquivos(carteira):
+    import dados
+    import motor_backtest
+
+    return {
+        'comparacao': carteira['comparacao'] or dados.ARQUIVO_COMPARACAO,
+        'quali': carteira['quali'] or dados.ARQUIVO_QUALI,
+        'pesos_alta': carteira['pesos_alta'] or motor_backtest.ARQUIVO_PESOS_ALTA,
+        'pesos_baixa': carteira['pesos_baixa'] or motor_backtest.ARQUIVO_PESOS_BAIXA,
+        'precos': carteira['precos'] or motor_backtest.ARQUIVO_PRECOS
+    }
+
+
+def parametros(carteira):
+    import motor_backtest
+
+    return dict(motor_backtest.carregar_parametros(arquivos(carteira)['quali']), **(carteira['parametros'] or {}))
+
+
+def taxa_adm(carteira):
+    import indice_acumulado
+
+    return indice_acumulado.TAXA_ADM if carteira['taxa_adm'] is None else carteira['taxa_adm']
+
+
+# Arquivos de que a cota depende, na ordem de resultados.versao_dataset (a
+# carteira padrão cai nas mesmas chaves dos resumos já gravados)
+def arquivos_cota(carteira):
+    caminhos = arquivos(carteira)
+    return [caminhos['comparacao'], caminhos['pesos_alta'], caminhos['pesos_baixa'], caminhos['precos']]
+
+
+def _tamanho(valor):
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(valor, np.memmap):
+        return 0
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes
+    if isinstance(valor, (pd.DataFrame, pd.Series, pd.Index)):
+        return int(np.sum(valor.memory_usage(index=True) if not isinstance(valor, pd.Index) else valor.memory_usage()))
+    if isinstance(valor, dict):
+        return sum(_tamanho(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sum(_tamanho(v) for v in valor)
+    if hasattr(valor, '__dict__'):
+        return _tamanho(vars(valor))
+    return sys.getsizeof(valor)
+
+
+def _chave(carteira, tipo):
+    import resultados
+
+    sha = hashlib.sha1(json.dumps(carteira, sort_keys=True).encode())
+    sha.update(resultados.versao_dataset(arquivos_cota(carteira) + [arquivos(carteira)['quali']]).encode())
+    return (carteira['nome'], tipo, sha.hexdigest())
+
+
+# Resultado derivado da carteira, calculado uma vez e mantido no LRU enquanto
+# couber no orçamento; o mais recente sempre fica, mesmo sozinho acima dele
+def _obter(carteira, tipo, construtor):
+    global _bytes
+    chave = _chave(carteira, tipo)
+    with _trava:
+        if chave in _derivados:
+            _derivados.move_to_end(chave)
+            metricas.cache('carteiras', True)
+            return _derivados[chave][0]
+    metricas.cache('carteiras', False)
+    with metricas.trecho(f'carteiras.{tipo}'):
+        valor = construtor()
+    tamanho = _tamanho(valor)
+    with _trava:
+        if chave not in _derivados:
+            # Versões antigas da mesma carteira não voltam mais
+            for antiga in [c for c in _derivados if c[:2] == chave[:2]]:
+                _bytes -= _derivados.pop(antiga)[1]
+            _derivados[chave] = (valor, tamanho)
+            _bytes += tamanho
+            while _bytes > ORCAMENTO_BYTES and len(_derivados) > 1:
+                _, (_, antigo) = _derivados.popitem(last=False)
+                _bytes -= antigo
+    return valor
+
+
+def uso_memoria():
+    with _trava:
+        return {'carteiras': len({c[0] for c in _derivados}), 'resultados': len(_derivados), 'bytes': _bytes}
+
+
+def limpar_cache():
+    global _bytes
+    with _trava:
+        _derivados.clear()
+        _bytes = 0
+
+
+# Pesos e parâmetros próprios só entram na cota recalculada pelo motor, que
+# precisa do painel de preços; sem ele a carteira teria a cota gravada na
+# comparação, a mesma das outras, e a configuração seria ignorada em silêncio
+def verificar(carteira):
+    caminhos = arquivos(carteira)
+    proprios = [campo for campo in ('pesos_alta', 'pesos_baixa', 'parametros') if carteira[campo]]
+    if proprios and not os.path.exists(caminhos['precos']):
+        raise FileNotFoundError(
+            f'A carteira {carteira["nome"]} define {", ".join(proprios)}, que só se aplicam recalculando a cota '
+            f'com o painel de preços dos ETFs ({caminhos["precos"]}), que não existe. Crie o painel com '
+            f'python ingestao.py <diretorio com precos.csv> --criar-painel')
+
+
+# Comparação com a cota da carteira: sem o painel de preços, a própria
+# comparação mapeada (nada a guardar por carteira)
+def comparacao(carteira):
+    import dados
+    import motor_backtest
+
+    verificar(carteira)
+    caminhos = arquivos(carteira)
+    base = dados.carregar_comparacao(caminhos['comparacao'])
+    if not os.path.exists(caminhos['precos']):
+        return base
+    return _obter(carteira, 'comparacao', lambda: motor_backtest.atualizar_fundo(
+        base, parametros(carteira), caminhos['precos'], caminhos['pesos_alta'], caminhos['pesos_baixa']))
+
+
+def indice(carteira):
+    import indice_acumulado
+
+    def construir():
+        versao = _chave(carteira, 'indice')[2]
+        return indice_acumulado.IndiceAcumulado(comparacao(carteira), taxa_adm(carteira), versao=versao)
+    return _obter(carteira, 'indice', construir)
+
+
+# Resumo da carteira numa janela de datas (sem janela, o período completo);
+# reaproveita os gravados por resultados.py. Cada janela é uma entrada do LRU.
+def resumo(carteira, inicio=None, fim=None):
+    import resultados
+
+    def construir():
+        indice_carteira = indice(carteira)
+        de = indice_carteira.datas[0] if inicio is None else inicio
+        ate = indice_carteira.datas[-1] if fim is None else fim
+        parametros_carteira = parametros(carteira)
+        chave = resultados.chave_resumo(resultados.versao_dataset(arquivos_cota(carteira)), parametros_carteira,
+                                        de, ate, taxa_adm(carteira))
+        gravado = resultados.ler(chave)
+        if gravado is not None:
+            return gravado
+        return dict(resultados.calcular_resumo(indice_carteira, de, ate), Parametros=parametros_carteira)
+    if inicio is None and fim is None:
+        return _obter(carteira, 'resumo', construir)
+    return _obter(carteira, f'resumo {str(inicio)[:10]} {str(fim)[:10]}', construir)
+
+
+def historico_fundo(carteira):
+    import pesos_esparsos
+
+    caminhos = arquivos(carteira)
+    if not os.path.exists(caminhos['precos']):
+        return None
+    return _obter(carteira, 'historico_fundo', lambda: pesos_esparsos.historico_fundo(
+        parametros(carteira), caminhos['precos'], caminhos['pesos_alta'], caminhos['pesos_baixa']))
+
+
+def atribuicao(carteira):
+    import atribuicao_risco
+
+    caminhos = arquivos(carteira)
+    if not os.path.exists(caminhos['precos']):
+        return None
+    return _obter(carteira, 'atribuicao', lambda: atribuicao_risco.atribuicao_fundo(
+        parametros(carteira), caminho_precos=caminhos['precos'],
+        pesos_alta=caminhos['pesos_alta'], pesos_baixa=caminhos['pesos_baixa']))
@@ -0,0 +1,164 @@
+import copy
+
+import numpy as np
+
+import indice_acumulado
+import motor_backtest
+from motor_backtest import ALTA, BAIXA
+
+# Custos de negociação da cota: giro diário e custo em vários cenários.
+#
+# No fechamento de cada dia os pesos da carteira mantida derivam com os
+# retornos do dia e são levados aos pesos alvo do próximo pregão. O valor
+# negociado em cada ativo depende só de qual carteira (alta ou baixa vol) foi
+# mantida no dia e de qual será mantida no seguinte, então as quatro matrizes
+# de negociação (dias x ativos) são calculadas uma vez por conjunto de
+# insumos. Os custos de cada cenário saem de produtos matriciais dessas
+# matrizes pelos custos por ativo:
+#   custo = negociado x (spread/2 + corretagem) + impacto x negociado^1.5
+# e, para cada caminho de regime, o custo diário (cenários x dias) é só uma
+# seleção entre as quatro combinações. Avaliar um novo conjunto de parâmetros
+# do gatilho com custos custa o mesmo que sem eles.
+#
+# Spread, corretagem e impacto são frações do valor negociado, por ativo.
+# Cada um aceita um número (todos os ativos), um dict {ativo: valor} ou uma
+# lista desses, um item por cenário.
+#
+# A varredura e o walk-forward recebem os custos (um cenário) como
+# custos_negociacao={'spread': ..., 'corretagem': ..., 'impacto': ...} e
+# acrescentam às métricas de cada combinação as líquidas de custos
+# (NOMES_METRICAS).
+
+NOMES_METRICAS = ['retorno_liquido', 'giro_anual', 'custo_total']
+
+
+def matriz_custos(ativos, valores, n_cenarios=None):
+    if not isinstance(valores, (list, tuple)):
+        valores = [valores] * (n_cenarios or 1)
+    matriz = np.zeros((len(valores), len(ativos)))
+    for s, valor in enumerate(valores):
+        if isinstance(valor, dict):
+            matriz[s] = [valor.get(ativo, 0.0) for ativo in ativos]
+        else:
+            matriz[s] = valor
+    return matriz
+
+
+# Pesos no fechamento do dia t depois dos retornos de t, para a carteira que
+# entrou no dia com os pesos alvo de t-1. No dia 0 a posição ainda é caixa.
+def pesos_derivados(retornos, pesos):
+    derivados = np.zeros_like(pesos)
+    anteriores = pesos[:-1]
+    crescimento = anteriores * (1 + retornos[1:])
+    derivados[1:] = crescimento / (1 + np.einsum('ij,ij->i', anteriores, retornos[1:]))[:, None]
+    return derivados
+
+
+class MotorCustos:
+
+    def __init__(self, insumos, spread=0.0, corretagem=0.0, impacto=0.0):
+        self.ativos = insumos['ativos']
+        self.datas = insumos['datas']
+        cenarios = {len(v) for v in (spread, corretagem, impacto) if isinstance(v, (list, tuple))}
+        if len(cenarios) > 1:
+            raise ValueError('Todos os custos com cenários precisam ter o mesmo número de cenários')
+        n_cenarios = cenarios.pop() if cenarios else 1
+        lineares = (matriz_custos(self.ativos, spread, n_cenarios) / 2
+                    + matriz_custos(self.ativos, corretagem, n_cenarios))
+        impactos = matriz_custos(self.ativos, impacto, n_cenarios)
+        self.n_cenarios = n_cenarios
+
+        pesos = {ALTA: insumos['alta'], BAIXA: insumos['baixa']}
+        derivados = {regime: pesos_derivados(insumos['retornos'], pesos[regime]) for regime in pesos}
+        # giro[(mantida, proxima)]: metade do valor negociado em cada dia
+        # custo[(mantida, proxima)]: cenários x dias
+        self.giro = {}
+        self.custo = {}
+        for mantida in (ALTA, BAIXA):
+            for proxima in (ALTA, BAIXA):
+                negociado = np.abs(pesos[proxima] - derivados[mantida])
+                self.giro[(mantida, proxima)] = negociado.sum(axis=1) / 2
+                self.custo[(mantida, proxima)] = (lineares @ negociado.T) + (impactos @ (negociado ** 1.5).T)
+
+    # O mesmo motor restrito aos dias [inicio, fim), como o recorte dos sinais
+    # nas dobras do walk-forward. O primeiro dia do recorte parte da posição
+    # derivada do dia anterior, não de caixa.
+    def recortar(self, inicio, fim):
+        recorte = copy.copy(self)
+        recorte.datas = None if self.datas is None else self.datas[inicio:fim]
+        recorte.giro = {chave: valores[inicio:fim] for chave, valores in self.giro.items()}
+        recorte.custo = {chave: valores[:, inicio:fim] for chave, valores in self.custo.items()}
+        return recorte
+
+    # Carteira mantida em cada dia (regime de t-1) e a do pregão seguinte
+    def _transicoes(self, regime):
+        regime = np.asarray(regime)
+        mantida = np.concatenate([[regime[0]], regime[:-1]])
+        return mantida, regime
+
+    def _selecionar(self, tabela, regime):
+        mantida, proxima = self._transicoes(regime)
+        resultado = np.zeros_like(tabela[(ALTA, ALTA)])
+        for chave, valores in tabela.items():
+            dias = (mantida == chave[0]) & (proxima == chave[1])
+            resultado[..., dias] = valores[..., dias]
+        return resultado
+
+    # Giro diário (fração da cota negociada) para o caminho de regime
+    def giro_diario(self, regime):
+        return self._selecionar(self.giro, regime)
+
+    # Custo diário como fração da cota, cenários x dias
+    def custo_diario(self, regime):
+        return self._selecionar(self.custo, regime)
+
+    # Cota líquida de custos (cenários x dias), a partir dos retornos brutos do
+    # fundo; com `taxa_adm`, também descontada a taxa de administração diária
+    def cota_liquida(self, retornos_fundo, regime, taxa_adm=0.0):
+        fator = (1 + np.asarray(retornos_fundo))[None, :] * (1 - self.custo_diario(regime))
+        # Como no IndiceAcumulado, a taxa começa a correr no segundo dia
+        fator[:, 1:] /= indice_acumulado.custo_diario(taxa_adm)
+        return np.cumprod(fator, axis=1)
+
+
+# Métricas líquidas de custos de um caminho de regime, uma por cenário
+def metricas_liquidas(sinais, motor_custos, regime, taxa_adm=0.0):
+    retornos = motor_backtest.retorno_fundo(sinais, regime)
+    cota = motor_custos.cota_liquida(retornos, regime, taxa_adm)
+    giro = motor_custos.giro_diario(regime)
+    return {
+        'cota': cota,
+        'retorno_acumulado': cota[:, -1] - 1,
+        'giro_anual': giro[1:].mean() * motor_backtest.DIAS_UTEIS,
+        'custo_total': 1 - np.prod(1 - motor_custos.custo_diario(regime), axis=1)
+    }
+
+
+# Métricas do backtest líquidas de custos, uma por cenário
+def avaliar_liquido(sinais, motor_custos, parametros, taxa_adm=0.0):
+    regime = motor_backtest.calcular_regime(sinais['vol_sinal'], sinais['concentracao'], parametros)
+    return dict(metricas_liquidas(sinais, motor_custos, regime, taxa_adm), regime=regime)
+
+
+# As NOMES_METRICAS de um caminho de regime, com um só cenário de custos,
+# contando só os dias a partir de `inicio` (o teste de uma dobra, com o
+# regime e a posição vindos dos dias anteriores)
+def resumo_liquido(sinais, motor_custos, regime, inicio=0):
+    retornos = motor_backtest.retorno_fundo(sinais, regime)[inicio:]
+    custo = motor_custos.custo_diario(regime)[0, inicio:]
+    giro = motor_custos.giro_diario(regime)[max(inicio, 1):]
+    return {
+        'retorno_liquido': float(np.prod((1 + retornos) * (1 - custo)) - 1),
+        'giro_anual': float(giro.mean() * motor_backtest.DIAS_UTEIS),
+        'custo_total': float(1 - np.prod(1 - custo))
+    }
+
+
+# Motor para os custos da varredura e do walk-forward; None sem custos
+def motor_negociacao(insumos, custos_negociacao):
+    if not custos_negociacao:
+        return None
+    motor_custos = MotorCustos(insumos, **custos_negociacao)
+    if motor_custos.n_cenarios != 1:
+        raise ValueError('A varredura e o walk-forward avaliam um cenário de custos por vez')
+    return motor_custos
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import metricas
+
+# Camada de acesso aos dados do app.
+#
+# Cada arquivo é lido uma única vez por processo e fica num cache em memória
+# compartilhado por todas as sessões do Streamlit (o mesmo papel do
+# st.cache_resource). A cada acesso só o mtime/tamanho do arquivo é
+# consultado; se mudaram, o conteúdo é re-hasheado e, se o hash também mudou,
+# o arquivo é relido. O cache guarda até LIMITE_ENTRADAS arquivos (cada
+# arquivo ocupa uma entrada por forma de leitura); os menos usados saem e são
+# relidos quando voltam. As tabelas são guardadas como float64 indexadas por
+# data, e uma cópia em Parquet (quando o pyarrow está instalado) evita parsear
+# o CSV e as datas de novo após reiniciar o processo.
+#
+# Os painéis grandes (comparação com os benchmarks e preços dos ETFs) são
+# servidos mapeados em memória: os valores ficam num .npy em DIRETORIO_CACHE,
+# aberto com mmap somente leitura, e o DataFrame é uma visão sobre ele. Todos
+# os processos que servem o app (e todas as carteiras de um mesmo processo)
+# dividem as mesmas páginas do cache do sistema operacional, em vez de cada
+# um ter a sua cópia.
+#
+# Os objetos devolvidos são compartilhados: trate-os como somente leitura
+# (os mapeados levantam erro em qualquer escrita).
+#
+# Vários processos podem gravar espelhos de versões diferentes do mesmo
+# arquivo ao mesmo tempo. Quem grava só apaga os espelhos mais antigos que o
+# seu, e quem não acha um espelho que acabou de ver (apagado por outro
+# processo no meio da leitura) o grava de novo.
+
+DIRETORIO_CACHE = '.cache_dados'
+# Muda quando _ler_csv passa a produzir outra tabela a partir do mesmo CSV,
+# para os espelhos gravados antes não serem reaproveitados
+VERSAO_ESPELHO = 2
+
+ARQUIVO_COMPARACAO = 'comparacao ETFs.csv'
+ARQUIVO_HISTORICO_PESOS = 'Historico dos pesos.csv'
+ARQUIVO_QUALI = 'analise_quali.json'
+
+LIMITE_ENTRADAS = int(os.environ.get('MORIA_DADOS_ENTRADAS', '64'))
+
+_cache = OrderedDict()
+_trava = threading.Lock()
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_DISPONIVEL = True
+except ImportError:
+    PARQUET_DISPONIVEL = False
+
+
+def _assinatura(caminho):
+    estado = os.stat(caminho)
+    return (estado.st_mtime_ns, estado.st_size)
+
+
+def _hash_arquivo(caminho):
+    sha = hashlib.sha1()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 20), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def _carregar(caminho, leitor, tipo):
+    chave = (os.path.abspath(caminho), tipo)
+    assinatura = _assinatura(caminho)
+    with _trava:
+        entrada = _cache.get(chave)
+        if entrada is not None and entrada['assinatura'] == assinatura:
+            _cache.move_to_end(chave)
+            metricas.cache('dados', True)
+            return entrada
+
+    with metricas.trecho('dados.hash'):
+        versao = _hash_arquivo(caminho)
+    metricas.contar('bytes_lidos', assinatura[1])
+    with _trava:
+        entrada = _cache.get(chave)
+        if entrada is not None and entrada['versao'] == versao:
+            entrada['assinatura'] = assinatura
+            _cache.move_to_end(chave)
+            metricas.cache('dados', True)
+            return entrada
+
+    metricas.cache('dados', False)
+    with metricas.trecho('dados.leitura'):
+        valor = leitor(caminho, versao)
+    entrada = {'assinatura': assinatura, 'versao': versao, 'valor': valor}
+    with _trava:
+        _cache[chave] = entrada
+        _cache.move_to_end(chave)
+        while len(_cache) > LIMITE_ENTRADAS:
+            _cache.popitem(last=False)
+    return entrada
+
+
+def _nome_espelho(caminho):
+    return os.path.splitext(os.path.basename(caminho))[0].replace(' ', '_')
+
+
+def _caminho_parquet(caminho, versao):
+    return os.path.join(DIRETORIO_CACHE, f'{_nome_espelho(caminho)}-{versao[:16]}-v{VERSAO_ESPELHO}.parquet')
+
+
+# Apaga os espelhos de outras versões do mesmo arquivo (`<nome>-<hash>...`
+# terminados em `sufixo`) gravados antes do atual. Um espelho mais novo é de
+# outro processo, que acabou de gravar a sua versão, e fica. Um espelho
+# aberto por outro processo pode não sair agora (Windows); fica para a
+# próxima gravação.
+def _podar(caminho, atual, sufixo):
+    padrao = re.compile(re.escape(_nome_espelho(caminho)) + r'-[0-9a-f]{16}(-v\d+)?' + re.escape(sufixo) + '$')
+    gravado = os.stat(atual).st_mtime_ns
+    for arquivo in os.listdir(DIRETORIO_CACHE):
+        antigo = os.path.join(DIRETORIO_CACHE, arquivo)
+        if not padrao.match(arquivo) or antigo == atual:
+            continue
+        try:
+            if os.stat(antigo).st_mtime_ns < gravado:
+                os.remove(antigo)
+        except OSError:
+            pass
+
+
+# Ordena pelo índice preservando a ordem do arquivo entre datas iguais e, se
+# uma data aparece mais de uma vez (como o 2025-09-04 repetido na
+# comparação), fica a última linha do arquivo
+def _ler_csv(caminho, datas):
+    tabela = pd.read_csv(caminho, index_col=0)
+    if datas:
+        tabela.index = pd.to_datetime(tabela.index)
+        tabela.index.name = 'Data'
+    tabela = tabela.sort_index(kind='stable')
+    tabela = tabela[~tabela.index.duplicated(keep='last')]
+    return tabela.astype(np.float64)
+
+
+def _leitor_tabela(datas):
+    def ler(caminho, versao):
+        if not PARQUET_DISPONIVEL:
+            return _ler_csv(caminho, datas)
+        espelho = _caminho_parquet(caminho, versao)
+        if os.path.exists(espelho):
+            try:
+                return pd.read_parquet(espelho)
+            except FileNotFoundError:
+                pass
+        tabela = _ler_csv(caminho, datas)
+        os.makedirs(DIRETORIO_CACHE, exist_ok=True)
+        temporario = f'{espelho}.{os.getpid()}.tmp'
+        tabela.to_parquet(temporario)
+        os.replace(temporario, espelho)
+        _podar(caminho, espelho, '.parquet')
+        return tabela
+    return ler
+
+
+def _caminho_mapa(caminho, versao, parte):
+    return os.path.join(DIRETORIO_CACHE, f'{_nome_espelho(caminho)}-{versao[:16]}-v{VERSAO_ESPELHO}.{parte}.npy')
+
+
+def _gravar_npy(destino, valores):
+    temporario = f'{destino}.{os.getpid()}.tmp.npy'
+    np.save(temporario, valores, allow_pickle=False)
+    os.replace(temporario, destino)
+
+
+# Valores em .npy mapeado; índice e colunas em .npy pequenos, lidos inteiros.
+# Os valores são gravados por último e marcam o espelho como completo.
+def _leitor_mapeado(datas):
+    def ler(caminho, versao, regravar=False):
+        valores_npy = _caminho_mapa(caminho, versao, 'valores')
+        indice_npy = _caminho_mapa(caminho, versao, 'indice')
+        colunas_npy = _caminho_mapa(caminho, versao, 'colunas')
+        if regravar or not os.path.exists(valores_npy):
+            tabela = _ler_csv(caminho, datas)
+            os.makedirs(DIRETORIO_CACHE, exist_ok=True)
+            indice = tabela.index.to_numpy() if datas else tabela.index.astype(str).to_numpy(dtype=str)
+            _gravar_npy(indice_npy, indice)
+            _gravar_npy(colunas_npy, tabela.columns.astype(str).to_numpy(dtype=str))
+            _gravar_npy(valores_npy, tabela.to_numpy(dtype=np.float64))
+            # Quem ainda mapeia uma versão antiga continua lendo dela até soltá-la
+            for parte, atual in (('valores', valores_npy), ('indice', indice_npy), ('colunas', colunas_npy)):
+                _podar(caminho, atual, f'.{parte}.npy')
+        try:
+            indice = pd.Index(np.load(indice_npy), name='Data' if datas else None)
+            colunas = np.load(colunas_npy).tolist()
+            valores = np.load(valores_npy, mmap_mode='r')
+        except FileNotFoundError:
+            # Apagado por outro processo entre o exists e o load: grava de novo
+            if regravar:
+                raise
+            return ler(caminho, versao, regravar=True)
+        return pd.DataFrame(valores, index=indice, columns=colunas, copy=False)
+    return ler
+
+
+def _ler_json(caminho, versao):
+    with open(caminho, 'r') as json_file:
+        return json.load(json_file)
+
+
+# Tabela com a primeira coluna como índice (datas, se `datas`) e valores float64
+def carregar_tabela(caminho, datas=True):
+    return _carregar(caminho, _leitor_tabela(datas), ('tabela', datas))['valor']
+
+
+# Como carregar_tabela, mas com os valores mapeados em memória
+def carregar_tabela_mapeada(caminho, datas=True):
+    return _carregar(caminho, _leitor_mapeado(datas), ('mapeada', datas))['valor']
+
+
+def carregar_json(caminho):
+    return _carregar(caminho, _ler_json, 'json')['valor']
+
+
+# Hash do conteúdo atual do arquivo; identifica a versão do dataset
+def versao(caminho):
+    return _carregar(caminho, lambda c, v: None, 'versao')['versao']
+
+
+def carregar_comparacao(caminho=ARQUIVO_COMPARACAO):
+    return carregar_tabela_mapeada(caminho)
+
+
+def carregar_historico_pesos(caminho=ARQUIVO_HISTORICO_PESOS):
+    return carregar_tabela(caminho, datas=False)
+
+
+def carregar_quali(caminho=ARQUIVO_QUALI):
+    return carregar_json(caminho)
+
+
+def limpar_cache():
+    with _trava:
+        _cache.clear()
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+from janela_movel import JanelaVolatilidade
+from motor_backtest import ALTA, BAIXA, DIAS_UTEIS, JANELA_VOL, PARAMETROS_PADRAO, regime_inicial
+
+# Avaliação do gatilho de volatilidade pregão a pregão, para a operação ao
+# vivo.
+#
+# O estado de cada carteira cabe em alguns vetores: a janela de 21 retornos
+# da carteira de alta vol (JanelaVolatilidade), os contadores de dias
+# seguidos de cada gatilho e o regime atual. Cada novo retorno atualiza tudo
+# em O(1) por carteira, sem refazer as janelas sobre o histórico, e o
+# resultado é o mesmo de motor_backtest.calcular_regime: mesma vol, mesmas
+# sementes, mesma persistência de `limite_dias` e prioridade do gatilho de
+# baixa. `previa` avalia um preço parcial do dia sem gravar o estado, para
+# acompanhar o gatilho durante o pregão.
+
+
+class Gatilho:
+
+    # Uma coluna por carteira; todas avançam no mesmo calendário
+    def __init__(self, n_carteiras, parametros=None, janela=JANELA_VOL, recalibrar=252):
+        if parametros is None:
+            parametros = dict(PARAMETROS_PADRAO)
+        self.n_carteiras = n_carteiras
+        self.parametros = parametros
+        self.dias = max(int(parametros['limite_dias']), 1)
+        self.janela = JanelaVolatilidade(n_carteiras, janela, recalibrar)
+        self.contagem_baixa = np.zeros(n_carteiras, dtype=np.int64)
+        self.contagem_alta = np.zeros(n_carteiras, dtype=np.int64)
+        self.regime = np.full(n_carteiras, regime_inicial(parametros), dtype=np.int8)
+        self.dia = 0
+
+    def _vetor(self, valores):
+        return np.broadcast_to(np.asarray(valores, dtype=np.float64), (self.n_carteiras,))
+
+    def _passo(self, retorno, concentracao):
+        parametros = self.parametros
+        # O primeiro pregão não tem retorno, como em volatilidade_movel
+        if self.dia == 0:
+            vol = np.full(self.n_carteiras, np.nan)
+        else:
+            vol = self.janela.desvio(retorno) * np.sqrt(DIAS_UTEIS)
+        sinal_vol = np.where(np.isnan(vol), parametros['vol_semente'], vol)
+        sinal_conc = np.where(np.isnan(concentracao), parametros['concentracao_semente'], concentracao)
+
+        aciona_baixa = (sinal_vol > parametros['vol_gatilho_subir']) | (sinal_conc > parametros['concentracao_gatilho_subir'])
+        aciona_alta = (sinal_vol < parametros['vol_gatilho_descer']) & (sinal_conc < parametros['concentracao_gatilho_descer'])
+        contagem_baixa = np.where(aciona_baixa, self.contagem_baixa + 1, 0)
+        contagem_alta = np.where(aciona_alta, self.contagem_alta + 1, 0)
+
+        regime = np.where(contagem_baixa >= self.dias, BAIXA,
+                          np.where(contagem_alta >= self.dias, ALTA, self.regime)).astype(np.int8)
+        return vol, contagem_baixa, contagem_alta, regime
+
+    # Fecha o pregão com o retorno da carteira de alta vol e a concentração
+    # dos seus pesos; devolve a vol, o regime no fechamento e quem mudou.
+    def avancar(self, retorno, concentracao):
+        retorno, concentracao = self._vetor(retorno), self._vetor(concentracao)
+        vol, self.contagem_baixa, self.contagem_alta, regime = self._passo(retorno, concentracao)
+        if self.dia > 0:
+            self.janela.adicionar(retorno)
+        mudou = regime != self.regime
+        self.regime = regime
+        self.dia += 1
+        return {'vol': vol, 'regime': regime.copy(), 'mudou': mudou}
+
+    # Mesma avaliação com um retorno parcial, sem alterar o estado
+    def previa(self, retorno, concentracao):
+        vol, _, _, regime = self._passo(self._vetor(retorno), self._vetor(concentracao))
+        return {'vol': vol, 'regime': regime, 'mudou': regime != self.regime}
+
+
+# Gatilho do fundo alimentado pelos preços de fechamento dos ETFs. Os pesos
+# seguem motor_backtest.preparar_insumos: vale o último peso conhecido na
+# data, e o retorno da carteira no dia t usa o peso do pregão anterior. O
+# primeiro pregão avaliado deve ser o primeiro dos históricos de pesos. O
+# retorno do fundo no dia usa os pesos alvo do fechamento anterior, como em
+# motor_backtest.retorno_fundo.
+class AvaliadorDiario:
+
+    def __init__(self, pesos_alta, pesos_baixa, parametros=None):
+        self.ativos = list(pesos_alta.columns)
+        faltando = sorted(set(pesos_baixa.columns) - set(self.ativos))
+        if faltando:
+            raise ValueError(f'Ativos da carteira de baixa vol fora da carteira de alta vol: {faltando}')
+        self.datas_pesos = pd.DatetimeIndex(pesos_alta.index)
+        self.datas_pesos_baixa = pd.DatetimeIndex(pesos_baixa.index)
+        self.pesos_alta = pesos_alta.fillna(0.0).to_numpy(dtype=np.float64)
+        self.pesos_baixa = pesos_baixa.reindex(columns=self.ativos).fillna(0.0).to_numpy(dtype=np.float64)
+        self.gatilho = Gatilho(1, parametros)
+        self.ultimo_preco = None
+        self.pesos_anteriores = np.zeros(len(self.ativos))
+        self.alvo_anterior = np.zeros(len(self.ativos))
+        self.data = None
+
+    def _pesos(self, datas, pesos, data):
+        i = datas.searchsorted(data, side='right') - 1
+        return pesos[i] if i >= 0 else np.zeros(len(self.ativos))
+
+    def _avaliar(self, data, precos, gravar):
+        data = pd.Timestamp(data)
+        preco = pd.Series(precos).reindex(self.ativos).to_numpy(dtype=np.float64)
+        if self.ultimo_preco is None:
+            retorno = retorno_fundo = 0.0
+        else:
+            preco = np.where(np.isnan(preco), self.ultimo_preco, preco)
+            retornos = preco / self.ultimo_preco - 1
+            retornos[~np.isfinite(retornos)] = 0.0
+            retorno = self.pesos_anteriores @ retornos
+            retorno_fundo = self.alvo_anterior @ retornos
+
+        alta = self._pesos(self.datas_pesos, self.pesos_alta, data)
+        conc = alta @ alta if alta.any() else np.nan
+        if gravar:
+            resultado = self.gatilho.avancar(retorno, conc)
+        else:
+            resultado = self.gatilho.previa(retorno, conc)
+
+        regime = int(resultado['regime'][0])
+        alvo = alta if regime == ALTA else self._pesos(self.datas_pesos_baixa, self.pesos_baixa, data)
+        if gravar:
+            self.ultimo_preco = preco
+            self.pesos_anteriores = alta
+            self.alvo_anterior = alvo
+            self.data = data
+        return {
+            'data': data,
+            'vol': float(resultado['vol'][0]),
+            'regime': regime,
+            'mudou': bool(resultado['mudou'][0]),
+            'retorno_fundo': float(retorno_fundo),
+            'pesos': pd.Series(alvo, index=self.ativos)
+        }
+
+    # Fechamento do pregão: atualiza o estado e devolve o regime e a linha de
+    # pesos alvo (alta ou baixa vol) para o próximo pregão
+    def novo_dia(self, data, precos):
+        return self._avaliar(data, precos, gravar=True)
+
+    # Preços parciais do pregão em andamento, sem alterar o estado
+    def previa(self, data, precos):
+        return self._avaliar(data, precos, gravar=False)
@@ -0,0 +1,119 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import metricas
+
+# Cache de figuras já renderizadas, compartilhado entre sessões.
+#
+# As figuras do matplotlib/seaborn (heatmap mensal e histograma de vol) são
+# guardadas como PNG e as do Plotly como JSON serializado. A chave é o hash
+# dos dados plotados (que identifica a janela de datas) mais os parâmetros
+# do gráfico, então KDE, anotações e layout só são refeitos quando alguma
+# entrada muda. O cache é um LRU limitado por bytes.
+
+MAXIMO_BYTES = 64 * 1024 * 1024
+# Mesmos padrões do st.pyplot, para a imagem sair igual
+OPCOES_PNG = {'format': 'png', 'bbox_inches': 'tight', 'dpi': 200}
+
+_cache = OrderedDict()
+_bytes = 0
+_trava = threading.Lock()
+
+
+def chave(tipo, dados=None, **parametros):
+    sha = hashlib.sha1(tipo.encode())
+    if isinstance(dados, (pd.DataFrame, pd.Series)):
+        sha.update(pd.util.hash_pandas_object(dados, index=True).to_numpy().tobytes())
+        nomes = list(dados.columns) if isinstance(dados, pd.DataFrame) else [dados.name]
+        sha.update(str(nomes).encode())
+    elif dados is not None:
+        sha.update(np.ascontiguousarray(dados).tobytes())
+    sha.update(repr(sorted(parametros.items())).encode())
+    return sha.hexdigest()
+
+
+def obter(chave_figura, construtor):
+    global _bytes
+    with _trava:
+        if chave_figura in _cache:
+            _cache.move_to_end(chave_figura)
+            metricas.cache('graficos', True)
+            return _cache[chave_figura]
+    metricas.cache('graficos', False)
+    with metricas.trecho('graficos.render'):
+        valor = construtor()
+    with _trava:
+        if chave_figura not in _cache:
+            _cache[chave_figura] = valor
+            _bytes += len(valor)
+            while _bytes > MAXIMO_BYTES and len(_cache) > 1:
+                _, antigo = _cache.popitem(last=False)
+                _bytes -= len(antigo)
+    return valor
+
+
+def limpar_cache():
+    global _bytes
+    with _trava:
+        _cache.clear()
+        _bytes = 0
+
+
+def _png(fig):
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, **OPCOES_PNG)
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def _heatmap(tabela, vmin, vmax):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    fig3, ax = plt.subplots(figsize = (12,10))
+    cmap = sns.color_palette('RdYlGn', 50) # define as cores
+    sns.heatmap(tabela, cmap = cmap, annot = True, fmt = '.2%', center = 0, vmax = vmax, vmin = vmin, cbar = False, linewidths=1, xticklabels = True, yticklabels = True, ax = ax)
+    ax.set_yticklabels(ax.get_yticklabels(), rotation = 0, verticalalignment = 'center', fontsize = '12')
+    ax.set_xticklabels(ax.get_xticklabels(), fontsize = '12')
+    ax.xaxis.tick_top() #colocar o x axis em cima
+    ax.set_ylabel('')
+    return _png(fig3)
+
+
+def _histograma(serie, bins):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from matplotlib.ticker import PercentFormatter
+
+    sns.set_style("whitegrid")
+    fig4, ax = plt.subplots(figsize=(10, 6))
+    sns.histplot(serie, kde=True, color='#0B58DC', bins=bins, ax = ax)
+    # Formatando o eixo X em percentual
+    ax.xaxis.set_major_formatter(PercentFormatter(1, decimals=0))
+    ax.set_title('Distribuição de Dados')
+    ax.set_xlabel('Valores (em percentual)')
+    ax.set_ylabel('Frequência')
+    return _png(fig4)
+
+
+def heatmap_png(tabela, vmin=-0.007, vmax=0.007):
+    return obter(chave('heatmap', tabela, vmin=vmin, vmax=vmax), lambda: _heatmap(tabela, vmin, vmax))
+
+
+def histograma_png(serie, bins=80):
+    return obter(chave('histograma', serie, bins=bins), lambda: _histograma(serie, bins))
+
+
+# Figura Plotly construída uma vez por chave e servida a partir do JSON
+def plotly(chave_figura, construtor):
+    import plotly.io as pio
+
+    texto = obter(chave_figura, lambda: construtor().to_json())
+    return pio.from_json(texto)
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+import analitico
+from motor_backtest import DIAS_UTEIS, JANELA_VOL, volatilidade_movel
+
+# Índice pré-calculado para o slider de datas do backtest.
+#
+# Para cada coluna guardamos o log do nível acumulado (na coluna do fundo, já
+# descontada a taxa de administração diária) e somas prefixadas do nível. Com
+# isso, para qualquer janela [inicio, fim]:
+#   - retorno acumulado       = exp(L[fim] - L[inicio])               O(1)
+#   - retorno de cada ano     = diferença de L nas bordas do ano      O(anos)
+#   - média mensal do nível   = diferença das somas prefixadas        O(meses)
+#   - vol móvel de 21 dias    = recorte da série já calculada
+# e a curva rebaseada é um único exp vetorizado sobre o recorte.
+#
+# Os índices das carteiras servidas pelo app ficam no cache de carteiras.py.
+
+COLUNA_FUNDO = 'Fundo'
+TAXA_ADM = 0.75
+MESES = ['JAN', 'FEV', 'MAR', 'ABR', 'MAI', 'JUN', 'JUL', 'AGO', 'SET', 'OUT', 'NOV', 'DEZ']
+
+
+def custo_diario(taxa_adm):
+    return (1 + (taxa_adm / 100)) ** (1 / DIAS_UTEIS)
+
+
+class IndiceAcumulado:
+
+    def __init__(self, comparacao, taxa_adm, coluna_fundo=COLUNA_FUNDO, versao=None):
+        comparacao = comparacao.ffill()
+        self.versao = versao
+        self.datas = pd.DatetimeIndex(comparacao.index)
+        self.colunas = list(comparacao.columns)
+        self.taxa_adm = taxa_adm
+
+        log_nivel = np.log(comparacao.to_numpy(dtype=np.float64))
+        if coluna_fundo in self.colunas:
+            j = self.colunas.index(coluna_fundo)
+            log_nivel[:, j] -= np.arange(len(log_nivel)) * np.log(custo_diario(taxa_adm))
+        self.log_nivel = log_nivel
+
+        nivel = np.exp(log_nivel - log_nivel[0])
+        self.nivel = nivel
+        self.soma_nivel = np.vstack([np.zeros(len(self.colunas)), np.cumsum(nivel, axis=0)])
+
+        retornos = np.zeros_like(nivel)
+        retornos[1:] = nivel[1:] / nivel[:-1] - 1
+        self.retornos = retornos
+        self.vol = volatilidade_movel(retornos, JANELA_VOL)
+
+        self.bordas_anuais = analitico.bordas_periodos(analitico.rotulos_anuais(self.datas))
+        self.bordas_mensais = analitico.bordas_periodos(analitico.rotulos_mensais(self.datas))
+
+    # Posições do primeiro e do último pregão dentro de [inicio, fim]
+    def janela(self, inicio, fim):
+        i = int(self.datas.searchsorted(pd.Timestamp(inicio), side='left'))
+        j = int(self.datas.searchsorted(pd.Timestamp(fim), side='right')) - 1
+        return i, max(i, j)
+
+    def _indices(self, colunas):
+        if colunas is None:
+            return list(range(len(self.colunas))), list(self.colunas)
+        return [self.colunas.index(c) for c in colunas], list(colunas)
+
+    def retorno_acumulado(self, inicio, fim, colunas=None):
+        i, j = self.janela(inicio, fim)
+        idx, nomes = self._indices(colunas)
+        return pd.Series(np.exp(self.log_nivel[j, idx] - self.log_nivel[i, idx]), index=nomes)
+
+    def curva(self, inicio, fim, colunas=None):
+        i, j = self.janela(inicio, fim)
+        idx, nomes = self._indices(colunas)
+        valores = np.exp(self.log_nivel[i:j + 1, idx] - self.log_nivel[i, idx])
+        return pd.DataFrame(valores, index=self.datas[i:j + 1], columns=nomes)
+
+    # Bordas dos períodos que tocam a janela, recortadas a [i, j]; as bordas
+    # do histórico inteiro são calculadas uma vez, então o custo é O(períodos).
+    def _recortar(self, bordas, i, j):
+        periodos, primeiro, ultimo = bordas
+        a = np.searchsorted(ultimo, i)
+        b = np.searchsorted(primeiro, j, side='right')
+        return periodos[a:b], np.maximum(primeiro[a:b], i), np.minimum(ultimo[a:b], j)
+
+    # Razão último/primeiro valor de cada ano dentro da janela, menos 1
+    def retornos_anuais(self, inicio, fim, colunas=None):
+        i, j = self.janela(inicio, fim)
+        idx, nomes = self._indices(colunas)
+        anos, primeiro, ultimo = self._recortar(self.bordas_anuais, i, j)
+        valores = np.expm1(self.log_nivel[np.ix_(ultimo, idx)] - self.log_nivel[np.ix_(primeiro, idx)])
+        return pd.DataFrame(valores, index=pd.Index(anos, name='Ano'), columns=nomes)
+
+    # Retornos anuais de cada coluna em excesso ao `benchmark`
+    def excesso_anual(self, inicio, fim, benchmark='CDI', colunas=None):
+        anuais = self.retornos_anuais(inicio, fim)
+        valores = analitico.excesso(anuais.to_numpy(), self.colunas.index(benchmark))
+        excesso = pd.DataFrame(valores, index=anuais.index, columns=self.colunas)
+        return excesso if colunas is None else excesso[list(colunas)]
+
+    # Média mensal do nível rebaseado e sua variação mês a mês. O fator de
+    # rebase é comum a todos os meses da janela e se cancela na variação.
+    def variacao_media_mensal(self, inicio, fim, colunas=None):
+        i, j = self.janela(inicio, fim)
+        idx, nomes = self._indices(colunas)
+        periodos, primeiro, ultimo = self._recortar(self.bordas_mensais, i, j)
+        soma = self.soma_nivel[np.ix_(ultimo + 1, idx)] - self.soma_nivel[np.ix_(primeiro, idx)]
+        media = soma / (ultimo - primeiro + 1)[:, None]
+        variacao = media[1:] / media[:-1] - 1
+        indice = pd.MultiIndex.from_arrays([periodos[1:] // 12, periodos[1:] % 12 + 1], names=['Ano', 'Mes'])
+        return pd.DataFrame(variacao, index=indice, columns=nomes)
+
+    # Tabela Mes x Ano do excesso mensal de `coluna` sobre `benchmark`
+    def excesso_mensal(self, inicio, fim, coluna=COLUNA_FUNDO, benchmark='CDI'):
+        variacao = self.variacao_media_mensal(inicio, fim, [coluna, benchmark])
+        diff = (1 + variacao[coluna]) / (1 + variacao[benchmark]) - 1
+        tabela = diff.unstack('Ano').reindex(range(1, 13)).fillna(0)
+        tabela.index = MESES
+        return tabela
+
+    # Vol móvel de 21 dias anualizada; os primeiros dias da janela ficam NaN,
+    # como se a série tivesse começado em `inicio`.
+    def vol_movel(self, inicio, fim, colunas=None):
+        i, j = self.janela(inicio, fim)
+        idx, nomes = self._indices(colunas)
+        vol = self.vol[i:j + 1, idx].copy()
+        vol[:JANELA_VOL] = np.nan
+        return pd.DataFrame(vol, index=self.datas[i:j + 1], columns=nomes)
+
+    def drawdown(self, inicio, fim, colunas=None):
+        curva = self.curva(inicio, fim, colunas)
+        return pd.DataFrame(analitico.drawdown(curva.to_numpy()), index=curva.index, columns=curva.columns)
+
+    # Sharpe móvel de 21 dias sobre o `livre_de_risco`, com o mesmo recorte da vol
+    def sharpe_movel(self, inicio, fim, livre_de_risco='CDI', colunas=None):
+        i, j = self.janela(inicio, fim)
+        idx, nomes = self._indices(colunas)
+        sharpe = analitico.sharpe_movel(self.retornos[i:j + 1], self.colunas.index(livre_de_risco), JANELA_VOL)
+        return pd.DataFrame(sharpe[:, idx], index=self.datas[i:j + 1], columns=nomes)
+
@@ -0,0 +1,301 @@
+import argparse
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+import dados
+import gatilho
+import motor_backtest
+from motor_backtest import DIAS_UTEIS
+
+# Ingestão diária incremental dos painéis de preços e das séries do BCB.
+#
+# Só os pregões posteriores à última data gravada são buscados e anexados ao
+# fim dos CSVs. As colunas de comparação continuam do último nível gravado
+# (nível novo = último nível x retornos acumulados dos dias novos), então
+# nada do histórico desde 2019-10-10 é recalculado.
+#
+# As séries do SGS ficam num cache local (um CSV por código) com uma marca
+# d'água da última data consultada: cada execução pede ao SGS só o trecho
+# após a última observação, e nenhuma chamada é feita se a série já foi
+# consultada hoje. A origem dos dados é plugável: FonteSGS para as séries do
+# Banco Central e FonteArquivo para arquivos locais (preços exportados e, sem
+# rede, também as séries), o que permite rodar a ingestão offline.
+#
+#   python ingestao.py <diretorio com precos.csv> [--offline]
+#
+# O painel de preços dos ETFs (motor_backtest.ARQUIVO_PRECOS), de que o
+# motor, a varredura, o walk-forward e a otimização dos pesos dependem, é
+# criado do zero a partir da mesma fonte com --criar-painel.
+#
+# Com o painel, os pregões novos passam pelo gatilho pregão a pregão
+# (gatilho.AvaliadorDiario), que dá a cota do fundo, o regime e os pesos alvo
+# do próximo pregão. O avaliador fica gravado em ARQUIVO_GATILHO entre as
+# execuções, e o regime do último pregão vai para o estado.
+
+DIRETORIO_SERIES = os.path.join(dados.DIRETORIO_CACHE, 'series')
+ARQUIVO_ESTADO = os.path.join(DIRETORIO_SERIES, 'estado.json')
+ARQUIVO_GATILHO = os.path.join(DIRETORIO_SERIES, 'gatilho.pkl')
+
+CDI = 12
+IPCA = 433
+INICIO_SERIES = pd.Timestamp('2019-10-01')
+SPREAD_IPCA = 0.06
+
+# Colunas da comparação derivadas das séries do SGS; as demais vêm da fonte
+# de preços (níveis de fechamento).
+CALCULADAS = ['CDI', 'IPCA', 'IPCA+6%']
+
+
+class FonteSGS:
+
+    # Valores da série entre `inicio` e `fim` (inclusive), como publicados
+    def serie(self, codigo, inicio, fim):
+        import sgs
+
+        return sgs.time_serie(codigo, start=inicio.strftime('%d/%m/%Y'), end=fim.strftime('%d/%m/%Y'))
+
+
+class FonteArquivo:
+
+    # Séries em `<diretorio>/sgs_<codigo>.csv` (Data, valor) e preços de
+    # fechamento em `<diretorio>/precos.csv` (Data, uma coluna por ativo)
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+
+    def serie(self, codigo, inicio, fim):
+        serie = dados.carregar_tabela(os.path.join(self.diretorio, f'sgs_{codigo}.csv')).iloc[:, 0]
+        return serie.loc[(serie.index >= inicio) & (serie.index <= fim)]
+
+    def precos(self, ativos, inicio, fim):
+        precos = dados.carregar_tabela(os.path.join(self.diretorio, 'precos.csv'))
+        faltando = sorted(set(ativos) - set(precos.columns))
+        if faltando:
+            raise ValueError(f'Ativos sem preço na fonte: {faltando}')
+        return precos.loc[(precos.index >= inicio) & (precos.index <= fim), list(ativos)]
+
+
+def carregar_estado(caminho=ARQUIVO_ESTADO):
+    if not os.path.exists(caminho):
+        return {'marcas': {}}
+    with open(caminho, 'r') as json_file:
+        return json.load(json_file)
+
+
+def gravar_estado(estado, caminho=ARQUIVO_ESTADO):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    with open(temporario, 'w') as json_file:
+        json.dump(estado, json_file, indent=4)
+    os.replace(temporario, caminho)
+
+
+# Terminador de linha usado pelo arquivo, para anexar linhas no mesmo padrão
+def _terminador(caminho):
+    with open(caminho, 'rb') as arquivo:
+        return '\r\n' if arquivo.readline().endswith(b'\r\n') else '\n'
+
+
+def _anexar_csv(caminho, novas):
+    if not os.path.exists(caminho):
+        novas.to_csv(caminho, date_format='%Y-%m-%d')
+        return
+    terminador = _terminador(caminho)
+    with open(caminho, 'rb+') as arquivo:
+        arquivo.seek(0, os.SEEK_END)
+        if arquivo.tell() > 0:
+            arquivo.seek(-1, os.SEEK_END)
+            if arquivo.read(1) != b'\n':
+                arquivo.write(terminador.encode())
+    with open(caminho, 'a', newline='') as arquivo:
+        novas.to_csv(arquivo, header=False, date_format='%Y-%m-%d', lineterminator=terminador)
+
+
+def _caminho_serie(codigo):
+    return os.path.join(DIRETORIO_SERIES, f'{codigo}.csv')
+
+
+# Série do SGS em cache, completada com o que saiu desde a última observação
+def atualizar_serie(fonte, codigo, hoje, estado):
+    caminho = _caminho_serie(codigo)
+    serie = dados.carregar_tabela(caminho).iloc[:, 0] if os.path.exists(caminho) else pd.Series(dtype=np.float64)
+    marca = estado['marcas'].get(str(codigo))
+    if marca is not None and pd.Timestamp(marca) >= hoje:
+        return serie
+
+    inicio = serie.index[-1] + pd.Timedelta(days=1) if len(serie) else INICIO_SERIES
+    if inicio <= hoje:
+        novos = fonte.serie(codigo, inicio, hoje).dropna()
+        # Sem dados no intervalo o SGS devolve a última observação anterior
+        novos = novos.loc[novos.index >= inicio].sort_index()
+        if len(novos):
+            novos = pd.DataFrame({'valor': novos.to_numpy(dtype=np.float64)}, index=pd.DatetimeIndex(novos.index, name='Data'))
+            os.makedirs(DIRETORIO_SERIES, exist_ok=True)
+            _anexar_csv(caminho, novos)
+            serie = pd.concat([serie, novos['valor']])
+    estado['marcas'][str(codigo)] = hoje.strftime('%Y-%m-%d')
+    return serie
+
+
+# Retornos diários de CDI, IPCA e IPCA+6% nas `datas`. O CDI (série 12) é a
+# taxa do próprio dia; o IPCA (série 433) é mensal e entra pró-rata em
+# DIAS_UTEIS/12 pregões, usando o mês anterior ao do pregão (ou o último
+# divulgado, enquanto ele não sai).
+def retornos_calculados(datas, cdi, ipca):
+    datas = pd.DatetimeIndex(datas)
+    retorno_cdi = cdi.reindex(datas).to_numpy(dtype=np.float64) / 100
+
+    referencia = (datas.to_period('M') - 1).to_timestamp()
+    mensal = ipca.sort_index().reindex(referencia, method='ffill').to_numpy(dtype=np.float64) / 100
+    retorno_ipca = (1 + mensal) ** (12 / DIAS_UTEIS) - 1
+    retorno_ipca_spread = (1 + retorno_ipca) * (1 + SPREAD_IPCA) ** (1 / DIAS_UTEIS) - 1
+    return pd.DataFrame({'CDI': retorno_cdi, 'IPCA': retorno_ipca, 'IPCA+6%': retorno_ipca_spread}, index=datas)
+
+
+# Avaliador do gatilho no fechamento do último pregão do painel de ETFs. O
+# gravado só vale para o mesmo pregão, parâmetros e versões dos históricos
+# de pesos; senão (ou se o arquivo não abre) é refeito passando o histórico
+# inteiro do painel, uma única vez.
+def avaliador_gravado(precos, pesos_alta, pesos_baixa, parametros, versao_pesos, caminho=ARQUIVO_GATILHO):
+    chave = {'data': precos.index[-1].strftime('%Y-%m-%d'), 'parametros': parametros, 'pesos': versao_pesos}
+    try:
+        with open(caminho, 'rb') as arquivo:
+            gravado = pickle.load(arquivo)
+        if gravado['chave'] == chave:
+            return gravado['avaliador']
+    except (OSError, EOFError, KeyError, AttributeError, pickle.UnpicklingError):
+        pass
+    avaliador = gatilho.AvaliadorDiario(pesos_alta, pesos_baixa, parametros)
+    historico = precos.loc[precos.index >= pesos_alta.index[0]]
+    for data, linha in zip(historico.index, historico.to_numpy()):
+        avaliador.novo_dia(data, pd.Series(linha, index=historico.columns))
+    return avaliador
+
+
+def gravar_avaliador(avaliador, parametros, versao_pesos, caminho=ARQUIVO_GATILHO):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    chave = {'data': avaliador.data.strftime('%Y-%m-%d'), 'parametros': parametros, 'pesos': versao_pesos}
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    with open(temporario, 'wb') as arquivo:
+        pickle.dump({'chave': chave, 'avaliador': avaliador}, arquivo)
+    os.replace(temporario, caminho)
+
+
+def atualizar(fonte_series, fonte_precos, hoje=None, parametros=None,
+              caminho_comparacao=dados.ARQUIVO_COMPARACAO, caminho_precos=motor_backtest.ARQUIVO_PRECOS,
+              caminho_estado=ARQUIVO_ESTADO, caminho_gatilho=ARQUIVO_GATILHO):
+    hoje = pd.Timestamp.today().normalize() if hoje is None else pd.Timestamp(hoje)
+    if parametros is None:
+        parametros = motor_backtest.carregar_parametros()
+    estado = carregar_estado(caminho_estado)
+
+    cdi = atualizar_serie(fonte_series, CDI, hoje, estado)
+    ipca = atualizar_serie(fonte_series, IPCA, hoje, estado)
+
+    comparacao = dados.carregar_comparacao(caminho_comparacao)
+    ultima = comparacao.index[-1]
+    painel = os.path.exists(caminho_precos)
+    pesos_alta = motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_ALTA)
+    pesos_baixa = motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_BAIXA)
+    etfs = list(dict.fromkeys(list(pesos_alta.columns) + list(pesos_baixa.columns))) if painel else []
+
+    mercado = [c for c in comparacao.columns if c not in CALCULADAS and c != 'Fundo']
+    if not painel:
+        # Sem o painel dos ETFs a cota do fundo tem de vir pronta da fonte
+        mercado.append('Fundo')
+    fechamentos = fonte_precos.precos(mercado + etfs, ultima - pd.Timedelta(days=10), hoje).sort_index()
+
+    # Pregões novos com CDI já publicado
+    novas_datas = fechamentos.index[(fechamentos.index > ultima) & fechamentos.index.isin(cdi.index)]
+    if len(novas_datas) == 0:
+        gravar_estado(estado, caminho_estado)
+        return 0
+    base = fechamentos.loc[fechamentos.index <= ultima]
+    if len(base) == 0:
+        raise ValueError(f'Fonte de preços sem fechamento em {ultima:%Y-%m-%d} ou antes')
+
+    # Fator acumulado de cada coluna desde o último pregão gravado
+    fatores = fechamentos.loc[novas_datas, mercado].ffill() / base[mercado].ffill().iloc[-1]
+    calculadas = retornos_calculados(novas_datas, cdi, ipca).add(1).cumprod()
+    fatores = pd.concat([fatores, calculadas], axis=1)
+
+    if painel:
+        precos = motor_backtest.carregar_precos(caminho_precos)
+        if precos.index[-1] > ultima:
+            raise ValueError('O painel de preços dos ETFs está à frente da comparação')
+        novos_precos = fechamentos.loc[(fechamentos.index > precos.index[-1]) & (fechamentos.index <= novas_datas[-1]), etfs]
+        versao_pesos = [dados.versao(motor_backtest.ARQUIVO_PESOS_ALTA), dados.versao(motor_backtest.ARQUIVO_PESOS_BAIXA)]
+        avaliador = avaliador_gravado(precos, pesos_alta, pesos_baixa, parametros, versao_pesos, caminho_gatilho)
+        saidas = [avaliador.novo_dia(data, linha) for data, linha in novos_precos.iterrows()]
+        retorno_fundo = [saida['retorno_fundo'] for saida in saidas]
+        datas_cota = precos.index[-1:].append(novos_precos.index)
+        cota = pd.Series(np.cumprod(np.r_[1.0, 1 + np.array(retorno_fundo)]), index=datas_cota)
+        fatores['Fundo'] = cota.reindex(novas_datas).to_numpy() / cota.asof(ultima)
+        novos_precos.index.name = precos.index.name
+        _anexar_csv(caminho_precos, novos_precos)
+        if saidas:
+            gravar_avaliador(avaliador, parametros, versao_pesos, caminho_gatilho)
+            estado['regime'] = {
+                'data': saidas[-1]['data'].strftime('%Y-%m-%d'),
+                'valor': saidas[-1]['regime'],
+                'vol': saidas[-1]['vol'],
+                'mudancas': [saida['data'].strftime('%Y-%m-%d') for saida in saidas if saida['mudou']],
+                'pesos': {ativo: peso for ativo, peso in saidas[-1]['pesos'].items() if peso != 0},
+                'parametros': parametros
+            }
+
+    novas = fatores[list(comparacao.columns)] * comparacao.iloc[-1]
+    novas.index.name = comparacao.index.name
+    _anexar_csv(caminho_comparacao, novas)
+    gravar_estado(estado, caminho_estado)
+    return len(novas)
+
+
+# Cria o painel de preços dos ETFs das carteiras de alta e baixa vol, de
+# `inicio` (por padrão, o primeiro pregão dos históricos de pesos; antes
+# disso, para a janela da otimização dos pesos) até o último pregão da
+# comparação, e as ingestões seguintes o estendem junto com ela. Não
+# sobrescreve um painel existente.
+def criar_painel(fonte_precos, inicio=None, caminho_precos=motor_backtest.ARQUIVO_PRECOS,
+                 caminho_comparacao=dados.ARQUIVO_COMPARACAO):
+    if os.path.exists(caminho_precos):
+        raise ValueError(f'O painel de preços dos ETFs já existe: {caminho_precos}')
+    pesos_alta = motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_ALTA)
+    pesos_baixa = motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_BAIXA)
+    etfs = list(dict.fromkeys(list(pesos_alta.columns) + list(pesos_baixa.columns)))
+    primeiro = min(pesos_alta.index[0], pesos_baixa.index[0])
+    inicio = primeiro if inicio is None else min(pd.Timestamp(inicio), primeiro)
+    comparacao = dados.carregar_comparacao(caminho_comparacao)
+
+    precos = fonte_precos.precos(etfs, inicio, comparacao.index[-1]).sort_index()
+    # A cota tem de existir desde o primeiro pregão da comparação
+    limite = max(primeiro, comparacao.index[0])
+    if len(precos) == 0 or precos.index[0] > limite:
+        raise ValueError(f'Fonte de preços sem fechamento em {limite:%Y-%m-%d} ou antes')
+    precos.index = pd.DatetimeIndex(precos.index, name='Data')
+    temporario = f'{caminho_precos}.{os.getpid()}.tmp'
+    precos.to_csv(temporario, date_format='%Y-%m-%d')
+    os.replace(temporario, caminho_precos)
+    return len(precos)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Anexa os pregões novos aos painéis do app.')
+    parser.add_argument('diretorio', help='diretório com precos.csv (e sgs_<codigo>.csv, se --offline)')
+    parser.add_argument('--offline', action='store_true', help='lê as séries do SGS do diretório local')
+    parser.add_argument('--criar-painel', action='store_true',
+                        help=f'cria "{motor_backtest.ARQUIVO_PRECOS}" a partir de precos.csv e sai')
+    parser.add_argument('--inicio', help='primeiro pregão do painel criado (AAAA-MM-DD)')
+    argumentos = parser.parse_args()
+    local = FonteArquivo(argumentos.diretorio)
+    if argumentos.criar_painel:
+        print(criar_painel(local, argumentos.inicio))
+    else:
+        print(atualizar(local if argumentos.offline else FonteSGS(), local))
+        regime = carregar_estado().get('regime')
+        if regime is not None:
+            nome = 'alta' if regime['valor'] == motor_backtest.ALTA else 'baixa'
+            print(f'Regime em {regime["data"]}: {nome} vol (vol {regime["vol"]:.2%}); mudou em: {", ".join(regime["mudancas"]) or "-"}')
@@ -0,0 +1,153 @@
+import numpy as np
+
+# Janela móvel de retornos com média e covariância atualizadas por
+# acréscimo/remoção de posto um: cada novo dia soma r e r·rᵀ, e o dia que sai
+# da janela é subtraído. As somas são centradas num deslocamento fixo para
+# reduzir cancelamento numérico, e a cada `recalibrar` passos são refeitas do
+# zero a partir do buffer para eliminar a deriva acumulada.
+#
+# Retornos NaN (um ETF antes do primeiro preço) entram como zero nas somas, e
+# `completos()` diz quais ativos têm retorno em todos os dias da janela; os
+# demais ficam de fora da otimização.
+
+
+class JanelaCovariancia:
+
+    def __init__(self, n_ativos, tamanho, recalibrar=252):
+        self.n_ativos = n_ativos
+        self.tamanho = tamanho
+        self.recalibrar = recalibrar
+        self.buffer = np.zeros((tamanho, n_ativos))
+        self.log_buffer = np.zeros((tamanho, n_ativos))
+        self.validos_buffer = np.zeros((tamanho, n_ativos), dtype=bool)
+        self.validos = np.zeros(n_ativos, dtype=np.int64)
+        self.posicao = 0
+        self.contagem = 0
+        self.passos = 0
+        self.deslocamento = None
+        self.soma = np.zeros(n_ativos)
+        self.soma_prod = np.zeros((n_ativos, n_ativos))
+        self.soma_log = np.zeros(n_ativos)
+
+    @property
+    def cheia(self):
+        return self.contagem == self.tamanho
+
+    def adicionar(self, retorno):
+        retorno = np.asarray(retorno, dtype=np.float64)
+        valido = ~np.isnan(retorno)
+        retorno = np.nan_to_num(retorno)
+        if self.deslocamento is None:
+            self.deslocamento = retorno.copy()
+        centrado = retorno - self.deslocamento
+        log_retorno = np.log1p(retorno)
+
+        if self.cheia:
+            saindo = self.buffer[self.posicao] - self.deslocamento
+            self.soma -= saindo
+            self.soma_prod -= np.outer(saindo, saindo)
+            self.soma_log -= self.log_buffer[self.posicao]
+            self.validos -= self.validos_buffer[self.posicao]
+        else:
+            self.contagem += 1
+
+        self.soma += centrado
+        self.soma_prod += np.outer(centrado, centrado)
+        self.soma_log += log_retorno
+        self.buffer[self.posicao] = retorno
+        self.log_buffer[self.posicao] = log_retorno
+        self.validos += valido
+        self.validos_buffer[self.posicao] = valido
+        self.posicao = (self.posicao + 1) % self.tamanho
+
+        self.passos += 1
+        if self.recalibrar and self.passos % self.recalibrar == 0:
+            self._recalcular()
+
+    def _recalcular(self):
+        validos = self.buffer[:self.contagem]
+        self.deslocamento = validos.mean(axis=0)
+        centrado = validos - self.deslocamento
+        self.soma = centrado.sum(axis=0)
+        self.soma_prod = centrado.T @ centrado
+        self.soma_log = self.log_buffer[:self.contagem].sum(axis=0)
+
+    # Ativos com retorno em todos os dias da janela
+    def completos(self):
+        return self.validos == self.contagem
+
+    def media(self):
+        return self.deslocamento + self.soma / self.contagem
+
+    # Covariância amostral (ddof=1), como DataFrame.cov()
+    def covariancia(self):
+        n = self.contagem
+        media_centrada = self.soma / n
+        return (self.soma_prod - n * np.outer(media_centrada, media_centrada)) / (n - 1)
+
+    # Retorno médio geométrico anualizado, como expected_returns.mean_historical_return
+    def retorno_geometrico(self, periodos=252):
+        return np.expm1(self.soma_log / self.contagem * periodos)
+
+
+# Desvio-padrão móvel de várias séries ao mesmo tempo (uma coluna por
+# carteira), pela forma de Welford: com a janela cheia, o dia que entra e o
+# que sai atualizam média e soma dos quadrados dos desvios em O(1) por série.
+# Como na JanelaCovariancia, a cada `recalibrar` passos as somas são refeitas
+# a partir do buffer.
+class JanelaVolatilidade:
+
+    def __init__(self, n_series, tamanho, recalibrar=252):
+        self.n_series = n_series
+        self.tamanho = tamanho
+        self.recalibrar = recalibrar
+        self.buffer = np.zeros((tamanho, n_series))
+        self.posicao = 0
+        self.contagem = 0
+        self.passos = 0
+        self.media = np.zeros(n_series)
+        self.m2 = np.zeros(n_series)
+
+    @property
+    def cheia(self):
+        return self.contagem == self.tamanho
+
+    # Média e M2 depois de acrescentar `retorno`, sem alterar a janela
+    def _somas(self, retorno):
+        if self.cheia:
+            saindo = self.buffer[self.posicao]
+            media = self.media + (retorno - saindo) / self.tamanho
+            m2 = self.m2 + (retorno - saindo) * (retorno - media + saindo - self.media)
+        else:
+            delta = retorno - self.media
+            media = self.media + delta / (self.contagem + 1)
+            m2 = self.m2 + delta * (retorno - media)
+        return media, m2
+
+    def adicionar(self, retorno):
+        retorno = np.asarray(retorno, dtype=np.float64)
+        self.media, self.m2 = self._somas(retorno)
+        self.buffer[self.posicao] = retorno
+        self.posicao = (self.posicao + 1) % self.tamanho
+        self.contagem = min(self.contagem + 1, self.tamanho)
+
+        self.passos += 1
+        if self.recalibrar and self.passos % self.recalibrar == 0:
+            self._recalcular()
+
+    def _recalcular(self):
+        validos = self.buffer[:self.contagem]
+        self.media = validos.mean(axis=0)
+        self.m2 = ((validos - self.media) ** 2).sum(axis=0)
+
+    # Desvio-padrão amostral (ddof=1) da janela; NaN enquanto ela não enche.
+    # Com `retorno`, devolve o desvio que a janela teria após acrescentá-lo.
+    def desvio(self, retorno=None):
+        if retorno is None:
+            m2, contagem = self.m2, self.contagem
+        else:
+            m2 = self._somas(np.asarray(retorno, dtype=np.float64))[1]
+            contagem = min(self.contagem + 1, self.tamanho)
+        if contagem < self.tamanho:
+            return np.full(self.n_series, np.nan)
+        return np.sqrt(np.clip(m2, 0, None) / (self.tamanho - 1))
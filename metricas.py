@@ -0,0 +1,286 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Instrumentação das páginas e dos caches do app.
+#
+# Registro em memória, por processo (compartilhado entre as sessões do
+# Streamlit, como os caches de dados e graficos):
+#   - trechos: duração de cada etapa, com contagem, soma e p50/p95 sobre as
+#     últimas AMOSTRAS_TRECHO medições
+#   - contadores: bytes lidos, acertos e faltas de cada cache etc.
+# O registro é exposto na página oculta de métricas (moria.py?admin=<MORIA_ADMIN_TOKEN>), em
+# texto no formato do Prometheus (`prometheus()`, servido em /metrics por
+# `servir()` quando MORIA_METRICAS_PORTA está definida; só em 127.0.0.1, a
+# menos que MORIA_METRICAS_ENDERECO diga outro endereço) e como linhas de log
+# no logger 'moria.metricas' (cada trecho em DEBUG).
+#
+# O perfilador por amostragem é opcional (MORIA_PERFIL=1 ou a página de
+# métricas): durante a página, uma thread coleta a pilha da thread da sessão
+# a cada INTERVALO_PERFIL segundos; se a página passar de LIMITE_LENTO, as
+# pilhas vão para DIRETORIO_PERFIS no formato "colapsado" (uma pilha por
+# linha, quadros separados por ';', seguida da contagem), que o flamegraph.pl
+# e o speedscope leem direto.
+#
+# Só usa a biblioteca padrão: é importado por todas as páginas, inclusive as
+# que não carregam o pandas.
+
+AMOSTRAS_TRECHO = 1024
+PREFIXO = 'moria'
+
+DIRETORIO_PERFIS = 'perfis'
+INTERVALO_PERFIL = 0.005
+LIMITE_LENTO = float(os.environ.get('MORIA_PERFIL_LIMITE', '1.0'))
+MAXIMO_PERFIS = 20
+
+# Os nomes dos trechos e os contadores mostram o uso do app; para expor o
+# /metrics para fora da máquina, defina MORIA_METRICAS_ENDERECO
+ENDERECO_PADRAO = os.environ.get('MORIA_METRICAS_ENDERECO', '127.0.0.1')
+
+logger = logging.getLogger('moria.metricas')
+
+_trava = threading.Lock()
+_duracoes = defaultdict(lambda: deque(maxlen=AMOSTRAS_TRECHO))
+_contagens = defaultdict(int)
+_somas = defaultdict(float)
+_contadores = defaultdict(float)
+_perfis = deque(maxlen=MAXIMO_PERFIS)
+_perfil_ativo = os.environ.get('MORIA_PERFIL') == '1'
+_servidor = None
+_servidor_falhou = False
+
+
+def registrar(nome, segundos):
+    with _trava:
+        _duracoes[nome].append(segundos)
+        _contagens[nome] += 1
+        _somas[nome] += segundos
+    logger.debug('trecho=%s ms=%.2f', nome, segundos * 1000)
+
+
+@contextmanager
+def trecho(nome):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(nome, time.perf_counter() - inicio)
+
+
+# Etapas sequenciais de uma página: cada `etapa` fecha a anterior e abre a
+# próxima, então o tempo dos widgets entre os cálculos também é contado.
+class Cronometro:
+
+    def __init__(self, prefixo):
+        self.prefixo = prefixo
+        self.nome = None
+        self.inicio = None
+
+    def etapa(self, nome):
+        agora = time.perf_counter()
+        if self.nome is not None:
+            registrar(f'{self.prefixo}.{self.nome}', agora - self.inicio)
+        self.nome = nome
+        self.inicio = agora
+
+    def fim(self):
+        self.etapa(None)
+
+
+def contar(nome, valor=1):
+    with _trava:
+        _contadores[nome] += valor
+
+
+def cache(nome, acerto):
+    contar(f'cache_{nome}_{"acertos" if acerto else "faltas"}')
+
+
+def _percentil(ordenados, q):
+    if not ordenados:
+        return float('nan')
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+
+
+# Fotografia do registro: {'trechos': {nome: {...}}, 'contadores': {...},
+# 'caches': {nome: {'acertos', 'faltas', 'taxa_acerto'}}}
+def resumo():
+    with _trava:
+        duracoes = {nome: sorted(valores) for nome, valores in _duracoes.items()}
+        contagens = dict(_contagens)
+        somas = dict(_somas)
+        contadores = dict(_contadores)
+
+    trechos = {nome: {
+        'contagem': contagens[nome],
+        'soma': somas[nome],
+        'p50': _percentil(valores, 0.50),
+        'p95': _percentil(valores, 0.95),
+        'maximo': valores[-1]
+    } for nome, valores in sorted(duracoes.items())}
+
+    caches = {}
+    for nome, valor in contadores.items():
+        if nome.startswith('cache_'):
+            cache_nome, _, tipo = nome[len('cache_'):].rpartition('_')
+            caches.setdefault(cache_nome, {'acertos': 0, 'faltas': 0})[tipo] = valor
+    for valores in caches.values():
+        total = valores['acertos'] + valores['faltas']
+        valores['taxa_acerto'] = valores['acertos'] / total if total else float('nan')
+    return {'trechos': trechos, 'contadores': contadores, 'caches': dict(sorted(caches.items()))}
+
+
+def _rotulo(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Texto no formato de exposição do Prometheus
+def prometheus():
+    fotografia = resumo()
+    linhas = [f'# TYPE {PREFIXO}_trecho_segundos summary']
+    for nome, valores in fotografia['trechos'].items():
+        rotulo = f'trecho="{_rotulo(nome)}"'
+        linhas.append(f'{PREFIXO}_trecho_segundos{{{rotulo},quantile="0.5"}} {valores["p50"]:.6f}')
+        linhas.append(f'{PREFIXO}_trecho_segundos{{{rotulo},quantile="0.95"}} {valores["p95"]:.6f}')
+        linhas.append(f'{PREFIXO}_trecho_segundos_sum{{{rotulo}}} {valores["soma"]:.6f}')
+        linhas.append(f'{PREFIXO}_trecho_segundos_count{{{rotulo}}} {valores["contagem"]}')
+    for nome, valor in sorted(fotografia['contadores'].items()):
+        linhas.append(f'# TYPE {PREFIXO}_{nome}_total counter')
+        linhas.append(f'{PREFIXO}_{nome}_total {valor:g}')
+    return '\n'.join(linhas) + '\n'
+
+
+# Uma linha chave=valor por trecho e por contador, para mandar ao log
+def linhas_log():
+    fotografia = resumo()
+    linhas = [f'trecho={nome} contagem={v["contagem"]} p50_ms={v["p50"] * 1000:.2f} p95_ms={v["p95"] * 1000:.2f}'
+              for nome, v in fotografia['trechos'].items()]
+    linhas += [f'contador={nome} valor={valor:g}' for nome, valor in sorted(fotografia['contadores'].items())]
+    return linhas
+
+
+def logar(nivel=logging.INFO):
+    for linha in linhas_log():
+        logger.log(nivel, linha)
+
+
+def limpar():
+    with _trava:
+        _duracoes.clear()
+        _contagens.clear()
+        _somas.clear()
+        _contadores.clear()
+
+
+# Servidor HTTP de /metrics numa thread, um por processo. Se a porta não
+# puder ser aberta (outro processo do app já a usa, por exemplo), o erro vai
+# para o log uma vez e as chamadas seguintes devolvem None sem tentar de novo.
+def servir(porta, endereco=ENDERECO_PADRAO):
+    global _servidor, _servidor_falhou
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Tratador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            corpo = prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, formato, *argumentos):
+            pass
+
+    with _trava:
+        if _servidor is None and not _servidor_falhou:
+            try:
+                _servidor = ThreadingHTTPServer((endereco, porta), Tratador)
+            except OSError as erro:
+                _servidor_falhou = True
+                logger.error('servidor de métricas não iniciado em %s:%s: %s', endereco, porta, erro)
+                return None
+            threading.Thread(target=_servidor.serve_forever, name='moria-metricas', daemon=True).start()
+    return _servidor
+
+
+def perfil_ativo():
+    return _perfil_ativo
+
+
+def ativar_perfil(ativo=True):
+    global _perfil_ativo
+    _perfil_ativo = ativo
+
+
+def perfis():
+    with _trava:
+        return list(_perfis)
+
+
+def _pilha(quadro):
+    nomes = []
+    while quadro is not None:
+        codigo = quadro.f_code
+        nomes.append(f'{os.path.basename(codigo.co_filename)}:{codigo.co_name}')
+        quadro = quadro.f_back
+    return ';'.join(reversed(nomes))
+
+
+class Amostrador:
+
+    def __init__(self, thread_id, intervalo=INTERVALO_PERFIL):
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.pilhas = defaultdict(int)
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._amostrar, name='moria-perfil', daemon=True)
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            quadro = sys._current_frames().get(self.thread_id)
+            if quadro is not None:
+                self.pilhas[_pilha(quadro)] += 1
+
+    def iniciar(self):
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def colapsado(self):
+        return ''.join(f'{pilha} {n}\n' for pilha, n in sorted(self.pilhas.items()))
+
+
+# Perfila o bloco quando o perfilador está ligado; se o bloco passar de
+# `limite` segundos, grava as pilhas e guarda o caminho em `perfis()`
+@contextmanager
+def perfilar(nome, limite=None):
+    if not _perfil_ativo:
+        yield
+        return
+    limite = LIMITE_LENTO if limite is None else limite
+    amostrador = Amostrador(threading.get_ident())
+    amostrador.iniciar()
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        amostrador.parar()
+        duracao = time.perf_counter() - inicio
+        if duracao >= limite and amostrador.pilhas:
+            os.makedirs(DIRETORIO_PERFIS, exist_ok=True)
+            seguro = ''.join(c if c.isalnum() else '_' for c in nome)
+            caminho = os.path.join(DIRETORIO_PERFIS, f'{seguro}-{time.strftime("%Y%m%d-%H%M%S")}-{int(duracao * 1000)}ms.txt')
+            with open(caminho, 'w', encoding='utf-8') as arquivo:
+                arquivo.write(amostrador.colapsado())
+            with _trava:
+                _perfis.append({'nome': nome, 'duracao': duracao, 'caminho': caminho})
+            logger.info('perfil=%s ms=%.1f arquivo=%s', nome, duracao * 1000, caminho)
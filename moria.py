@@ -1,37 +1,15 @@
+import hmac
+import os
 import streamlit as st
-import pandas as pd
-import numpy as np
-import seaborn as sns
-import plotly.graph_objects as go
-import plotly.express as px
-from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from matplotlib.ticker import PercentFormatter  # Importe diretamente a classe PercentFormatter
 import warnings
-import sgs
-import json
-from scipy.stats import norm
-import streamlit as st
-import pandas as pd
-import numpy as np
-import seaborn as sns
-import plotly.graph_objects as go
-import plotly.express as px
-from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from matplotlib.ticker import PercentFormatter  # Importe diretamente a classe PercentFormatter
-import warnings
-import sgs
-import json
-from scipy.stats import norm
+
+import carteiras
+import metricas
 
 warnings.filterwarnings('ignore')
 
-import pypfopt as pf
-from pypfopt import risk_models
-from pypfopt import expected_returns
-from pypfopt.efficient_frontier import EfficientFrontier
-import cvxpy
+# Os módulos pesados (pandas, plotly, matplotlib, seaborn, scipy) são
+# importados dentro de cada página, para que Home e Equipe carreguem sem eles.
 
 def home():
     st.title('Home')
@@ -233,35 +211,46 @@ def home():
 #     # Mostrando o gráfico
 #     st.plotly_chart(fig)
 
-def backtest_etf():
+def backtest_etf(carteira):
+    import pandas as pd
+    import plotly.graph_objects as go
+    import plotly.express as px
+
+    import atribuicao_risco
+    import graficos
+
     st.title('Resultados Backtest com Indices')
     st.subheader('Os índices usados nesse becktest servem de base para uma gestão')
     st.header('Rentabilidade do Fundo vs CDI')
     
-    comparacao = pd.read_csv('comparacao ETFs.csv')
-    comparacao.index = comparacao.Data
-    comparacao.drop(columns='Data', inplace=True)
+    # Tempo de cada etapa da página, para a página de métricas
+    cronometro = metricas.Cronometro('backtest_etf')
+    cronometro.etapa('dados')
+    # Com o painel de preços dos ETFs presente, a cota é recalculada pelo motor
+    # com os pesos e parâmetros da carteira
+    comparacao = carteiras.comparacao(carteira)
+    if not os.path.exists(carteiras.arquivos(carteira)['precos']):
+        st.caption('Cota do fundo registrada na comparação: o motor só a recalcula com o painel de preços dos ETFs '
+                   '(python ingestao.py <diretorio com precos.csv> --criar-painel).')
     lsita_datas = list(comparacao.index)
     # st.write(comparacao)
 
     ############################################################################################################################################################################################
     
-    data = st.select_slider('Selecione data inicial e final',options = lsita_datas, value=(lsita_datas[0],lsita_datas[-1]))
+    data = st.select_slider('Selecione data inicial e final',options = lsita_datas, value=(lsita_datas[0],lsita_datas[-1]), format_func = lambda d: d.strftime('%Y-%m-%d'))
     st.subheader('Rentabilidade Acumulada no perído')
-    comparacao_datas = comparacao.loc[data[0]:data[1]]
-    comparacao_datas = comparacao_datas/comparacao_datas.iloc[0]
-
     
-    taxa_adm =0.75
+    taxa_adm = carteiras.taxa_adm(carteira)
 
- 
-    custo = ((1+(taxa_adm/100))**(1/252))
-       
-    comparacao_datas['Fundo'] = ((1+comparacao_datas['Fundo'].pct_change())/custo).fillna(1).cumprod()
-    # comparacao_datas.drop(columns= ['Fundo'], inplace=True)
+    cronometro.etapa('indice')
+    # Índice com a taxa de adm já descontada; cada janela sai por diferença de prefixos
+    indice = carteiras.indice(carteira)
+    # Identifica a janela nas chaves do cache de figuras
+    janela = dict(indice=indice.versao, inicio=str(data[0]), fim=str(data[1]))
     
-    retorno_acumulado = comparacao_datas['Fundo'].iloc[-1]
-    retorno_acumulado_cdi = comparacao_datas['CDI'].iloc[-1]
+    retornos_janela = indice.retorno_acumulado(data[0], data[1], ['Fundo', 'CDI'])
+    retorno_acumulado = retornos_janela['Fundo']
+    retorno_acumulado_cdi = retornos_janela['CDI']
 
 
     st.write(f'Retorno Acumulado do Fundo **{round(retorno_acumulado*100,2)}%**')
@@ -276,15 +265,25 @@ def backtest_etf():
     lista_bench = multselecao
     lista_bench.append('Fundo')
     # st.write(benchmarks)
+    cronometro.etapa('curva')
     
     if multselecao == []:
-        figx = px.line(comparacao_datas['Fundo'])
+        figx = graficos.plotly(graficos.chave('linha', colunas=('Fundo',), **janela),
+                               lambda: px.line(indice.curva(data[0], data[1], ['Fundo'])['Fundo']))
         st.plotly_chart(figx)
     else:
                
-        figx = px.line(comparacao_datas[lista_bench])
+        figx = graficos.plotly(graficos.chave('linha', colunas=tuple(lista_bench), **janela),
+                               lambda: px.line(indice.curva(data[0], data[1], lista_bench)))
         st.plotly_chart(figx)
         
+    # Queda de cada série desde o último topo, na janela
+    cronometro.etapa('drawdown')
+    figx = graficos.plotly(graficos.chave('drawdown', colunas=tuple(lista_bench), **janela),
+                           lambda: px.line(indice.drawdown(data[0], data[1], lista_bench),
+                                           title='Drawdown').update_layout(yaxis_tickformat='.2%'))
+    st.plotly_chart(figx)
+
     # fig = go.Figure()
     # fig.add_trace(go.Scatter(name = 'CDI', x= comparacao_datas.index,y=comparacao_datas['CDI'], line= dict(color = 'rgb(42,255,57)')))
     # fig.add_trace(go.Scatter(name = 'Fundo', x= comparacao_datas.index,y=comparacao_datas['Fundo'], line= dict(color = 'rgb(58,25,223)')))
@@ -294,108 +293,83 @@ def backtest_etf():
     st.markdown('---')
     st.subheader('Comparação da rentabilidade do fundo contra a o CDI, para cada período')
     
-    comparacao_datas.index = pd.to_datetime(comparacao_datas.index)
-    comparacao_datas = comparacao_datas.fillna(method='ffill')
-    comparacao_datas['Ano'] = comparacao_datas.index.year
-
-  
-
-    # Função para calcular a razão entre o último e o primeiro valor de um grupo
-    def calcular_razao(group, ativo):
-        ultimo_valor = group.iloc[-1][ativo]
-        primeiro_valor = group.iloc[0][ativo]
-        return ultimo_valor / primeiro_valor
-
-    # Calcular a razão para cada ano
-    razoes_por_pl = comparacao_datas.groupby('Ano').apply(calcular_razao, 'Fundo')
-    razoes_por_cdi = comparacao_datas.groupby('Ano').apply(calcular_razao, 'CDI')
-    # razoes_por_plgatilho = comparacao_datas.groupby('Ano').apply(calcular_razao, 'PL Gatilhado')
-
-    razoes_por_cdi = round((razoes_por_cdi-1),4)
-    razoes_por_pl = round((razoes_por_pl-1),4)
-    # razoes_por_plgatilho = round((razoes_por_plgatilho-1),2)
-    # Criar um gráfico de barras lado a lado
-    fig2 = go.Figure()
-
-    fig2.add_trace(go.Bar(x=razoes_por_pl.index, y=razoes_por_pl,text = razoes_por_pl,textposition='auto', name='Fundo', marker_color = 'rgb(58,25,233)'))
-    fig2.add_trace(go.Bar(x=razoes_por_pl.index, y=razoes_por_cdi,text = razoes_por_cdi,textposition='auto', name='CDI', marker_color = 'rgb(42,255,57)'))
-    # fig.add_trace(go.Bar(x=razoes_por_pl.index, y=razoes_por_plgatilho,text = razoes_por_plgatilho,textposition='auto', name='PL Pos Gatilho'))
-
-    # Atualizar o layout do gráfico
-    fig2.update_layout(yaxis_tickformat = '2%f')
-    fig2.update_traces(texttemplate = '%{text:.2%}',textposition = 'auto')
-
-    fig2.update_layout(height = 600,width = 600,barmode='group', xaxis_title='Ano', yaxis_title='Razão (Último/Primeiro Valor)',
-                    title='Comparação Retorno YoY ')
+    cronometro.etapa('anual')
+    colunas_anuais = st.multiselect('Séries no comparativo anual', benchmarks, default=['Fundo', 'CDI'])
+    cores_anuais = {'Fundo': 'rgb(58,25,233)', 'CDI': 'rgb(42,255,57)'}
+    excesso_cdi = st.checkbox('Retorno em excesso ao CDI')
+
+    def grafico_anual():
+        # Razão entre o último e o primeiro valor de cada ano, para todas as colunas de uma vez
+        if excesso_cdi:
+            razoes_anuais = round(indice.excesso_anual(data[0], data[1], 'CDI'), 4)
+        else:
+            razoes_anuais = round(indice.retornos_anuais(data[0], data[1]), 4)
+        # Criar um gráfico de barras lado a lado
+        fig2 = go.Figure()
+
+        for coluna in colunas_anuais:
+            fig2.add_trace(go.Bar(x=razoes_anuais.index, y=razoes_anuais[coluna],text = razoes_anuais[coluna],textposition='auto', name=coluna, marker_color = cores_anuais.get(coluna)))
+
+        # Atualizar o layout do gráfico
+        fig2.update_layout(yaxis_tickformat = '2%f')
+        fig2.update_traces(texttemplate = '%{text:.2%}',textposition = 'auto')
+
+        fig2.update_layout(height = 600,width = 600,barmode='group', xaxis_title='Ano', yaxis_title='Razão (Último/Primeiro Valor)',
+                        title='Comparação Retorno YoY ')
+        return fig2
+
+    fig2 = graficos.plotly(graficos.chave('anual', colunas=tuple(colunas_anuais), excesso=excesso_cdi, **janela),
+                           grafico_anual)
     st.plotly_chart(fig2)
 
     st.markdown('---')
     st.subheader('Sensibilidade de performance do Fundo vs CDI')
 
-    sensibilidade_cdi = comparacao_datas[['CDI', 'Fundo']]
-
-    sensibilidade_cdi = sensibilidade_cdi.groupby([sensibilidade_cdi.index.year.rename('Ano'), sensibilidade_cdi.index.month.rename('Mes')]).mean()#.pct_change().dropna()
-
-    sensibilidade_cdi = sensibilidade_cdi.pct_change().dropna()
-
-    sensibilidade_cdi['Diff'] =( (1+sensibilidade_cdi['Fundo']) / (1+sensibilidade_cdi['CDI']))-1
+    cronometro.etapa('heatmap')
+    serie_mensal, bench_mensal = st.columns(2)
+    coluna_heatmap = serie_mensal.selectbox('Série', benchmarks, index=benchmarks.index('Fundo'))
+    benchmark_heatmap = bench_mensal.selectbox('Benchmark', benchmarks, index=benchmarks.index('CDI'))
 
-    cdi_pl = pd.DataFrame(sensibilidade_cdi['Diff'])
-    cdi_pl =  pd.pivot_table(cdi_pl, index= 'Mes', columns= 'Ano',values= 'Diff').fillna(0)
-    cdi_pl.index = ['JAN', 'FEV', 'MAR', 'ABR', 'MAI', 'JUN', 'JUL', 'AGO', 'SET', 'OUT', 'NOV', 'DEZ']
+    # Variação das médias mensais da série sobre a do benchmark, tabela Mes x Ano
+    cdi_pl = indice.excesso_mensal(data[0], data[1], coluna_heatmap, benchmark_heatmap)
 
-    #criacao do heatmap
-    fig3, ax = plt.subplots(figsize = (12,10)) #cria 2 figuras
-    cmap = sns.color_palette('RdYlGn', 50) # define as cores 
-    sns.heatmap(cdi_pl, cmap = cmap, annot = True, fmt = '.2%', center = 0, vmax = 0.007, vmin = -0.007, cbar = False, linewidths=1, xticklabels = True, yticklabels = True, ax = ax)
-    # ax.set_title('CDI vs PL do Fundo', fontsize = 18)
-    ax.set_yticklabels(ax.get_yticklabels(), rotation = 0, verticalalignment = 'center', fontsize = '12')
-    ax.set_xticklabels(ax.get_xticklabels(), fontsize = '12')
-    ax.xaxis.tick_top() #colocar o x axis em cima
-    plt.ylabel('')
-    st.pyplot(fig3)
+    #criacao do heatmap, renderizado só quando a tabela muda
+    st.image(graficos.heatmap_png(cdi_pl, vmin = -0.007, vmax = 0.007), width = 'stretch')
 
     st.markdown('---')
     st.header('Análise da Volatilidade')
     st.subheader('Distribuição da Volatilidade do Fundo')
     st.write('A volatilidade é calculada como desvio-padrão dos retornos diários da cota do fundo')
 
-    df_volatilidade = (comparacao_datas['Fundo'].pct_change().rolling(21).std()*np.sqrt(252))
+    cronometro.etapa('histograma')
+    df_volatilidade = indice.vol_movel(data[0], data[1], ['Fundo'])['Fundo']
     # st.write(df_volatilidade)
     
-    # Plotar o histograma
-    
-
-    fig4 = plt.figure(figsize=(10, 6))
-    sns.set_style("whitegrid")
-    sns.histplot(df_volatilidade, kde=True, color='#0B58DC', bins=80) 
-
-    # Formatando o eixo X em percentual
-    plt.gca().xaxis.set_major_formatter(PercentFormatter(1, decimals=0))
-
-    plt.title('Distribuição de Dados')
-    plt.xlabel('Valores (em percentual)')
-    plt.ylabel('Frequência')
-
-    st.pyplot(fig4)
+    # Plotar o histograma (com KDE), renderizado só quando a série muda
+    st.image(graficos.histograma_png(df_volatilidade, bins=80), width = 'stretch')
 
     st.markdown('---')
     st.subheader('Volatilidade ao longo do tempo')
     
+    cronometro.etapa('vol')
     df_volatilidade = pd.DataFrame(df_volatilidade)
     df_volatilidade.columns = ['Volatilidade do Fundo']
     df_volatilidade['Vol Média'] = df_volatilidade['Volatilidade do Fundo'].mean()
     df_volatilidade['Vol Min'] = 0.05
     df_volatilidade['Vol Target'] = 0.1
     df_volatilidade['Vol Max'] = 0.12
-    df_volatilidade['Volatilidade do Fundo'] = df_volatilidade['Volatilidade do Fundo'].fillna(method='bfill')
+    df_volatilidade['Volatilidade do Fundo'] = df_volatilidade['Volatilidade do Fundo'].bfill()
 
     # Criando o gráfico de linha com Plotly Express
-    fig = px.line(df_volatilidade[['Volatilidade do Fundo', 'Vol Média', 'Vol Target', 'Vol Min', 'Vol Max']],
-                title='Volatilidade do Fundo<br><sup>Volatilidade Móvel 21, anualizada</sup>')
+    def grafico_vol():
+        fig = px.line(df_volatilidade[['Volatilidade do Fundo', 'Vol Média', 'Vol Target', 'Vol Min', 'Vol Max']],
+                    title='Volatilidade do Fundo<br><sup>Volatilidade Móvel 21, anualizada</sup>')
+
+        # Formatando o eixo Y como percentual
+        fig.update_layout(yaxis_tickformat=".2%")
+        return fig
 
-    # Formatando o eixo Y como percentual
-    fig.update_layout(yaxis_tickformat=".2%")
+    fig = graficos.plotly(graficos.chave('vol', **janela), grafico_vol)
     
 
     # Adicionando uma referência ao percentual no eixo Y (opcional)
@@ -403,69 +377,63 @@ def backtest_etf():
 
     # Mostrando o gráfico
     st.plotly_chart(fig)
-    import json
 
-    st.write(retorno_acumulado)
+    # Sharpe móvel do fundo sobre o CDI, na mesma janela de 21 dias da vol
+    cronometro.etapa('sharpe')
+    fig_sharpe = graficos.plotly(graficos.chave('sharpe', **janela),
+                                 lambda: px.line(indice.sharpe_movel(data[0], data[1], 'CDI', ['Fundo']),
+                                                 title='Sharpe do Fundo sobre o CDI<br><sup>Janela móvel de 21 dias, anualizado</sup>'))
+    st.plotly_chart(fig_sharpe)
+
+    # Tempo com a vol abaixo de 10% e na banda de 5% a 12% na janela
+    # escolhida, pelo bootstrap em blocos dos retornos do fundo
+    cronometro.etapa('banda')
+    resumo_janela = carteiras.resumo(carteira, data[0], data[1])
+    st.write(f'Na janela, a volatilidade fica abaixo de 10% durante {resumo_janela["vol_dist"]}% do tempo '
+             f'(intervalo de 95%: {resumo_janela["vol_dist_intervalo"][0]}% a {resumo_janela["vol_dist_intervalo"][1]}%) '
+             f'e entre 5% e 12% durante {resumo_janela["vol_na_banda"]}% do tempo '
+             f'(intervalo de 95%: {resumo_janela["vol_na_banda_intervalo"][0]}% a {resumo_janela["vol_na_banda_intervalo"][1]}%).')
+
+    # Contribuição de cada ETF para a vol da carteira alvo (precisa do painel
+    # de preços dos ETFs)
+    cronometro.etapa('atribuicao')
+    atribuicao = carteiras.atribuicao(carteira)
+    if atribuicao is not None:
+        st.subheader('Atribuição de Risco')
+        def grafico_atribuicao():
+            componente = atribuicao['componente'].loc[data[0]:data[1]]
+            componente = componente.loc[:, (componente.abs() > 0).any()]
+            fig_risco = px.area(componente, title='Contribuição de cada ativo para a vol da carteira<br><sup>Janela móvel de 21 dias, anualizada</sup>')
+            fig_risco.update_layout(yaxis_tickformat=".2%")
+            return fig_risco
+
+        st.plotly_chart(graficos.plotly(graficos.chave('atribuicao', **janela), grafico_atribuicao))
+        st.write(atribuicao_risco.na_data(atribuicao, data[1]).sort_values('componente', ascending=False))
 
-    
-    vol_desv_pad = df_volatilidade['Volatilidade do Fundo'].std()
-    vol_media = df_volatilidade['Volatilidade do Fundo'].mean()
-    
-    vol_max = 0.12
-    vol_min = 0.05
+    st.write(retorno_acumulado)
+    cronometro.fim()
 
-    z_score_max = ((vol_max - vol_media) / vol_desv_pad)
-    z_score_min = ((vol_min - vol_media) / vol_desv_pad)
 
-    vol_dist = norm.cdf(z_score_max-z_score_min)
-    
-    with open('analise_quali.json', 'r') as json_file:
-        
-        analise_quali_lido = json.load(json_file)
-    
-    analise_quali = {
-    'retorno acumulado' : round(retorno_acumulado*100,2),
-    'vol_dist': round(vol_dist * 100, 2),
-    'vol_media': round(vol_media * 100, 2),
-    
-    'fundos': analise_quali_lido['fundos'],
-    'data_inicial' : comparacao.index[0],
-    'data_final' : comparacao.index[-1],
-    'Parametros': {
-        'limite_dias': 13,
-        'limite_vol_alta': 0.12,
-        'limite_vol_baixa': 0.07,
-        'vol_gatilho_subir': 0.14,
-        'vol_gatilho_descer': 0.07,
-        'concentracao_gatilho_subir': 0.4,
-        'concentracao_gatilho_descer': 0.4,
-        'vol_semente': 0.1,
-        'concentracao_semente': 0.3
-    }
-}
-
-    # Convertendo para JSON
-    json_content = json.dumps(analise_quali, indent=4)
-    
-    # Exibindo o JSON ou gravando em um arquivo se preferir
-    # print(json_content)
-    # ou
-    with open('analise_quali.json', 'w') as json_file:
-        json_file.write(json_content)
-    return 'analise_quali.json'
 
+def analise_quali(carteira):
+    import plotly.express as px
 
+    import dados
+    import pesos_esparsos
 
-def analise_quali():
     st.title('Informações Qualitativas Relativas ao Backtest')
 # Ler o arquivo JSON
-    with open('analise_quali.json', 'r') as json_file:
-        analise_quali_lido = json.load(json_file)
+    cronometro = metricas.Cronometro('analise_quali')
+    cronometro.etapa('resumo')
+    arquivos = carteiras.arquivos(carteira)
+    analise_quali_lido = dados.carregar_quali(arquivos['quali'])
+    # Resumo do período completo, já calculado pelo repositório de resultados
+    resumo = carteiras.resumo(carteira)
 
     # st.json(analise_quali.json)
 
     st.markdown('---')
-    st.write(f'O backtest foi aplicado no período entre ***{analise_quali_lido["data_inicial"]}*** e ***{analise_quali_lido["data_final"]}*** ')
+    st.write(f'O backtest foi aplicado no período entre ***{resumo["data_inicial"]}*** e ***{resumo["data_final"]}*** ')
     st.markdown('---')
 
     st.header('Fundos Usados no Backtest')
@@ -476,24 +444,41 @@ def analise_quali():
         st.write(f"- {fundo}")
     st.markdown('---')
     st.header('Resultados do backtest:')
-    st.write(f'A cota do fundo já descontado a taxa de administração obteve retorno acumulado de {analise_quali_lido["retorno acumulado"]}%. líquido de taxa de administração')
+    st.write(f'A cota do fundo já descontado a taxa de administração obteve retorno acumulado de {resumo["retorno acumulado"]}%. líquido de taxa de administração')
     # st.write(f'O gatliho de volatilidade foi acionado {analise_quali_lido["contador"]} vezes.')
-    st.write(f'A volalitidade média da cota do fundo foi de {analise_quali_lido["vol_media"]}% durante todo o período.')
-    st.write(f'A voltailidade permanece menor que 10% durante {analise_quali_lido["vol_dist"]}% do tempo')
+    st.write(f'A volalitidade média da cota do fundo foi de {resumo["vol_media"]}% durante todo o período.')
+    st.write(f'A voltailidade permanece menor que 10% durante {resumo["vol_dist"]}% do tempo '
+             f'(intervalo de 95%: {resumo["vol_dist_intervalo"][0]}% a {resumo["vol_dist_intervalo"][1]}%)')
+    st.write(f'E fica entre 5% e 12% durante {resumo["vol_na_banda"]}% do tempo '
+             f'(intervalo de 95%: {resumo["vol_na_banda_intervalo"][0]}% a {resumo["vol_na_banda_intervalo"][1]}%)')
     st.write(f'Por fim, os parametros da simulação foram:')
-    for parametro in analise_quali_lido["Parametros"]:
-        st.write(f'-{parametro}:  {analise_quali_lido["Parametros"][parametro]}')
+    for parametro in resumo["Parametros"]:
+        st.write(f'-{parametro}:  {resumo["Parametros"][parametro]}')
 
     st.markdown('---')
     st.header ('Histórico dos Pesos')
     st.subheader('Média dos Pesos Aplicados Ano a Ano')
-    hist_pesos = pd.read_csv('Historico dos pesos.csv')
-    hist_pesos.index = hist_pesos.Ano
-    hist_pesos.drop(columns='Ano', inplace=True)
+    cronometro.etapa('pesos')
+    # Pesos aplicados no fundo: recalculados dia a dia pelo regime do motor
+    # quando há painel de preços, senão as médias anuais registradas. As
+    # carteiras de alta e baixa vol vêm direto dos históricos usados pelo motor.
+    historico_fundo = carteiras.historico_fundo(carteira)
+    diario = historico_fundo is not None
+    historicos = {'Fundo': historico_fundo if diario else pesos_esparsos.historico_aplicado(),
+                  'Alta vol': pesos_esparsos.carregar_historico(arquivos['pesos_alta']),
+                  'Baixa vol': pesos_esparsos.carregar_historico(arquivos['pesos_baixa'])}
+    escolhida = st.radio('Carteira', list(historicos), horizontal=True)
+    historico = historicos[escolhida]
+    hist_pesos = historico.media_periodo('anual')
+    hist_pesos = hist_pesos.loc[:, (hist_pesos > 0).any()]
     
     cores_personalizadas = ['blue', 'green', 'red', 'purple', 'orange', 'yellow', 'cyan', 'pink', 'brown', 'gray', 'olive', 'lightblue']
     fig_pesos = px.bar(hist_pesos,color_continuous_scale='Viridis')
     st.plotly_chart(fig_pesos)
+    if escolhida != 'Fundo' or diario:
+        st.write(f'Giro médio diário: {historico.giro().iloc[1:].mean():.2%}. '
+                 f'Concentração (HHI) média: {historico.concentracao().mean():.3f}.')
+    cronometro.fim()
 
     # st.write(hist_pesos)
 
@@ -510,22 +495,80 @@ def equipe():
         st.image('Marco Tulio.png', width= 100)
         st.write('Marco Tulio é  dedicado a capacitar gestores de ativos para excelirem na captação de recursos, fornecendo ferramentas e conhecimentos essenciais para navegarem com confiança pelas complexidades das mais sofisticadas Requests for Proposals (RFPs). Como investidor institucional e consultor de investimentos com 15 anos de experiência no setor, aprimorou habilidades em redação de RFPs, seleção e monitoramento de gestores de ativos, coordenação de due diligence de investimentos e decisões de alocação de ativos. Autor de manuais abrangentes de compliance, estatutos detalhados de comitês de investimento e políticas robustas de relatórios sobre fatores Ambientais, Sociais e de Governança (ESG), além de práticas de Stewardship. Oferece coaching valioso e preparação a General Partners (GPs), garantindo que estejam totalmente equipados para o sucesso em processos de due diligence de investimentos. Para gestores de ativos que buscam prosperar em um cenário competitivo, convida para discutir como pode auxiliar na captação de capital, aprimoramento de respostas a RFPs e elevação das estratégias de investimento a novos patamares de sucesso.')
 
+# Página oculta: só entra no menu com ?admin=<MORIA_ADMIN_TOKEN> na URL
+def painel_metricas():
+    import pandas as pd
+
+    st.title('Métricas')
+    fotografia = metricas.resumo()
+
+    st.subheader('Trechos')
+    trechos = pd.DataFrame(fotografia['trechos']).T
+    if len(trechos):
+        trechos[['soma', 'p50', 'p95', 'maximo']] *= 1000
+        trechos = trechos.rename(columns={'soma': 'total (ms)', 'p50': 'p50 (ms)', 'p95': 'p95 (ms)', 'maximo': 'máximo (ms)'})
+    st.dataframe(trechos)
+
+    st.subheader('Caches')
+    st.dataframe(pd.DataFrame(fotografia['caches']).T)
+    st.write(f'Bytes lidos: {fotografia["contadores"].get("bytes_lidos", 0) / 1024 ** 2:.1f} MB')
+
+    st.subheader('Exportação')
+    texto = metricas.prometheus()
+    st.download_button('Baixar no formato do Prometheus', texto, file_name='metrics.txt')
+    st.code(texto, language='text')
+
+    st.subheader('Perfilador')
+    ativo = st.toggle(f'Perfilar páginas que passarem de {metricas.LIMITE_LENTO:g} s', value=metricas.perfil_ativo())
+    metricas.ativar_perfil(ativo)
+    for perfil in reversed(metricas.perfis()):
+        with open(perfil['caminho'], 'r', encoding='utf-8') as arquivo:
+            st.download_button(f'{perfil["nome"]}: {perfil["duracao"] * 1000:.0f} ms', arquivo.read(),
+                               file_name=os.path.basename(perfil['caminho']), key=perfil['caminho'])
+
+    if st.button('Zerar métricas'):
+        metricas.limpar()
+
 def main():
     st.sidebar.image ('imagem.png', width = 200)
-    st.sidebar.title('Fundo Moria')
+    # Carteiras do registro (carteiras.json); sem ele, só o Fundo Moria
+    registro = carteiras.carregar_registro()
+    nome_carteira = st.sidebar.selectbox('Carteira', list(registro)) if len(registro) > 1 else next(iter(registro))
+    carteira = registro[nome_carteira]
+    st.sidebar.title(nome_carteira)
     st.sidebar.markdown('---')
     lista_menu = ['Home','Informação Qualitativa','Resultados Backtest com ETFs', 'Equipe']
+    token_admin = os.environ.get('MORIA_ADMIN_TOKEN')
+    if token_admin and hmac.compare_digest(st.query_params.get('admin', ''), token_admin):
+        lista_menu.append('Métricas')
     escolha = st.sidebar.radio('Menu', lista_menu)
 
-    if escolha == 'Home':
-        home()
-   # if escolha == 'Resultados Backtest':
-       # backtest()
-    if escolha == 'Resultados Backtest com ETFs':
-        backtest_etf()
-    if escolha == 'Informação Qualitativa':
-        analise_quali()
-    if escolha == 'Equipe':
-        equipe()
+    # /metrics no formato do Prometheus, numa porta separada (se a porta
+    # estiver ocupada, metricas.servir loga uma vez e desiste)
+    if os.environ.get('MORIA_METRICAS_PORTA'):
+        metricas.servir(int(os.environ['MORIA_METRICAS_PORTA']))
+
+    # Carteira cuja configuração não dá para aplicar: avisa em vez de mostrar
+    # a cota de outra
+    if escolha in ['Informação Qualitativa', 'Resultados Backtest com ETFs']:
+        try:
+            carteiras.verificar(carteira)
+        except FileNotFoundError as erro:
+            st.error(str(erro))
+            return
+
+    with metricas.trecho(f'pagina.{escolha}'), metricas.perfilar(escolha):
+        if escolha == 'Home':
+            home()
+       # if escolha == 'Resultados Backtest':
+           # backtest()
+        if escolha == 'Resultados Backtest com ETFs':
+            backtest_etf(carteira)
+        if escolha == 'Informação Qualitativa':
+            analise_quali(carteira)
+        if escolha == 'Equipe':
+            equipe()
+        if escolha == 'Métricas':
+            painel_metricas()
     
 main()
@@ -0,0 +1,313 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import dados
+
+# Motor vetorizado do backtest com gatilho de volatilidade.
+#
+# A cota do fundo alterna entre duas carteiras diárias: a de alta vol
+# (pesos_alta_vol.csv) e a de baixa vol (pesos_baixa_vol.csv). O sinal do
+# gatilho é a volatilidade móvel de 21 dias da carteira de alta vol e a
+# concentração (HHI) dos seus pesos. Como o sinal não depende do caminho da
+# própria cota, todas as transições de regime saem de operações sobre os
+# vetores inteiros, sem laço dia a dia em Python.
+#
+# De onde vêm as regras: o código offline que gerou a coluna Fundo da
+# comparação não está no repositório. O que há dele são os Parametros
+# gravados em analise_quali.json, e as regras abaixo foram reconstruídas a
+# partir dos nomes desses parâmetros e da banda de vol do app (alvo de 10%,
+# entre 5% e 12%); não foram conferidas contra aquele código:
+#   - o sinal é a vol móvel de 21 pregões (anualizada) do retorno da carteira
+#     de alta vol e o HHI dos seus pesos; sem janela completa (ou sem pesos)
+#     valem vol_semente e concentracao_semente;
+#   - o fundo vai para a carteira de baixa vol quando a vol passa de
+#     vol_gatilho_subir OU o HHI passa de concentracao_gatilho_subir por
+#     limite_dias pregões seguidos: qualquer um dos dois basta para reduzir
+#     o risco;
+#   - volta para a de alta vol quando a vol fica abaixo de vol_gatilho_descer
+#     E o HHI abaixo de concentracao_gatilho_descer por limite_dias pregões
+#     seguidos: os dois precisam estar calmos;
+#   - limite_vol_baixa e limite_vol_alta não mudam o regime, só medem o
+#     tempo da cota na banda.
+# Antes de trocar a cota registrada pela recalculada, compare as duas com
+#   python motor_backtest.py --validar
+# (precisa do painel de preços; veja carregar_precos).
+
+ARQUIVO_COMPARACAO = dados.ARQUIVO_COMPARACAO
+ARQUIVO_QUALI = dados.ARQUIVO_QUALI
+ARQUIVO_PESOS_ALTA = 'pesos_alta_vol.csv'
+ARQUIVO_PESOS_BAIXA = 'pesos_baixa_vol.csv'
+ARQUIVO_PRECOS = 'precos ETFs.csv'
+
+JANELA_VOL = 21
+DIAS_UTEIS = 252
+
+PARAMETROS_PADRAO = {
+    'limite_dias': 13,
+    'limite_vol_alta': 0.12,
+    'limite_vol_baixa': 0.085,
+    'vol_gatilho_subir': 0.13,
+    'vol_gatilho_descer': 0.07,
+    'concentracao_gatilho_subir': 0.5,
+    'concentracao_gatilho_descer': 0.5,
+    'vol_semente': 0.1,
+    'concentracao_semente': 0.3
+}
+
+ALTA = 1
+BAIXA = 0
+
+
+def carregar_parametros(caminho=ARQUIVO_QUALI):
+    parametros = dict(PARAMETROS_PADRAO)
+    if os.path.exists(caminho):
+        parametros.update(dados.carregar_json(caminho).get('Parametros', {}))
+    return parametros
+
+
+def carregar_pesos(caminho):
+    return dados.carregar_tabela(caminho)
+
+
+# O painel não vem com o repositório: é criado pela ingestão a partir de um
+# export de fechamentos (ingestao.criar_painel)
+def carregar_precos(caminho=ARQUIVO_PRECOS):
+    if not os.path.exists(caminho):
+        raise FileNotFoundError(f'Painel de preços dos ETFs não encontrado: "{caminho}". Crie-o a partir de um '
+                                f'arquivo de fechamentos com: python ingestao.py <diretorio com precos.csv> --criar-painel')
+    return dados.carregar_tabela_mapeada(caminho)
+
+
+# Alinha preços e pesos nas mesmas datas e ativos. O peso aplicado ao retorno
+# do dia t é o último peso conhecido no fechamento de t-1.
+def preparar_insumos(precos, pesos_alta, pesos_baixa):
+    sem_preco = [ativo for ativo in dict.fromkeys(list(pesos_alta.columns) + list(pesos_baixa.columns))
+                 if ativo not in precos.columns]
+    if sem_preco:
+        raise ValueError(f'Ativos sem preço no painel: {sem_preco}')
+    # Os dois históricos trabalham sobre o universo da carteira de alta vol
+    fora = [ativo for ativo in pesos_baixa.columns if ativo not in pesos_alta.columns]
+    if fora:
+        raise ValueError(f'Ativos da carteira de baixa vol fora da carteira de alta vol: {fora}')
+    ativos = list(pesos_alta.columns)
+
+    precos = precos[ativos].ffill()
+    precos = precos.loc[precos.index >= pesos_alta.index[0]]
+    datas = precos.index
+
+    valores = precos.to_numpy(dtype=np.float64)
+    retornos = np.zeros_like(valores)
+    retornos[1:] = valores[1:] / valores[:-1] - 1
+    retornos[~np.isfinite(retornos)] = 0.0
+
+    def alinhar(pesos):
+        pesos = pesos.reindex(columns=ativos).fillna(0.0)
+        pesos = pesos.reindex(datas, method='ffill').fillna(0.0)
+        return pesos.to_numpy(dtype=np.float64)
+
+    return {
+        'datas': datas,
+        'ativos': ativos,
+        'retornos': retornos,
+        'alta': alinhar(pesos_alta),
+        'baixa': alinhar(pesos_baixa)
+    }
+
+
+# Retorno diário de uma carteira rebalanceada para os pesos do dia anterior.
+def retorno_carteira(retornos, pesos):
+    resultado = np.zeros(len(retornos))
+    resultado[1:] = np.einsum('ij,ij->i', pesos[:-1], retornos[1:])
+    return resultado
+
+
+# Desvio-padrão móvel (ddof=1) anualizado ao longo do eixo 0, via somas
+# acumuladas. Equivale a pct_change().rolling(janela).std()*np.sqrt(252): as
+# primeiras `janela` posições ficam NaN porque o retorno da posição 0 não existe.
+def volatilidade_movel(retornos, janela=JANELA_VOL):
+    retornos = np.asarray(retornos, dtype=np.float64)
+    vol = np.full(retornos.shape, np.nan)
+    validos = retornos[1:]
+    if len(validos) < janela:
+        return vol
+    centro = validos.mean(axis=0)
+    desvio = validos - centro
+    zeros = np.zeros((1,) + desvio.shape[1:])
+    soma = np.concatenate([zeros, np.cumsum(desvio, axis=0)])
+    soma_quad = np.concatenate([zeros, np.cumsum(desvio * desvio, axis=0)])
+    s1 = soma[janela:] - soma[:-janela]
+    s2 = soma_quad[janela:] - soma_quad[:-janela]
+    variancia = (s2 - s1 * s1 / janela) / (janela - 1)
+    vol[janela:] = np.sqrt(np.clip(variancia, 0, None) * DIAS_UTEIS)
+    return vol
+
+
+# Índice de Herfindahl dos pesos de cada dia; dias sem pesos recebem a semente.
+def concentracao(pesos, semente=np.nan):
+    hhi = np.einsum('ij,ij->i', pesos, pesos)
+    return np.where(pesos.any(axis=1), hhi, semente)
+
+
+# Marca os dias em que a condição vale há pelo menos `dias` pregões seguidos.
+def persistencia(condicao, dias):
+    condicao = np.asarray(condicao, dtype=bool)
+    dias = max(int(dias), 1)
+    acumulado = np.cumsum(condicao, axis=0)
+    reinicio = np.where(condicao, 0, acumulado)
+    reinicio = np.maximum.accumulate(reinicio, axis=0)
+    return (acumulado - reinicio) >= dias
+
+
+# Regime antes do primeiro dia: BAIXA se as sementes já passam dos gatilhos
+# de subida.
+def regime_inicial(parametros):
+    if (parametros['vol_semente'] > parametros['vol_gatilho_subir']
+            or parametros['concentracao_semente'] > parametros['concentracao_gatilho_subir']):
+        return BAIXA
+    return ALTA
+
+
+# Estado do regime (ALTA/BAIXA) no fechamento de cada dia. Os gatilhos
+# persistentes viram eventos e o último evento é propagado para frente.
+# `inicial` é o regime antes do primeiro dia; por padrão sai das sementes.
+def calcular_regime(vol, conc, parametros, inicial=None):
+    vol = np.where(np.isnan(vol), parametros['vol_semente'], vol)
+    conc = np.where(np.isnan(conc), parametros['concentracao_semente'], conc)
+
+    aciona_baixa = (vol > parametros['vol_gatilho_subir']) | (conc > parametros['concentracao_gatilho_subir'])
+    aciona_alta = (vol < parametros['vol_gatilho_descer']) & (conc < parametros['concentracao_gatilho_descer'])
+    aciona_baixa = persistencia(aciona_baixa, parametros['limite_dias'])
+    aciona_alta = persistencia(aciona_alta, parametros['limite_dias'])
+
+    if inicial is None:
+        inicial = regime_inicial(parametros)
+
+    eventos = np.where(aciona_baixa, BAIXA, np.where(aciona_alta, ALTA, -1))
+    eventos = np.concatenate([[inicial], eventos])
+    posicao = np.where(eventos >= 0, np.arange(len(eventos)), 0)
+    posicao = np.maximum.accumulate(posicao)
+    return eventos[posicao][1:].astype(np.int8)
+
+
+# Séries que não dependem dos parâmetros do gatilho; calculadas uma vez e
+# reaproveitadas a cada nova combinação de parâmetros.
+def derivar_sinais(insumos):
+    retorno_alta = retorno_carteira(insumos['retornos'], insumos['alta'])
+    retorno_baixa = retorno_carteira(insumos['retornos'], insumos['baixa'])
+    return {
+        'datas': insumos['datas'],
+        'retorno_alta': retorno_alta,
+        'retorno_baixa': retorno_baixa,
+        'vol_sinal': volatilidade_movel(retorno_alta),
+        'concentracao': concentracao(insumos['alta'])
+    }
+
+
+# Retorno diário do fundo: o regime decidido no fechamento de t-1 escolhe a
+# carteira cujo retorno entra no dia t.
+def retorno_fundo(sinais, regime):
+    aplicado = np.concatenate([[regime[0]], regime[:-1]])
+    return np.where(aplicado == ALTA, sinais['retorno_alta'], sinais['retorno_baixa'])
+
+
+# Cota, vol móvel e métricas de uma série de retornos diários do fundo
+# Métricas dos dias a partir de `inicio`; os anteriores só aquecem a vol
+# móvel (o teste de uma dobra do walk-forward, depois do treino)
+def metricas_cota(retornos, parametros, inicio=0):
+    cota = np.cumprod(1 + retornos[inicio:])
+    vol = volatilidade_movel(retornos)[inicio:]
+    validos = vol[~np.isnan(vol)]
+    na_banda = (validos >= parametros['limite_vol_baixa']) & (validos <= parametros['limite_vol_alta'])
+    return {
+        'cota': cota,
+        'vol': vol,
+        'retorno_acumulado': cota[-1] - 1,
+        'vol_media': validos.mean() if len(validos) else np.nan,
+        'tempo_na_banda': na_banda.mean() if len(validos) else np.nan
+    }
+
+
+def avaliar(sinais, parametros):
+    regime = calcular_regime(sinais['vol_sinal'], sinais['concentracao'], parametros)
+    retornos = retorno_fundo(sinais, regime)
+    return dict(metricas_cota(retornos, parametros), regime=regime)
+
+
+def executar_backtest(precos, pesos_alta, pesos_baixa, parametros=None):
+    if parametros is None:
+        parametros = dict(PARAMETROS_PADRAO)
+    sinais = derivar_sinais(preparar_insumos(precos, pesos_alta, pesos_baixa))
+    resultado = avaliar(sinais, parametros)
+    return pd.DataFrame({
+        'Fundo': resultado['cota'],
+        'Regime': resultado['regime'],
+        'Vol Sinal': sinais['vol_sinal'],
+        'Vol Fundo': resultado['vol']
+    }, index=sinais['datas'])
+
+
+# Substitui a coluna Fundo da comparação pela cota recalculada, quando o painel
+# de preços dos ETFs estiver disponível. Sem o painel, devolve a comparação
+# como está.
+def atualizar_fundo(comparacao, parametros=None, caminho_precos=ARQUIVO_PRECOS,
+                    pesos_alta=ARQUIVO_PESOS_ALTA, pesos_baixa=ARQUIVO_PESOS_BAIXA):
+    if not os.path.exists(caminho_precos):
+        return comparacao
+    if parametros is None:
+        parametros = carregar_parametros()
+    backtest = executar_backtest(carregar_precos(caminho_precos),
+                                 carregar_pesos(pesos_alta),
+                                 carregar_pesos(pesos_baixa),
+                                 parametros)
+    datas = pd.to_datetime(comparacao.index)
+    cota = backtest['Fundo'].reindex(datas, method='ffill').to_numpy()
+    comparacao = comparacao.copy()
+    comparacao['Fundo'] = cota / cota[0]
+    return comparacao
+
+
+# Quanto a cota recalculada segue a registrada na comparação, nas datas em
+# comum: correlação e erro de rastreamento (anualizado) dos retornos diários
+# e a diferença entre os retornos acumulados
+def aderencia(registrada, recalculada):
+    datas = registrada.index.intersection(recalculada.index)
+    registrada = registrada.reindex(datas).to_numpy(dtype=np.float64)
+    recalculada = recalculada.reindex(datas).to_numpy(dtype=np.float64)
+    retornos = registrada[1:] / registrada[:-1] - 1
+    retornos_recalculados = recalculada[1:] / recalculada[:-1] - 1
+    return {
+        'pregoes': len(datas),
+        'correlacao': float(np.corrcoef(retornos, retornos_recalculados)[0, 1]),
+        'erro_rastreamento': float(np.std(retornos_recalculados - retornos, ddof=1) * np.sqrt(DIAS_UTEIS)),
+        'diferenca_acumulada': float(recalculada[-1] / recalculada[0] - registrada[-1] / registrada[0])
+    }
+
+
+def validar(parametros=None, caminho_precos=ARQUIVO_PRECOS):
+    carregar_precos(caminho_precos)
+    registrada = dados.carregar_comparacao(ARQUIVO_COMPARACAO)
+    recalculada = atualizar_fundo(registrada, parametros, caminho_precos)
+    return aderencia(registrada['Fundo'], recalculada['Fundo'])
+
+
+def reconstruir_comparacao(caminho_saida=ARQUIVO_COMPARACAO, parametros=None, caminho_precos=ARQUIVO_PRECOS):
+    # Sem o painel não há o que recalcular: carregar_precos explica como criá-lo
+    carregar_precos(caminho_precos)
+    comparacao = atualizar_fundo(dados.carregar_comparacao(ARQUIVO_COMPARACAO), parametros, caminho_precos)
+    comparacao.to_csv(caminho_saida, date_format='%Y-%m-%d')
+    return caminho_saida
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recalcula a cota do fundo em "comparacao ETFs.csv".')
+    parser.add_argument('--validar', action='store_true',
+                        help='só compara a cota recalculada com a registrada, sem gravar')
+    argumentos = parser.parse_args()
+    if argumentos.validar:
+        for nome, valor in validar().items():
+            print(f'{nome}: {valor}')
+    else:
+        print(reconstruir_comparacao())
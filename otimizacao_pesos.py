@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+import cvxpy as cp
+
+from janela_movel import JanelaCovariancia
+from motor_backtest import (ARQUIVO_PESOS_ALTA, ARQUIVO_PESOS_BAIXA, DIAS_UTEIS,
+                            PARAMETROS_PADRAO, carregar_precos)
+
+# Geração diária das matrizes de pesos de alta e baixa vol.
+#
+# O problema da fronteira eficiente (máximo retorno esperado com volatilidade
+# alvo, como EfficientFrontier.efficient_risk) é montado uma única vez com
+# cvxpy.Parameter para o retorno esperado e para o fator de Cholesky da
+# covariância. A cada dia só os valores dos parâmetros mudam e o solver parte
+# da solução do dia anterior (warm start). Média e covariância vêm de uma
+# JanelaCovariancia, atualizada por acréscimo/remoção de um dia.
+#
+# Um ETF só entra no universo quando a janela inteira tem preços dele (antes
+# do primeiro preço os retornos são NaN, e como zero ele pareceria um ativo
+# sem risco). Fora do universo o peso máximo dele é zero, também um
+# parâmetro; dias sem nenhum ativo completo ficam sem pesos.
+
+JANELA_OTIMIZACAO = 252
+CASAS_DECIMAIS = 5
+SOLVER = 'SCS'
+RIDGE = 1e-10
+
+
+class ProblemaFronteira:
+
+    def __init__(self, n_ativos, vol_alvo, peso_maximo=1.0):
+        self.peso = cp.Variable(n_ativos)
+        self.retorno_esperado = cp.Parameter(n_ativos)
+        self.fator = cp.Parameter((n_ativos, n_ativos))
+        self.peso_maximo = peso_maximo
+        self.limite = cp.Parameter(n_ativos, nonneg=True)
+
+        risco = cp.norm(self.fator @ self.peso, 2)
+        restricoes = [cp.sum(self.peso) == 1, self.peso >= 0, self.peso <= self.limite]
+        self.problema = cp.Problem(cp.Maximize(self.retorno_esperado @ self.peso),
+                                   restricoes + [risco <= vol_alvo])
+        # Quando a vol alvo é menor que a da carteira de mínima variância, o
+        # problema principal é inviável e usamos a mínima variância.
+        self.minima_variancia = cp.Problem(cp.Minimize(risco), restricoes)
+
+    # `universo`: máscara dos ativos que podem receber peso (todos, se None)
+    def resolver(self, retorno_esperado, covariancia, solver=SOLVER, universo=None):
+        n = len(retorno_esperado)
+        universo = np.ones(n, dtype=bool) if universo is None else np.asarray(universo)
+        fator = np.linalg.cholesky(covariancia + RIDGE * np.eye(n))
+        self.retorno_esperado.value = np.where(universo, retorno_esperado, 0.0)
+        self.fator.value = fator.T
+        self.limite.value = np.where(universo, self.peso_maximo, 0.0)
+
+        self.problema.solve(solver=solver, warm_start=True)
+        if self.problema.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE):
+            self.minima_variancia.solve(solver=solver, warm_start=True)
+        return limpar_pesos(self.peso.value)
+
+
+def limpar_pesos(pesos, casas=CASAS_DECIMAIS):
+    pesos = np.clip(np.nan_to_num(pesos), 0, None)
+    pesos = pesos / pesos.sum()
+    return np.round(pesos, casas)
+
+
+# Gera um histórico de pesos por vol alvo, todos sobre a mesma janela móvel.
+# `vols_alvo` é uma lista de vols ou um dict {chave: vol}; devolve
+# {vol_alvo ou chave: DataFrame} com uma linha por dia a partir de `inicio`.
+def gerar_pesos(precos, vols_alvo, janela=JANELA_OTIMIZACAO, inicio=None, solver=SOLVER):
+    if not isinstance(vols_alvo, dict):
+        vols_alvo = {vol: vol for vol in vols_alvo}
+    precos = precos.sort_index().ffill()
+    retornos = precos.pct_change().iloc[1:]
+    ativos = list(precos.columns)
+    valores = retornos.to_numpy(dtype=np.float64)
+
+    janela_cov = JanelaCovariancia(len(ativos), janela)
+    problemas = {chave: ProblemaFronteira(len(ativos), vol) for chave, vol in vols_alvo.items()}
+    linhas = {chave: [] for chave in vols_alvo}
+    datas = []
+
+    for data, retorno in zip(retornos.index, valores):
+        janela_cov.adicionar(retorno)
+        if not janela_cov.cheia or (inicio is not None and data < pd.Timestamp(inicio)):
+            continue
+        universo = janela_cov.completos()
+        if not universo.any():
+            continue
+        retorno_esperado = janela_cov.retorno_geometrico(DIAS_UTEIS)
+        covariancia = janela_cov.covariancia() * DIAS_UTEIS
+        for chave, problema in problemas.items():
+            linhas[chave].append(problema.resolver(retorno_esperado, covariancia, solver, universo))
+        datas.append(data)
+
+    indice = pd.DatetimeIndex(datas)
+    return {chave: pd.DataFrame(linhas[chave], index=indice, columns=ativos) for chave in vols_alvo}
+
+
+# Refaz pesos_alta_vol.csv e pesos_baixa_vol.csv com as vols alvo dos Parametros
+def gerar_historicos(precos, parametros=None, janela=JANELA_OTIMIZACAO, inicio=None,
+                     caminho_alta=ARQUIVO_PESOS_ALTA, caminho_baixa=ARQUIVO_PESOS_BAIXA):
+    if parametros is None:
+        parametros = dict(PARAMETROS_PADRAO)
+    vols_alvo = {'alta': parametros['limite_vol_alta'], 'baixa': parametros['limite_vol_baixa']}
+    pesos = gerar_pesos(precos, vols_alvo, janela, inicio)
+    pesos['alta'].to_csv(caminho_alta, date_format='%Y-%m-%d')
+    pesos['baixa'].to_csv(caminho_baixa, date_format='%Y-%m-%d')
+    return pesos['alta'], pesos['baixa']
+
+
+if __name__ == '__main__':
+    from motor_backtest import carregar_parametros
+    gerar_historicos(carregar_precos(), carregar_parametros())
@@ -0,0 +1,179 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import analitico
+import dados
+import motor_backtest
+from motor_backtest import ALTA
+
+# Histórico de pesos em formato esparso (CSR por dia).
+#
+# Cada pregão guarda só os ativos com peso não nulo: `indptr[t]:indptr[t+1]`
+# delimita, em `indices` e `valores`, as posições do dia t. As agregações
+# (médias por ano ou mês, giro, HHI) trabalham direto sobre essas entradas
+# com bincount, em O(entradas não nulas), sem montar a tabela densa
+# dias x ativos. O histórico é lido dos CSVs (ou de um .npz salvo por
+# `salvar`) e fica em cache por versão do arquivo.
+
+_cache = {}
+_trava = threading.Lock()
+
+
+def _rotulos(datas, frequencia):
+    if frequencia == 'anual':
+        return analitico.rotulos_anuais(datas)
+    return analitico.rotulos_mensais(datas)
+
+
+def _indice_periodos(periodos, frequencia):
+    if frequencia == 'anual':
+        return pd.Index(periodos, name='Ano')
+    return pd.MultiIndex.from_arrays([periodos // 12, periodos % 12 + 1], names=['Ano', 'Mes'])
+
+
+class HistoricoPesos:
+
+    def __init__(self, datas, ativos, indptr, indices, valores):
+        self.datas = pd.DatetimeIndex(datas)
+        self.ativos = list(ativos)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.valores = np.asarray(valores, dtype=np.float64)
+
+    @classmethod
+    def de_tabela(cls, tabela):
+        valores = tabela.fillna(0.0).to_numpy(dtype=np.float64)
+        dias, ativos = np.nonzero(valores)
+        indptr = np.r_[0, np.cumsum(np.bincount(dias, minlength=len(valores)))]
+        return cls(tabela.index, tabela.columns, indptr, ativos, valores[dias, ativos])
+
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho) as arquivo:
+            return cls(pd.to_datetime(arquivo['datas']), arquivo['ativos'].tolist(),
+                       arquivo['indptr'], arquivo['indices'], arquivo['valores'])
+
+    def salvar(self, caminho):
+        np.savez_compressed(caminho, datas=self.datas.strftime('%Y-%m-%d').to_numpy(dtype=str),
+                            ativos=np.array(self.ativos), indptr=self.indptr,
+                            indices=self.indices, valores=self.valores)
+        return caminho
+
+    def __len__(self):
+        return len(self.datas)
+
+    # Dia de cada entrada não nula
+    def _dias(self):
+        return np.repeat(np.arange(len(self.datas)), np.diff(self.indptr))
+
+    def tabela(self):
+        valores = np.zeros((len(self.datas), len(self.ativos)))
+        valores[self._dias(), self.indices] = self.valores
+        return pd.DataFrame(valores, index=self.datas, columns=self.ativos)
+
+    # Último peso conhecido em `data`
+    def pesos_em(self, data):
+        linha = np.zeros(len(self.ativos))
+        t = self.datas.searchsorted(pd.Timestamp(data), side='right') - 1
+        if t >= 0:
+            inicio, fim = self.indptr[t], self.indptr[t + 1]
+            linha[self.indices[inicio:fim]] = self.valores[inicio:fim]
+        return pd.Series(linha, index=self.ativos)
+
+    # Peso médio de cada ativo por ano ou mês (dias sem peso contam como zero)
+    def media_periodo(self, frequencia='anual'):
+        periodos, primeiro, ultimo = analitico.bordas_periodos(_rotulos(self.datas, frequencia))
+        periodo_dia = np.repeat(np.arange(len(periodos)), ultimo - primeiro + 1)
+        n_ativos = len(self.ativos)
+        somas = np.bincount(periodo_dia[self._dias()] * n_ativos + self.indices, weights=self.valores,
+                            minlength=len(periodos) * n_ativos).reshape(len(periodos), n_ativos)
+        medias = somas / (ultimo - primeiro + 1)[:, None]
+        return pd.DataFrame(medias, index=_indice_periodos(periodos, frequencia), columns=self.ativos)
+
+    # Giro diário: metade da soma das variações absolutas dos pesos em relação
+    # ao pregão anterior (o primeiro dia é comparado a uma carteira vazia)
+    def giro(self):
+        n_ativos = len(self.ativos)
+        dias = self._dias()
+        chaves = np.r_[dias * n_ativos + self.indices, (dias + 1) * n_ativos + self.indices]
+        variacao = np.r_[self.valores, -self.valores]
+        unicas, posicao = np.unique(chaves, return_inverse=True)
+        liquido = np.abs(np.bincount(posicao, weights=variacao))
+        giro = np.bincount(unicas // n_ativos, weights=liquido, minlength=len(self.datas) + 1)
+        return pd.Series(giro[:len(self.datas)] / 2, index=self.datas)
+
+    # Índice de Herfindahl por dia, como motor_backtest.concentracao: NaN nos
+    # dias sem pesos
+    def concentracao(self):
+        hhi = np.bincount(self._dias(), weights=self.valores ** 2, minlength=len(self.datas))
+        return pd.Series(np.where(np.diff(self.indptr) > 0, hhi, np.nan), index=self.datas)
+
+    # Linhas escolhidas dia a dia entre este histórico e `outro` (mesmas datas
+    # e ativos): `usar_este[t]` seleciona a linha deste no dia t
+    def combinar(self, outro, usar_este):
+        usar_este = np.asarray(usar_este, dtype=bool)
+        dias_este, dias_outro = self._dias(), outro._dias()
+        manter_este = usar_este[dias_este]
+        manter_outro = ~usar_este[dias_outro]
+        dias = np.r_[dias_este[manter_este], dias_outro[manter_outro]]
+        ordem = np.argsort(dias, kind='stable')
+        indices = np.r_[self.indices[manter_este], outro.indices[manter_outro]][ordem]
+        valores = np.r_[self.valores[manter_este], outro.valores[manter_outro]][ordem]
+        indptr = np.r_[0, np.cumsum(np.bincount(dias, minlength=len(self.datas)))]
+        return HistoricoPesos(self.datas, self.ativos, indptr, indices, valores)
+
+
+# Histórico esparso de um CSV de pesos (ou de um .npz), em cache pela versão
+# do arquivo
+def carregar_historico(caminho):
+    chave = (os.path.abspath(caminho), dados.versao(caminho))
+    with _trava:
+        if chave in _cache:
+            return _cache[chave]
+    if caminho.endswith('.npz'):
+        historico = HistoricoPesos.carregar(caminho)
+    else:
+        historico = HistoricoPesos.de_tabela(dados.carregar_tabela(caminho))
+    with _trava:
+        for antiga in [c for c in _cache if c[0] == chave[0]]:
+            del _cache[antiga]
+        _cache[chave] = historico
+    return historico
+
+
+# Pesos alvo do fundo: a carteira de alta vol nos dias em que o regime no
+# fechamento é ALTA, a de baixa vol nos demais. `regime` é uma Series por data.
+def pesos_fundo(alta, baixa, regime):
+    if not baixa.datas.equals(alta.datas) or baixa.ativos != alta.ativos:
+        raise ValueError('Os históricos de alta e baixa vol devem ter as mesmas datas e ativos')
+    regime = regime.reindex(alta.datas, method='ffill').fillna(ALTA).to_numpy()
+    return alta.combinar(baixa, regime == ALTA)
+
+
+# Médias anuais dos pesos efetivamente aplicados no fundo, registradas em
+# dados.ARQUIVO_HISTORICO_PESOS (uma linha por ano), como um histórico com um
+# "dia" por ano (1º de janeiro): media_periodo('anual') devolve a própria
+# tabela. Serve enquanto o painel de preços não existe para recalcular o
+# histórico diário com historico_fundo.
+def historico_aplicado(caminho=dados.ARQUIVO_HISTORICO_PESOS):
+    tabela = dados.carregar_historico_pesos(caminho)
+    datas = pd.to_datetime(tabela.index.astype(int).astype(str), format='%Y')
+    return HistoricoPesos.de_tabela(tabela.set_axis(datas))
+
+
+# Histórico dos pesos alvo do fundo pelo regime do backtest; None enquanto o
+# painel de preços dos ETFs não existir
+def historico_fundo(parametros=None, caminho_precos=motor_backtest.ARQUIVO_PRECOS,
+                    pesos_alta=motor_backtest.ARQUIVO_PESOS_ALTA, pesos_baixa=motor_backtest.ARQUIVO_PESOS_BAIXA):
+    if not os.path.exists(caminho_precos):
+        return None
+    if parametros is None:
+        parametros = motor_backtest.carregar_parametros()
+    backtest = motor_backtest.executar_backtest(motor_backtest.carregar_precos(caminho_precos),
+                                                motor_backtest.carregar_pesos(pesos_alta),
+                                                motor_backtest.carregar_pesos(pesos_baixa),
+                                                parametros)
+    return pesos_fundo(carregar_historico(pesos_alta), carregar_historico(pesos_baixa), backtest['Regime'])
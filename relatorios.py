@@ -0,0 +1,357 @@
+import argparse
+import base64
+import hashlib
+import html
+import itertools
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import carteiras
+import dados
+import indice_acumulado
+import pesos_esparsos
+import resultados
+
+# Gerador de relatórios em lote, sem o Streamlit.
+#
+# Cada relatório é uma carteira do registro (carteiras.json; sem ele, o
+# Fundo Moria) numa janela de datas. Comparação, parâmetros do gatilho e
+# taxa de administração vêm da carteira e podem ser sobrepostos por
+# relatório. Os números são os mesmos das páginas do app (o índice, o resumo
+# e os históricos de pesos de carteiras.py e as figuras do módulo graficos)
+# e saem em DIRETORIO_RELATORIOS/<nome>/:
+#   resumo.json      resumo do período, retorno de cada série na janela,
+#                    lista de fundos e giro/HHI de cada histórico diário de pesos
+#   <tabela>.parquet curva, retornos anuais, excesso mensal, vol móvel e a
+#                    média anual dos pesos de cada carteira (pesos_<nome>)
+#                    (CSV quando o pyarrow não está instalado)
+#   relatorio.html   página estática com tabelas e gráficos
+# O plotly.js é gravado uma vez na raiz da saída, e as páginas funcionam
+# sem rede.
+#
+# Os relatórios rodam num pool de processos. Um relatório cujas entradas
+# (versões dos arquivos, parâmetros, janela e taxa) não mudaram desde a
+# última geração é pulado: a chave fica no manifesto, gravado por último.
+#
+#   python relatorios.py --carteira "Fundo Moria" --janela 2021-01-01:2023-12-31 --janela :
+#   python relatorios.py --config relatorios.json
+
+DIRETORIO_RELATORIOS = 'relatorios'
+ARQUIVO_MANIFESTO = 'manifesto.json'
+ARQUIVO_PLOTLY = 'plotly.min.js'
+# Muda quando o conteúdo dos relatórios muda, forçando a regeração
+VERSAO_RELATORIO = 3
+
+
+def _nome_arquivo(caminho):
+    return os.path.splitext(os.path.basename(caminho))[0].replace(' ', '_')
+
+
+def _hash(conteudo):
+    return hashlib.sha1(json.dumps(conteudo, sort_keys=True).encode()).hexdigest()
+
+
+# Relatório com os campos completos. `carteira` é o nome de uma carteira do
+# registro (a primeira, se omitido) ou um dict de carteiras.nova_carteira;
+# `comparacao`, `parametros` e `taxa_adm` sobrepõem os da carteira, e
+# `parametros` pode ser um dict ou o caminho de um JSON com a chave
+# 'Parametros'.
+def novo_relatorio(carteira=None, inicio=None, fim=None, comparacao=None, parametros=None,
+                   taxa_adm=None, nome=None):
+    if not isinstance(carteira, dict):
+        registro = carteiras.carregar_registro()
+        if carteira is not None and carteira not in registro:
+            raise ValueError(f'Carteira fora do registro: {carteira}')
+        carteira = registro[carteira if carteira is not None else next(iter(registro))]
+    if isinstance(parametros, str):
+        parametros = dados.carregar_json(parametros).get('Parametros', {})
+    sobrepostos = {'comparacao': comparacao, 'parametros': parametros, 'taxa_adm': taxa_adm}
+    carteira = dict(carteira, **{campo: valor for campo, valor in sobrepostos.items() if valor is not None})
+    if nome is None:
+        nome = '_'.join([_nome_arquivo(carteira['nome']), _nome_arquivo(carteiras.arquivos(carteira)['comparacao']),
+                         inicio or 'inicio', fim or 'fim', f'adm{carteiras.taxa_adm(carteira)}',
+                         _hash(carteira)[:8]])
+    return {'nome': nome, 'carteira': carteira, 'inicio': inicio, 'fim': fim}
+
+
+# Produto cartesiano das opções da linha de comando
+def combinar(nomes_carteiras, comparacoes, janelas, parametros, taxas):
+    return [novo_relatorio(carteira, inicio, fim, comparacao, conjunto, taxa)
+            for carteira, comparacao, (inicio, fim), conjunto, taxa
+            in itertools.product(nomes_carteiras, comparacoes, janelas, parametros, taxas)]
+
+
+# Versões dos arquivos de que o relatório depende (o painel de preços só
+# quando existe; sem ele a cota vem da comparação)
+def chave_relatorio(relatorio):
+    carteira = relatorio['carteira']
+    arquivos = carteiras.arquivos_cota(carteira) + [carteiras.arquivos(carteira)['quali'],
+                                                    dados.ARQUIVO_HISTORICO_PESOS]
+    return _hash({
+        'versao': VERSAO_RELATORIO,
+        'arquivos': {arquivo: dados.versao(arquivo) for arquivo in arquivos if os.path.exists(arquivo)},
+        'relatorio': relatorio
+    })
+
+
+def _extensao():
+    return 'parquet' if dados.PARQUET_DISPONIVEL else 'csv'
+
+
+# As tabelas de pesos variam com a carteira: o manifesto lista o que foi gravado
+def atualizado(relatorio, saida=DIRETORIO_RELATORIOS):
+    diretorio = os.path.join(saida, relatorio['nome'])
+    try:
+        with open(os.path.join(diretorio, ARQUIVO_MANIFESTO), 'r') as json_file:
+            manifesto = json.load(json_file)
+    except (FileNotFoundError, ValueError):
+        return False
+    return (manifesto.get('chave') == chave_relatorio(relatorio)
+            and all(os.path.exists(os.path.join(diretorio, arquivo)) for arquivo in manifesto.get('arquivos', [])))
+
+
+# Como em resultados.gravar: arquivo temporário no mesmo diretório + os.replace
+def _gravar_atomico(caminho, escrever):
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix='.tmp')
+    os.close(descritor)
+    try:
+        # O mkstemp cria com 0600; os relatórios são para distribuir
+        os.chmod(temporario, 0o644)
+        escrever(temporario)
+        os.replace(temporario, caminho)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.unlink(temporario)
+        raise
+
+
+def _gravar_texto(caminho, texto):
+    def escrever(temporario):
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(texto)
+    _gravar_atomico(caminho, escrever)
+
+
+def _gravar_tabela(caminho, tabela):
+    # O Parquet exige nomes de coluna em texto (o excesso mensal tem os anos)
+    tabela = tabela.rename(columns=str)
+    if caminho.endswith('.parquet'):
+        _gravar_atomico(caminho, tabela.to_parquet)
+    else:
+        _gravar_atomico(caminho, lambda temporario: tabela.to_csv(temporario, date_format='%Y-%m-%d'))
+
+
+# Históricos de pesos da página de informação qualitativa: o do fundo
+# (diário pelo regime do motor quando há painel de preços, senão as médias
+# anuais registradas) e os das carteiras de alta e baixa vol. O booleano diz
+# se o histórico é diário, para o giro e o HHI fazerem sentido.
+def historicos_pesos(carteira):
+    arquivos = carteiras.arquivos(carteira)
+    historico_fundo = carteiras.historico_fundo(carteira)
+    if historico_fundo is None:
+        fundo = (pesos_esparsos.historico_aplicado(), False)
+    else:
+        fundo = (historico_fundo, True)
+    return {'Fundo': fundo,
+            'Alta vol': (pesos_esparsos.carregar_historico(arquivos['pesos_alta']), True),
+            'Baixa vol': (pesos_esparsos.carregar_historico(arquivos['pesos_baixa']), True)}
+
+
+# Os mesmos números das páginas de backtest e de informação qualitativa
+def calcular(relatorio):
+    carteira = relatorio['carteira']
+    indice = carteiras.indice(carteira)
+    inicio = relatorio['inicio'] or indice.datas[0]
+    fim = relatorio['fim'] or indice.datas[-1]
+
+    resumo = dict(resultados.calcular_resumo(indice, inicio, fim), Parametros=carteiras.parametros(carteira))
+    resumo['carteira'] = carteira['nome']
+    resumo['retornos_periodo'] = (indice.retorno_acumulado(inicio, fim) - 1).to_dict()
+    resumo['fundos'] = dados.carregar_quali(carteiras.arquivos(carteira)['quali']).get('fundos', [])
+    tabelas = {
+        'curva': indice.curva(inicio, fim),
+        'retornos_anuais': indice.retornos_anuais(inicio, fim),
+        'excesso_mensal': indice.excesso_mensal(inicio, fim),
+        'vol': indice.vol_movel(inicio, fim, [indice_acumulado.COLUNA_FUNDO])
+    }
+
+    resumo['pesos'] = {}
+    for rotulo, (historico, diario) in historicos_pesos(carteira).items():
+        medias = historico.media_periodo('anual')
+        tabelas[f'pesos_{_nome_arquivo(rotulo).lower()}'] = medias.loc[:, (medias > 0).any()]
+        resumo['pesos'][rotulo] = {}
+        if diario:
+            resumo['pesos'][rotulo] = {'giro_medio_diario': float(historico.giro().iloc[1:].mean()),
+                                       'concentracao_media': float(historico.concentracao().mean())}
+    return resumo, tabelas
+
+
+def _imagem(png):
+    return f'<img src="data:image/png;base64,{base64.b64encode(png).decode()}" style="max-width:100%">'
+
+
+def _html(relatorio, resumo, tabelas):
+    import plotly.express as px
+
+    import graficos
+
+    def figura(fig):
+        return fig.to_html(full_html=False, include_plotlyjs=False)
+
+    fundo = indice_acumulado.COLUNA_FUNDO
+    curva = px.line(tabelas['curva'], title='Rentabilidade acumulada')
+    anuais = px.bar(tabelas['retornos_anuais'][[c for c in (fundo, 'CDI') if c in tabelas['retornos_anuais']]],
+                    barmode='group', title='Retorno por ano')
+    anuais.update_layout(yaxis_tickformat='.2%')
+    vol = px.line(tabelas['vol'], title='Volatilidade do Fundo<br><sup>Volatilidade Móvel 21, anualizada</sup>')
+    vol.update_layout(yaxis_tickformat='.2%')
+    pesos = ''
+    for rotulo, valores in resumo['pesos'].items():
+        barras = px.bar(tabelas[f'pesos_{_nome_arquivo(rotulo).lower()}'], title=f'Média dos pesos ano a ano: {rotulo}')
+        pesos += f'{figura(barras)}\n'
+        if valores:
+            pesos += (f'<p>Giro médio diário: {valores["giro_medio_diario"]:.2%}. '
+                      f'Concentração (HHI) média: {valores["concentracao_media"]:.3f}.</p>\n')
+
+    periodo = html.escape(f'{resumo["data_inicial"]} a {resumo["data_final"]}')
+    linhas = ''.join(f'<tr><td>{html.escape(str(nome))}</td><td>{valor:.2%}</td></tr>'
+                     for nome, valor in resumo['retornos_periodo'].items())
+    parametros = ''.join(f'<li>{html.escape(nome)}: {valor}</li>' for nome, valor in resumo['Parametros'].items())
+    fundos = ''.join(f'<li>{html.escape(str(nome))}</li>' for nome in resumo['fundos'])
+    comparacao = _nome_arquivo(carteiras.arquivos(relatorio['carteira'])['comparacao'])
+    return f"""<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="UTF-8">
+<title>{html.escape(relatorio['nome'])}</title>
+<script src="../{ARQUIVO_PLOTLY}"></script>
+</head>
+<body>
+<h1>{html.escape(resumo['carteira'])}</h1>
+<p>Comparação: {html.escape(comparacao)}.</p>
+<p>Período: <b>{periodo}</b>. Taxa de adm aplicada: <b>{resumo['taxa_adm']}%</b>.</p>
+<h2>Resultados</h2>
+<table>{linhas}</table>
+<p>Volatilidade média da cota: {resumo['vol_media']}%.
+Vol abaixo de 10% em {resumo['vol_dist']}% do tempo (intervalo de 95%: {resumo['vol_dist_intervalo'][0]}% a {resumo['vol_dist_intervalo'][1]}%).
+Entre 5% e 12% em {resumo['vol_na_banda']}% do tempo (intervalo de 95%: {resumo['vol_na_banda_intervalo'][0]}% a {resumo['vol_na_banda_intervalo'][1]}%).</p>
+{figura(curva)}
+{figura(anuais)}
+<h2>Sensibilidade de performance do Fundo vs CDI</h2>
+{_imagem(graficos.heatmap_png(tabelas['excesso_mensal']))}
+<h2>Análise da Volatilidade</h2>
+{_imagem(graficos.histograma_png(tabelas['vol'][fundo], bins=80))}
+{figura(vol)}
+<h2>Fundos Usados no Backtest</h2>
+<ul>{fundos}</ul>
+<h2>Histórico dos Pesos</h2>
+{pesos}<h2>Parâmetros</h2>
+<ul>{parametros}</ul>
+</body>
+</html>
+"""
+
+
+def gerar(relatorio, saida=DIRETORIO_RELATORIOS):
+    diretorio = os.path.join(saida, relatorio['nome'])
+    os.makedirs(diretorio, exist_ok=True)
+    chave = chave_relatorio(relatorio)
+    resumo, tabelas = calcular(relatorio)
+
+    arquivos = [f'{nome}.{_extensao()}' for nome in tabelas] + ['resumo.json', 'relatorio.html']
+    for nome, tabela in tabelas.items():
+        _gravar_tabela(os.path.join(diretorio, f'{nome}.{_extensao()}'), tabela)
+    _gravar_texto(os.path.join(diretorio, 'resumo.json'), json.dumps(resumo, indent=4, ensure_ascii=False))
+    _gravar_texto(os.path.join(diretorio, 'relatorio.html'), _html(relatorio, resumo, tabelas))
+    _gravar_texto(os.path.join(diretorio, ARQUIVO_MANIFESTO),
+                  json.dumps({'chave': chave, 'relatorio': relatorio, 'arquivos': arquivos}, indent=4))
+    return relatorio['nome']
+
+
+def _gravar_plotly(saida):
+    caminho = os.path.join(saida, ARQUIVO_PLOTLY)
+    if not os.path.exists(caminho):
+        from plotly.offline import get_plotlyjs
+
+        _gravar_texto(caminho, get_plotlyjs())
+
+
+# Gera os relatórios pendentes. Devolve os nomes gerados, os pulados e os
+# erros por relatório (um relatório com erro não interrompe os demais).
+def executar(relatorios, saida=DIRETORIO_RELATORIOS, processos=None, forcar=False):
+    nomes = [relatorio['nome'] for relatorio in relatorios]
+    if len(set(nomes)) != len(nomes):
+        raise ValueError('Os relatórios precisam ter nomes distintos')
+    os.makedirs(saida, exist_ok=True)
+    _gravar_plotly(saida)
+
+    pendentes = [r for r in relatorios if forcar or not atualizado(r, saida)]
+    pulados = [r['nome'] for r in relatorios if r not in pendentes]
+    gerados = []
+    erros = {}
+    processos = processos or os.cpu_count() or 1
+    if processos == 1 or len(pendentes) <= 1:
+        for relatorio in pendentes:
+            try:
+                gerados.append(gerar(relatorio, saida))
+            except Exception as erro:
+                erros[relatorio['nome']] = repr(erro)
+    else:
+        with ProcessPoolExecutor(min(processos, len(pendentes))) as executor:
+            futuros = {executor.submit(gerar, relatorio, saida): relatorio['nome'] for relatorio in pendentes}
+            for futuro in as_completed(futuros):
+                try:
+                    gerados.append(futuro.result())
+                except Exception as erro:
+                    erros[futuros[futuro]] = repr(erro)
+    return {'gerados': sorted(gerados), 'pulados': pulados, 'erros': erros}
+
+
+def _janela(texto):
+    inicio, _, fim = texto.partition(':')
+    return (inicio or None, fim or None)
+
+
+# Lista de relatórios de um JSON: [{"carteira": ..., "inicio": ..., "fim": ...,
+# "comparacao": ..., "parametros": {...} ou caminho, "taxa_adm": ..., "nome": ...}, ...]
+def carregar_config(caminho):
+    with open(caminho, 'r') as json_file:
+        return [novo_relatorio(**item) for item in json.load(json_file)]
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description='Gera os relatórios do backtest sem o app.')
+    parser.add_argument('--config', help='JSON com a lista de relatórios')
+    parser.add_argument('--carteira', action='append',
+                        help=f'Carteira do registro {carteiras.ARQUIVO_CARTEIRAS} (repetível)')
+    parser.add_argument('--comparacao', action='append', help='CSV de comparação no lugar do da carteira (repetível)')
+    parser.add_argument('--janela', action='append', type=_janela,
+                        help='INICIO:FIM em AAAA-MM-DD; um lado vazio usa o histórico todo (repetível)')
+    parser.add_argument('--parametros', action='append', help="JSON com a chave 'Parametros' (repetível)")
+    parser.add_argument('--taxa-adm', action='append', type=float, help='Taxa de adm em %% a.a. (repetível)')
+    parser.add_argument('--saida', default=DIRETORIO_RELATORIOS)
+    parser.add_argument('--processos', type=int)
+    parser.add_argument('--forcar', action='store_true', help='Regera mesmo sem mudança nas entradas')
+    argumentos = parser.parse_args(argumentos)
+
+    relatorios = carregar_config(argumentos.config) if argumentos.config else []
+    if not argumentos.config or argumentos.carteira or argumentos.comparacao:
+        relatorios += combinar(argumentos.carteira or [None],
+                               argumentos.comparacao or [None],
+                               argumentos.janela or [(None, None)],
+                               argumentos.parametros or [None],
+                               argumentos.taxa_adm or [None])
+
+    resultado = executar(relatorios, argumentos.saida, argumentos.processos, argumentos.forcar)
+    print(f'{len(resultado["gerados"])} gerados, {len(resultado["pulados"])} sem mudança, '
+          f'{len(resultado["erros"])} com erro')
+    for nome, erro in resultado['erros'].items():
+        print(f'  {nome}: {erro}', file=sys.stderr)
+    return 1 if resultado['erros'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import bootstrap_vol
+import carteiras
+import dados
+import metricas
+import motor_backtest
+
+# Repositório versionado dos resumos do backtest.
+#
+# Cada resumo é identificado pela versão do dataset (hash dos arquivos de
+# entrada), pelos parâmetros da estratégia, pela janela de datas e pela taxa
+# de administração. Os resumos ficam em um JSON por chave em
+# DIRETORIO_RESULTADOS, gravados de forma atômica (arquivo temporário +
+# os.replace). As páginas só leem, por carteiras.resumo, que guarda o resumo
+# no cache limitado das carteiras; quando a chave não existe em disco o
+# resumo é calculado e fica só nesse cache. A gravação é feita por
+# precalcular() / `python resultados.py`, para cada carteira do registro.
+
+DIRETORIO_RESULTADOS = 'resultados'
+VOL_MIN = 0.05
+VOL_MAX = 0.12
+LIMITE_VOL = 0.10
+# Muda quando o conteúdo do resumo muda, invalidando os já gravados
+VERSAO_RESUMO = 2
+
+
+def versao_dataset(arquivos=None):
+    if arquivos is None:
+        arquivos = [dados.ARQUIVO_COMPARACAO, motor_backtest.ARQUIVO_PESOS_ALTA,
+                    motor_backtest.ARQUIVO_PESOS_BAIXA, motor_backtest.ARQUIVO_PRECOS]
+    sha = hashlib.sha1()
+    for arquivo in arquivos:
+        if os.path.exists(arquivo):
+            sha.update(f'{arquivo}:{dados.versao(arquivo)};'.encode())
+    return sha.hexdigest()
+
+
+def chave_resumo(versao, parametros, inicio, fim, taxa_adm):
+    conteudo = json.dumps({
+        'versao': versao,
+        'resumo': VERSAO_RESUMO,
+        'parametros': parametros,
+        'inicio': str(inicio)[:10],
+        'fim': str(fim)[:10],
+        'taxa_adm': taxa_adm
+    }, sort_keys=True)
+    return hashlib.sha1(conteudo.encode()).hexdigest()
+
+
+def _caminho(chave):
+    return os.path.join(DIRETORIO_RESULTADOS, f'{chave}.json')
+
+
+# Um JSON corrompido ou truncado (gravado fora de gravar(), ou um disco
+# cheio) conta como ausente: o resumo é recalculado
+def ler(chave):
+    try:
+        with open(_caminho(chave), 'r') as json_file:
+            conteudo = json.load(json_file)
+    except (FileNotFoundError, ValueError):
+        metricas.cache('resultados', False)
+        return None
+    metricas.cache('resultados', True)
+    return conteudo
+
+
+def gravar(chave, conteudo):
+    os.makedirs(DIRETORIO_RESULTADOS, exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=DIRETORIO_RESULTADOS, suffix='.tmp')
+    try:
+        with metricas.trecho('resultados.gravar'), os.fdopen(descritor, 'w') as json_file:
+            json.dump(conteudo, json_file, indent=4)
+        os.replace(temporario, _caminho(chave))
+    except BaseException:
+        os.unlink(temporario)
+        raise
+
+
+# Fração do tempo com vol abaixo de LIMITE_VOL (e na banda [VOL_MIN,
+# VOL_MAX]) pelo bootstrap em blocos dos retornos do fundo na janela
+def calcular_resumo(indice, inicio, fim):
+    vol = indice.vol_movel(inicio, fim, ['Fundo'])['Fundo'].bfill()
+    vol_media = vol.mean()
+
+    i, j = indice.janela(inicio, fim)
+    retornos = indice.retornos[i + 1:j + 1, indice.colunas.index('Fundo')]
+    distribuicao = bootstrap_vol.estimar(retornos, LIMITE_VOL, (VOL_MIN, VOL_MAX))
+
+    def percentual(valor):
+        return round(float(valor) * 100, 2)
+
+    retorno_acumulado = indice.retorno_acumulado(inicio, fim, ['Fundo'])['Fundo']
+    return {
+        'retorno acumulado': percentual(retorno_acumulado),
+        'vol_dist': percentual(distribuicao['abaixo']['estimativa']),
+        'vol_dist_intervalo': [percentual(distribuicao['abaixo']['inferior']),
+                               percentual(distribuicao['abaixo']['superior'])],
+        'vol_na_banda': percentual(distribuicao['banda']['estimativa']),
+        'vol_na_banda_intervalo': [percentual(distribuicao['banda']['inferior']),
+                                   percentual(distribuicao['banda']['superior'])],
+        'vol_media': percentual(vol_media),
+        'data_inicial': indice.datas[i].strftime('%Y-%m-%d'),
+        'data_final': indice.datas[j].strftime('%Y-%m-%d'),
+        'taxa_adm': indice.taxa_adm
+    }
+
+
+# Grava o resumo da carteira (por padrão, a padrão) na janela; sem janela,
+# o período completo, que é o que carteiras.resumo procura
+def precalcular(carteira=None, inicio=None, fim=None):
+    if carteira is None:
+        carteira = carteiras.nova_carteira(carteiras.NOME_PADRAO)
+    indice = carteiras.indice(carteira)
+    inicio = indice.datas[0] if inicio is None else inicio
+    fim = indice.datas[-1] if fim is None else fim
+    parametros = carteiras.parametros(carteira)
+    chave = chave_resumo(versao_dataset(carteiras.arquivos_cota(carteira)), parametros, inicio, fim,
+                         carteiras.taxa_adm(carteira))
+    gravar(chave, dict(calcular_resumo(indice, inicio, fim), Parametros=parametros))
+    return chave
+
+
+if __name__ == '__main__':
+    for carteira in carteiras.carregar_registro().values():
+        print(carteira['nome'], _caminho(precalcular(carteira)))
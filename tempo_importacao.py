@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+
+# Relatório de tempo de importação por página do app.
+#
+# Cada página roda num processo novo com `python -X importtime`, pelo
+# AppTest do Streamlit. O que foi importado antes do script do app (o próprio
+# streamlit e o harness de teste) é descontado; o restante é o custo que a
+# página adiciona. O relatório falha (código de saída 1) se uma página
+# importar um módulo proibido ou passar do orçamento em milissegundos. O
+# orçamento depende da máquina e só é cobrado aqui; o teste confere só os
+# módulos proibidos.
+#
+#   python tempo_importacao.py
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'moria.py')
+
+PESADOS = {'pandas', 'numpy', 'scipy', 'matplotlib', 'seaborn', 'plotly', 'pyarrow', 'cvxpy', 'pypfopt', 'sgs'}
+SOLVERS = {'cvxpy', 'pypfopt', 'sgs'}
+
+# O numpy não entra na lista de Home/Equipe: o próprio st.image da barra
+# lateral o importa (junto com o PIL) para processar o logo.
+PAGINAS_ESTATICAS = PESADOS - {'numpy'}
+
+# pagina: (modulos proibidos, orçamento em ms)
+PAGINAS = {
+    'Home': (PAGINAS_ESTATICAS, 250),
+    'Equipe': (PAGINAS_ESTATICAS, 250),
+    'Informação Qualitativa': (SOLVERS | {'matplotlib', 'seaborn', 'scipy'}, 3000),
+    'Resultados Backtest com ETFs': (SOLVERS, 6000),
+}
+
+_CODIGO = """
+import sys
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+sys.stderr.write('@@inicio_app\\n')
+at.run()
+if sys.argv[2] != 'Home':
+    at.sidebar.radio[0].set_value(sys.argv[2]).run()
+sys.stderr.write('@@fim_app\\n')
+"""
+
+
+# Devolve {modulo: tempo próprio em us} importados durante a execução do app
+def medir_pagina(pagina, app=APP):
+    processo = subprocess.run([sys.executable, '-X', 'importtime', '-c', _CODIGO, app, pagina],
+                              capture_output=True, text=True, cwd=os.path.dirname(app))
+    if processo.returncode != 0:
+        raise RuntimeError(processo.stderr.strip().splitlines()[-1])
+
+    modulos = {}
+    dentro = False
+    for linha in processo.stderr.splitlines():
+        if linha.startswith('@@inicio_app'):
+            dentro = True
+        elif linha.startswith('@@fim_app'):
+            break
+        elif dentro and linha.startswith('import time:') and '|' in linha:
+            proprio, _, nome = linha[len('import time:'):].split('|')
+            if proprio.strip().isdigit():
+                modulos[nome.strip()] = int(proprio)
+    return modulos
+
+
+def relatorio(paginas=PAGINAS, app=APP, com_orcamento=True):
+    falhas = []
+    linhas = []
+    for pagina, (proibidos, orcamento_ms) in paginas.items():
+        modulos = medir_pagina(pagina, app)
+        total_ms = sum(modulos.values()) / 1000
+        pacotes = {nome.split('.')[0] for nome in modulos}
+        indevidos = sorted(pacotes & proibidos)
+        pesados = sorted(pacotes & PESADOS)
+        linhas.append(f'{pagina:<32} {total_ms:>9.1f} ms  {len(modulos):>5} módulos  pesados: {", ".join(pesados) or "-"}')
+        if indevidos:
+            falhas.append(f'{pagina}: importou {", ".join(indevidos)}')
+        if com_orcamento and total_ms > orcamento_ms:
+            falhas.append(f'{pagina}: {total_ms:.1f} ms acima do orçamento de {orcamento_ms} ms')
+    return linhas, falhas
+
+
+if __name__ == '__main__':
+    linhas, falhas = relatorio()
+    print('\n'.join(linhas))
+    if falhas:
+        print('\n'.join(['', 'FALHAS:'] + falhas))
+        sys.exit(1)
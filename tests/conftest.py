@@ -0,0 +1,48 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Os módulos do app ficam na raiz do repositório e abrem os arquivos de dados
+# por caminho relativo: os testes importam e rodam de lá.
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+@pytest.fixture(autouse=True)
+def raiz(monkeypatch):
+    monkeypatch.chdir(RAIZ)
+
+
+# Preços sintéticos de 8 ETFs em 500 pregões e históricos de pesos mensais:
+# a carteira de alta vol concentrada, a de baixa vol diversificada
+@pytest.fixture
+def mercado():
+    rng = np.random.default_rng(0)
+    datas = pd.bdate_range('2021-01-04', periods=500, name='Data')
+    ativos = [f'ETF{i}' for i in range(8)]
+    vols = rng.uniform(0.003, 0.02, len(ativos))
+    precos = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0.0003, vols, (len(datas), len(ativos))), axis=0),
+                          index=datas, columns=ativos)
+
+    def pesos(concentracao):
+        linhas = rng.dirichlet(np.full(len(ativos), concentracao), len(datas[::21]))
+        linhas[linhas < 0.05] = 0.0
+        return pd.DataFrame(linhas / linhas.sum(axis=1, keepdims=True), index=datas[::21], columns=ativos)
+
+    return precos, pesos(0.3), pesos(2.0)
+
+
+# Gatilhos nos quantis da vol da carteira de alta vol, para o regime trocar
+# várias vezes no período
+@pytest.fixture
+def parametros(mercado):
+    import motor_backtest
+
+    sinais = motor_backtest.derivar_sinais(motor_backtest.preparar_insumos(*mercado))
+    vol = sinais['vol_sinal'][~np.isnan(sinais['vol_sinal'])]
+    return dict(motor_backtest.PARAMETROS_PADRAO, limite_dias=3,
+                vol_gatilho_subir=float(np.quantile(vol, 0.6)), vol_gatilho_descer=float(np.quantile(vol, 0.4)),
+                concentracao_gatilho_subir=0.9, concentracao_gatilho_descer=0.9)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import atribuicao_risco
+from motor_backtest import DIAS_UTEIS, JANELA_VOL
+
+
+@pytest.fixture
+def carteira(mercado):
+    precos, pesos_alta, _ = mercado
+    retornos = precos.pct_change().fillna(0.0).to_numpy()
+    pesos = pesos_alta.reindex(precos.index, method='ffill').to_numpy()
+    return retornos, pesos
+
+
+# Covariância reestimada do zero com np.cov na janela de cada dia
+@pytest.mark.parametrize('janela, recalibrar', [(JANELA_VOL, 252), (63, 50)])
+def test_contribuicoes_iguais_ao_np_cov(carteira, janela, recalibrar):
+    retornos, pesos = carteira
+    resultado = atribuicao_risco.contribuicoes(retornos, pesos, janela, recalibrar)
+    assert np.isnan(resultado['vol'][:janela]).all()
+    for t in range(janela, len(retornos)):
+        covariancia = np.cov(retornos[t - janela + 1:t + 1].T) * DIAS_UTEIS
+        vol = np.sqrt(pesos[t] @ covariancia @ pesos[t])
+        assert resultado['vol'][t] == pytest.approx(vol, rel=1e-12)
+        np.testing.assert_allclose(resultado['componente'][t], pesos[t] * (covariancia @ pesos[t]) / vol,
+                                   rtol=0, atol=1e-13)
+    np.testing.assert_allclose(resultado['componente'][janela:].sum(axis=1), resultado['vol'][janela:], rtol=1e-12)
+
+
+def test_atribuir_e_na_data(mercado):
+    precos, pesos_alta, _ = mercado
+    resultado = atribuicao_risco.atribuir(precos, pesos_alta)
+    assert resultado['componente'].index.equals(precos.index)
+    assert list(resultado['componente'].columns) == list(pesos_alta.columns)
+    data = precos.index[200]
+    tabela = atribuicao_risco.na_data(resultado, data)
+    np.testing.assert_allclose(tabela['componente'].to_numpy(), resultado['componente'].loc[data].to_numpy())
+    assert tabela['percentual'].sum() == pytest.approx(1.0)
+    assert atribuicao_risco.na_data(resultado, precos.index[0] - np.timedelta64(1, 'D')) is None
@@ -0,0 +1,64 @@
+import json
+import platform
+
+import numpy as np
+import pytest
+
+import benchmarks
+import dados
+
+
+def test_regressoes_com_tolerancia_e_piso():
+    referencia = {'lento': 0.100, 'estavel': 0.100, 'ruido': 0.001, 'novo_na_referencia': 0.5}
+    resultados = {'lento': 0.200, 'estavel': 0.120, 'ruido': 0.0025, 'novo': 1.0}
+    assert benchmarks.regressoes(resultados, referencia) == [('lento', 0.100, 0.200)]
+    assert benchmarks.regressoes(resultados, referencia, tolerancia=0.1) == [('estavel', 0.100, 0.120),
+                                                                            ('lento', 0.100, 0.200)]
+    assert benchmarks.regressoes(resultados, {}) == []
+
+
+def test_curvas_escala():
+    resultados = {'micro.indice.x1': 0.01, 'micro.indice.x10d': 0.1, 'micro.indice.x100d': 1.5,
+                  'pagina.Home.fria.x10d': 2.0}
+    linhas = benchmarks.curvas_escala(resultados)
+    assert len(linhas) == 2
+    assert linhas[0].split()[1:] == ['x10d', '10.0x'] and linhas[1].split()[1:] == ['x100d', '150.0x']
+
+
+# Escalar repete os retornos diários: mesmas colunas nas primeiras posições e
+# a mesma distribuição de retornos
+@pytest.mark.parametrize('escala', [('dias', 3), ('ativos', 3)])
+def test_escalar_niveis(escala):
+    tabela = dados.carregar_comparacao().iloc[:300]
+    escalada = benchmarks.escalar_niveis(tabela, escala)
+    assert list(escalada.columns[:tabela.shape[1]]) == list(tabela.columns)
+    assert escalada.size == 3 * tabela.size and escalada.notna().all().all()
+    originais = benchmarks._log_retornos(tabela)
+    escalados = benchmarks._log_retornos(escalada)
+    assert np.allclose(escalados[:len(tabela), :tabela.shape[1]], originais, atol=1e-12)
+    quantis = [1, 5, 25, 50, 75, 95, 99]
+    assert np.allclose(np.percentile(escalados, quantis), np.percentile(originais, quantis), atol=1e-3)
+
+
+# Execução curta pela linha de comando: a primeira grava o histórico e
+# passa; com uma referência bem mais rápida da mesma máquina, sai com 1
+def test_linha_de_comando_acusa_regressao(tmp_path, capsys):
+    historico = str(tmp_path / 'benchmarks.jsonl')
+    argumentos = ['--escalas', 'dias:1', '--sem-paginas', '--repeticoes', '1', '--historico', historico]
+    assert benchmarks.main(argumentos) == 0
+    (execucao,) = benchmarks.carregar_historico(historico)
+    assert execucao['plataforma'] == platform.platform()
+    assert set(execucao['resultados']) >= {'micro.carregar_csv.x1', 'micro.indice.x1', 'micro.heatmap.x1'}
+    assert 'REGRESSÕES' not in capsys.readouterr().out
+
+    # O mais lento passa do piso de tempo; na referência ele fica instantâneo
+    lento = max(execucao['resultados'], key=execucao['resultados'].get)
+    assert execucao['resultados'][lento] > benchmarks.PISO
+    rapida = dict(execucao, resultados=dict(execucao['resultados'], **{lento: 1e-9}))
+    with open(historico, 'a') as arquivo:
+        arquivo.write(json.dumps(dict(rapida, plataforma='outra máquina')) + '\n')
+        arquivo.write(json.dumps(rapida) + '\n')
+    assert benchmarks.main(argumentos + ['--nao-gravar']) == 1
+    saida = capsys.readouterr().out
+    assert 'REGRESSÕES:' in saida and f'{lento}: 0.00 ms' in saida
+    assert len(benchmarks.carregar_historico(historico)) == 3
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import bootstrap_vol
+
+
+@pytest.fixture
+def retornos():
+    rng = np.random.default_rng(5)
+    # Dois regimes de vol, para a banda não ficar nem vazia nem cheia
+    vols = np.repeat([0.004, 0.009], 300)
+    return rng.normal(0.0003, vols)
+
+
+def test_blocos_com_tamanho_medio():
+    n_dias, n_caminhos, bloco = 1000, 400, 21
+    indices = bootstrap_vol.indices_bootstrap(n_dias, n_caminhos, bloco, 1)
+    # Dentro de um bloco o índice avança um dia (circularmente); cada salto
+    # começa um bloco novo
+    continua = np.diff(indices, axis=1) % n_dias == 1
+    blocos = n_caminhos + (~continua).sum()
+    assert n_dias * n_caminhos / blocos == pytest.approx(bloco, rel=0.03)
+    assert indices.min() >= 0 and indices.max() < n_dias
+
+
+def test_observado_igual_ao_pandas(retornos):
+    resultado = bootstrap_vol.estimar(retornos, n_caminhos=50)
+    vol = pd.Series(np.r_[0.0, retornos]).iloc[1:].rolling(21).std().dropna() * np.sqrt(252)
+    assert resultado['abaixo']['observado'] == pytest.approx((vol < 0.10).mean())
+    assert resultado['banda']['observado'] == pytest.approx(((vol >= 0.05) & (vol <= 0.12)).mean())
+    for nome in ['abaixo', 'banda']:
+        assert resultado[nome]['inferior'] <= resultado[nome]['estimativa'] <= resultado[nome]['superior']
+    assert 0 < resultado['banda']['estimativa'] < 1
+
+
+# Mesma semente, mesmo resultado: de novo, em lotes menores e com o pool
+def test_reprodutivel_com_e_sem_pool(retornos, monkeypatch):
+    monkeypatch.setattr(bootstrap_vol, 'MEMORIA_LOTE', len(retornos) * 8 * 4 * 40)
+    serial = bootstrap_vol.estimar(retornos, n_caminhos=200, semente=7)
+    assert bootstrap_vol.estimar(retornos, n_caminhos=200, semente=7) == serial
+    assert bootstrap_vol.estimar(retornos, n_caminhos=200, semente=7, processos=2) == serial
+    assert bootstrap_vol.estimar(retornos, n_caminhos=200, semente=8) != serial
+
+
+def test_serie_curta():
+    resultado = bootstrap_vol.estimar(np.zeros(10))
+    assert np.isnan(resultado['abaixo']['estimativa']) and np.isnan(resultado['banda']['observado'])
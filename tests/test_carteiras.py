@@ -0,0 +1,124 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import carteiras
+import indice_acumulado
+
+
+@pytest.fixture(autouse=True)
+def cache_vazio():
+    carteiras.limpar_cache()
+    yield
+    carteiras.limpar_cache()
+
+
+def test_registro_padrao_sem_arquivo(tmp_path):
+    registro = carteiras.carregar_registro(str(tmp_path / 'carteiras.json'))
+    assert list(registro) == [carteiras.NOME_PADRAO]
+    assert carteiras.taxa_adm(registro[carteiras.NOME_PADRAO]) == indice_acumulado.TAXA_ADM
+
+
+def test_registro_relido_quando_o_arquivo_muda(tmp_path):
+    caminho = tmp_path / 'carteiras.json'
+    caminho.write_text(json.dumps({'A': {'taxa_adm': 1.0}, 'B': {}}), encoding='utf-8')
+    registro = carteiras.carregar_registro(str(caminho))
+    assert list(registro) == ['A', 'B']
+    assert carteiras.taxa_adm(registro['A']) == 1.0
+    assert carteiras.carregar_registro(str(caminho)) is registro
+
+    caminho.write_text(json.dumps({'C': {'taxa_adm': 0.5}}), encoding='utf-8')
+    estado = os.stat(caminho)
+    os.utime(caminho, ns=(estado.st_atime_ns, estado.st_mtime_ns + 10 ** 9))
+    assert list(carteiras.carregar_registro(str(caminho))) == ['C']
+
+
+def test_campo_desconhecido():
+    with pytest.raises(ValueError, match='taxa'):
+        carteiras.nova_carteira('A', taxa=1.0)
+
+
+def test_lru_respeita_o_orcamento(monkeypatch):
+    monkeypatch.setattr(carteiras, 'ORCAMENTO_BYTES', 3 * 8000)
+    lista = [carteiras.nova_carteira(nome) for nome in 'ABCD']
+    chamadas = []
+
+    def obter(carteira):
+        def construir():
+            chamadas.append(carteira['nome'])
+            return np.zeros(1000)
+        return carteiras._obter(carteira, 'teste', construir)
+
+    for carteira in lista[:3]:
+        obter(carteira)
+    obter(lista[0])
+    assert carteiras.uso_memoria() == {'carteiras': 3, 'resultados': 3, 'bytes': 3 * 8000}
+
+    # A quarta carteira tira a menos usada (B), não a A, que acabou de ser lida
+    obter(lista[3])
+    assert carteiras.uso_memoria()['bytes'] == 3 * 8000
+    obter(lista[0])
+    obter(lista[2])
+    assert chamadas == ['A', 'B', 'C', 'D']
+    obter(lista[1])
+    assert chamadas == ['A', 'B', 'C', 'D', 'B']
+
+
+def test_resultado_acima_do_orcamento_fica_sozinho(monkeypatch):
+    monkeypatch.setattr(carteiras, 'ORCAMENTO_BYTES', 1000)
+    for nome in 'AB':
+        carteiras._obter(carteiras.nova_carteira(nome), 'teste', lambda: np.zeros(1000))
+    assert carteiras.uso_memoria() == {'carteiras': 1, 'resultados': 1, 'bytes': 8000}
+
+
+def test_taxa_da_carteira_no_indice():
+    padrao, cara = carteiras.nova_carteira('A'), carteiras.nova_carteira('B', taxa_adm=2.0)
+    indice, indice_caro = carteiras.indice(padrao), carteiras.indice(cara)
+    inicio, fim = indice.datas[0], indice.datas[-1]
+    assert indice.retorno_acumulado(inicio, fim)['Fundo'] > indice_caro.retorno_acumulado(inicio, fim)['Fundo']
+    assert carteiras.comparacao(padrao) is carteiras.comparacao(cara)
+
+
+# Sem o painel de preços, pesos e parâmetros próprios não têm como entrar na
+# cota: erro em vez da cota das outras carteiras
+@pytest.mark.parametrize('campos', [{'parametros': {'vol_gatilho_subir': 0.11}},
+                                    {'pesos_alta': 'pesos_baixa_vol.csv'}])
+def test_configuracao_sem_painel(tmp_path, campos):
+    carteira = carteiras.nova_carteira('A', precos=str(tmp_path / 'precos.csv'), **campos)
+    with pytest.raises(FileNotFoundError, match='--criar-painel'):
+        carteiras.comparacao(carteira)
+    with pytest.raises(FileNotFoundError, match=list(campos)[0]):
+        carteiras.resumo(carteira)
+
+
+def test_resumo_da_janela():
+    import resultados
+
+    carteira = carteiras.nova_carteira('A')
+    indice = carteiras.indice(carteira)
+    inicio, fim = indice.datas[300], indice.datas[600]
+    janela = carteiras.resumo(carteira, inicio, fim)
+    assert janela == dict(resultados.calcular_resumo(indice, inicio, fim), Parametros=carteiras.parametros(carteira))
+    assert carteiras.resumo(carteira, inicio, fim) is janela
+    assert janela['data_inicial'] == inicio.strftime('%Y-%m-%d')
+    assert carteiras.resumo(carteira)['data_inicial'] == indice.datas[0].strftime('%Y-%m-%d')
+
+
+# Um resumo gravado pela metade no repositório conta como ausente e é
+# recalculado; um gravado inteiro é lido
+def test_resumo_gravado_truncado(tmp_path, monkeypatch):
+    import resultados
+
+    monkeypatch.setattr(resultados, 'DIRETORIO_RESULTADOS', str(tmp_path))
+    carteira = carteiras.nova_carteira('A')
+    chave = resultados.precalcular(carteira)
+    gravado = resultados.ler(chave)
+    assert carteiras.resumo(carteira) == gravado
+
+    caminho = tmp_path / f'{chave}.json'
+    caminho.write_text(caminho.read_text()[:40])
+    assert resultados.ler(chave) is None
+    carteiras.limpar_cache()
+    assert carteiras.resumo(carteira) == gravado
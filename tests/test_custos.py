@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+import custos
+import indice_acumulado
+import motor_backtest
+import varredura
+import walk_forward
+from motor_backtest import ALTA, BAIXA
+
+SPREAD = 0.002
+CORRETAGEM = 0.0005
+IMPACTO = 0.01
+
+
+# Cota líquida dia a dia: a posição deriva com os retornos do dia e, no
+# fechamento, é levada aos pesos alvo da carteira do regime, pagando
+# spread/2 + corretagem sobre o negociado e impacto x negociado^1.5
+def cota_laco(insumos, regime, taxa_adm=0.0):
+    pesos = {ALTA: insumos['alta'], BAIXA: insumos['baixa']}
+    retornos = insumos['retornos']
+    cota = 1.0
+    posicao = np.zeros(len(insumos['ativos']))
+    cotas = []
+    for t in range(len(retornos)):
+        if t > 0:
+            mantidos = pesos[regime[t - 1]][t - 1]
+            retorno = mantidos @ retornos[t]
+            cota *= (1 + retorno) / indice_acumulado.custo_diario(taxa_adm)
+            posicao = mantidos * (1 + retornos[t]) / (1 + retorno)
+        negociado = np.abs(pesos[regime[t]][t] - posicao)
+        cota *= 1 - (negociado.sum() * (SPREAD / 2 + CORRETAGEM) + IMPACTO * (negociado ** 1.5).sum())
+        cotas.append(cota)
+    return np.array(cotas)
+
+
+@pytest.fixture
+def insumos(mercado):
+    return motor_backtest.preparar_insumos(*mercado)
+
+
+def test_cota_liquida_igual_ao_laco(insumos, parametros):
+    sinais = motor_backtest.derivar_sinais(insumos)
+    motor = custos.MotorCustos(insumos, [0.0, SPREAD], corretagem=[0.0, CORRETAGEM], impacto=[0.0, IMPACTO])
+    resultado = custos.avaliar_liquido(sinais, motor, parametros, taxa_adm=0.75)
+
+    bruto = motor_backtest.avaliar(sinais, parametros)
+    assert (resultado['regime'] == bruto['regime']).all()
+    np.testing.assert_allclose(resultado['cota'][1], cota_laco(insumos, resultado['regime'], 0.75), rtol=1e-13)
+    # Sem custos, só a taxa de adm separa a cota líquida da bruta
+    taxa = indice_acumulado.custo_diario(0.75) ** np.arange(len(bruto['cota']))
+    np.testing.assert_allclose(resultado['cota'][0], bruto['cota'] / taxa, rtol=1e-13)
+    assert resultado['custo_total'][0] == 0 and resultado['custo_total'][1] > 0
+
+
+def test_giro_igual_a_metade_do_negociado(insumos, parametros):
+    sinais = motor_backtest.derivar_sinais(insumos)
+    regime = motor_backtest.avaliar(sinais, parametros)['regime']
+    motor = custos.MotorCustos(insumos, 0.0)
+    pesos = {ALTA: insumos['alta'], BAIXA: insumos['baixa']}
+    posicao = np.zeros(len(insumos['ativos']))
+    esperado = []
+    for t in range(len(regime)):
+        if t > 0:
+            mantidos = pesos[regime[t - 1]][t - 1]
+            posicao = mantidos * (1 + insumos['retornos'][t]) / (1 + mantidos @ insumos['retornos'][t])
+        esperado.append(np.abs(pesos[regime[t]][t] - posicao).sum() / 2)
+    np.testing.assert_allclose(motor.giro_diario(regime), esperado, rtol=0, atol=1e-15)
+
+
+def test_custos_por_ativo_e_cenarios(insumos):
+    ativos = insumos['ativos']
+    matriz = custos.matriz_custos(ativos, [0.001, {ativos[0]: 0.003}])
+    assert matriz.shape == (2, len(ativos))
+    assert (matriz[0] == 0.001).all() and matriz[1, 0] == 0.003 and (matriz[1, 1:] == 0).all()
+    with pytest.raises(ValueError, match='mesmo número de cenários'):
+        custos.MotorCustos(insumos, [0.001, 0.002], impacto=[0.0, 0.0, 0.0])
+    with pytest.raises(ValueError, match='mesmo número de cenários'):
+        custos.MotorCustos(insumos, [0.001, 0.002], corretagem=[0.0, 0.0, 0.0])
+
+
+def test_varredura_com_custos_igual_ao_avaliar_liquido(insumos, parametros):
+    custos_negociacao = {'spread': SPREAD, 'corretagem': CORRETAGEM, 'impacto': IMPACTO}
+    combinacoes, _ = varredura.gerar_grade({'limite_dias': [3, 8], 'vol_gatilho_subir': [0.10, 0.14]}, parametros)
+    metricas = varredura.executar_varredura(insumos, combinacoes, processos=1, custos_negociacao=custos_negociacao)
+    assert metricas.shape == (len(combinacoes), len(varredura.nomes_metricas(True)))
+
+    sinais = motor_backtest.derivar_sinais(insumos)
+    motor = custos.MotorCustos(insumos, **custos_negociacao)
+    coluna = varredura.nomes_metricas(True).index
+    for valores, linha in zip(combinacoes, metricas):
+        esperado = custos.avaliar_liquido(sinais, motor, dict(zip(varredura.NOMES_PARAMETROS, valores)))
+        assert linha[coluna('retorno_liquido')] == pytest.approx(esperado['retorno_acumulado'][0], rel=1e-5)
+        assert linha[coluna('custo_total')] == pytest.approx(esperado['custo_total'][0], rel=1e-5)
+        assert linha[coluna('giro_anual')] == pytest.approx(esperado['giro_anual'], rel=1e-5)
+
+
+# O teste de uma dobra, líquido de custos, é o trecho da cota líquida do
+# período inteiro que cai no teste
+def test_dobra_com_custos_igual_ao_trecho_da_cota_liquida(insumos, parametros):
+    sinais = motor_backtest.derivar_sinais(insumos)
+    motor = custos.MotorCustos(insumos, SPREAD, CORRETAGEM, IMPACTO)
+    candidatos = np.array([[parametros[nome] for nome in varredura.NOMES_PARAMETROS]])
+    dobra = (100, 300, 420)
+    resultado = walk_forward.executar_dobra(sinais, dobra, candidatos, 'retorno_liquido', motor_custos=motor)
+
+    inicio, fim = dobra[0], dobra[2]
+    recorte = {nome: valores[inicio:fim] for nome, valores in insumos.items() if nome not in ('datas', 'ativos')}
+    recorte.update(ativos=insumos['ativos'], datas=insumos['datas'][inicio:fim])
+    cota = custos.MotorCustos(recorte, SPREAD, CORRETAGEM, IMPACTO)
+    regime = motor_backtest.calcular_regime(sinais['vol_sinal'][inicio:fim], sinais['concentracao'][inicio:fim],
+                                            parametros)
+    # O recorte começa em caixa, então só o custo do primeiro dia difere; o
+    # teste começa depois dele
+    liquida = cota.cota_liquida(motor_backtest.retorno_fundo(walk_forward._recortar(sinais, inicio, fim), regime),
+                                regime)[0]
+    teste = dobra[1] - inicio
+    assert resultado['teste']['retorno_liquido'] == pytest.approx(liquida[-1] / liquida[teste - 1] - 1, rel=1e-12)
+    np.testing.assert_allclose(np.cumprod(1 + resultado['retornos_liquidos']), liquida[teste:] / liquida[teste - 1],
+                               rtol=1e-12)
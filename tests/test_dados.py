@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dados
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(dados, 'DIRETORIO_CACHE', str(tmp_path / 'cache'))
+    dados.limpar_cache()
+    yield tmp_path / 'cache'
+    dados.limpar_cache()
+
+
+def tabela(n=30, semente=0):
+    datas = pd.bdate_range('2024-01-01', periods=n)
+    valores = np.random.default_rng(semente).random((n, 3))
+    return pd.DataFrame(valores, index=datas.rename('Data'), columns=['A', 'B', 'C'])
+
+
+def gravar(caminho, valores, mtime_ns=None):
+    valores.to_csv(caminho)
+    if mtime_ns is not None:
+        os.utime(caminho, ns=(mtime_ns, mtime_ns))
+
+
+# Só o mtime mudou: o hash confere e não relê; com conteúdo novo, relê
+def test_invalidacao_por_mtime_e_hash(cache, tmp_path):
+    caminho = str(tmp_path / 'painel.csv')
+    gravar(caminho, tabela(), 10 ** 18)
+    primeira = dados.carregar_tabela(caminho)
+
+    os.utime(caminho, ns=(2 * 10 ** 18, 2 * 10 ** 18))
+    assert dados.carregar_tabela(caminho) is primeira
+
+    gravar(caminho, tabela(semente=1), 3 * 10 ** 18)
+    nova = dados.carregar_tabela(caminho)
+    assert nova is not primeira
+    pd.testing.assert_frame_equal(nova, tabela(semente=1), check_freq=False)
+
+
+@pytest.mark.parametrize('leitor', [dados.carregar_tabela, dados.carregar_tabela_mapeada])
+def test_espelho_igual_ao_csv(cache, tmp_path, monkeypatch, leitor):
+    caminho = str(tmp_path / 'painel.csv')
+    valores = tabela()
+    # Data repetida: fica a última linha
+    pd.concat([valores.iloc[:5], valores.iloc[[4]] * 2, valores.iloc[5:]]).to_csv(caminho)
+    esperado = valores.copy()
+    esperado.iloc[4] *= 2
+
+    monkeypatch.setattr(dados, 'PARQUET_DISPONIVEL', False)
+    pd.testing.assert_frame_equal(dados.carregar_tabela(caminho), esperado, check_freq=False)
+    monkeypatch.setattr(dados, 'PARQUET_DISPONIVEL', True)
+    dados.limpar_cache()
+    gravado = leitor(caminho)
+    dados.limpar_cache()
+    relido = leitor(caminho)
+    assert os.listdir(cache)
+    pd.testing.assert_frame_equal(gravado, esperado, check_freq=False)
+    pd.testing.assert_frame_equal(relido, esperado, check_freq=False)
+
+
+# Uma versão nova do arquivo grava um espelho novo mapeado e apaga o antigo;
+# quem ainda tem a versão antiga continua lendo dela
+def test_mapeado_relido_com_versao_nova(cache, tmp_path):
+    caminho = str(tmp_path / 'painel.csv')
+    gravar(caminho, tabela())
+    antiga = dados.carregar_tabela_mapeada(caminho)
+    assert not antiga.to_numpy().flags.writeable
+    with pytest.raises(ValueError):
+        antiga.iloc[0, 0] = 1.0
+
+    gravar(caminho, tabela(40, semente=2), os.stat(caminho).st_mtime_ns + 10 ** 9)
+    nova = dados.carregar_tabela_mapeada(caminho)
+    pd.testing.assert_frame_equal(nova, tabela(40, semente=2), check_freq=False)
+    pd.testing.assert_frame_equal(antiga, tabela(), check_freq=False)
+    assert len([a for a in os.listdir(cache) if a.endswith('.valores.npy')]) == 1
+
+
+# Só saem os espelhos gravados antes do atual; o de outro processo, mais novo,
+# fica. Se um espelho some entre o exists e o load, ele é gravado de novo.
+def test_poda_e_espelho_apagado(cache, tmp_path):
+    caminho = str(tmp_path / 'painel.csv')
+    gravar(caminho, tabela())
+    os.makedirs(cache)
+    antigo = cache / 'painel-0000000000000000-v2.valores.npy'
+    novo = cache / 'painel-ffffffffffffffff-v2.valores.npy'
+    for arquivo, segundos in ((antigo, 1), (novo, 4 * 10 ** 9)):
+        arquivo.write_bytes(b'')
+        os.utime(arquivo, (segundos, segundos))
+    dados.carregar_tabela_mapeada(caminho)
+    assert not antigo.exists() and novo.exists()
+
+    dados.limpar_cache()
+    indice = [a for a in os.listdir(cache) if a.endswith('.indice.npy')][0]
+    os.remove(cache / indice)
+    pd.testing.assert_frame_equal(dados.carregar_tabela_mapeada(caminho), tabela(), check_freq=False)
+    assert (cache / indice).exists()
+
+
+def test_cache_limitado(cache, tmp_path, monkeypatch):
+    monkeypatch.setattr(dados, 'LIMITE_ENTRADAS', 2)
+    caminhos = [str(tmp_path / f'painel{i}.csv') for i in range(3)]
+    for i, caminho in enumerate(caminhos):
+        gravar(caminho, tabela(semente=i))
+    primeira = dados.carregar_tabela(caminhos[0])
+    dados.carregar_tabela(caminhos[1])
+    # Usar a primeira de novo a deixa como a mais recente; sai a segunda
+    assert dados.carregar_tabela(caminhos[0]) is primeira
+    dados.carregar_tabela(caminhos[2])
+    assert [chave[0] for chave in dados._cache] == [caminhos[0], caminhos[2]]
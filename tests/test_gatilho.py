@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+import gatilho
+import motor_backtest
+
+
+def test_avaliador_diario_igual_ao_motor(mercado, parametros):
+    precos, pesos_alta, pesos_baixa = mercado
+    backtest = motor_backtest.executar_backtest(precos, pesos_alta, pesos_baixa, parametros)
+    avaliador = gatilho.AvaliadorDiario(pesos_alta, pesos_baixa, parametros)
+    saidas = [avaliador.novo_dia(data, precos.loc[data]) for data in precos.index]
+
+    regime = np.array([saida['regime'] for saida in saidas])
+    vol = np.array([saida['vol'] for saida in saidas])
+    assert (regime == backtest['Regime'].to_numpy()).all()
+    assert sum(saida['mudou'] for saida in saidas) > 0
+    np.testing.assert_allclose(vol, backtest['Vol Sinal'].to_numpy(), rtol=0, atol=1e-12)
+
+    # Os pesos alvo são os da carteira que o motor aplica no pregão seguinte
+    insumos = motor_backtest.preparar_insumos(precos, pesos_alta, pesos_baixa)
+    alvo = np.where(regime[:, None] == motor_backtest.ALTA, insumos['alta'], insumos['baixa'])
+    np.testing.assert_allclose(np.array([saida['pesos'].to_numpy() for saida in saidas]), alvo, rtol=0, atol=1e-15)
+    # e o retorno do fundo é o do motor, com a carteira escolhida na véspera
+    retorno = motor_backtest.retorno_fundo(motor_backtest.derivar_sinais(insumos), regime)
+    np.testing.assert_allclose([saida['retorno_fundo'] for saida in saidas], retorno, rtol=0, atol=1e-15)
+
+
+def test_previa_nao_altera_o_estado(mercado, parametros):
+    precos, pesos_alta, pesos_baixa = mercado
+    avaliador = gatilho.AvaliadorDiario(pesos_alta, pesos_baixa, parametros)
+    for data in precos.index[:-1]:
+        avaliador.novo_dia(data, precos.loc[data])
+    dia = avaliador.gatilho.dia
+    previa = avaliador.previa(precos.index[-1], precos.iloc[-1])
+    assert avaliador.gatilho.dia == dia
+    assert previa['regime'] == avaliador.novo_dia(precos.index[-1], precos.iloc[-1])['regime']
+
+
+def test_varias_carteiras_iguais_ao_motor(parametros):
+    rng = np.random.default_rng(1)
+    n = 50
+    retornos = rng.normal(0, rng.uniform(0.002, 0.015, n), (600, n))
+    retornos[0] = 0
+    concentracao = rng.uniform(0.2, 0.7, (600, n))
+    parametros = dict(parametros, vol_gatilho_subir=0.13, vol_gatilho_descer=0.07, concentracao_gatilho_subir=0.65)
+
+    estado = gatilho.Gatilho(n, parametros)
+    saidas = [estado.avancar(retornos[t], concentracao[t]) for t in range(len(retornos))]
+    regime = np.array([saida['regime'] for saida in saidas])
+    vol = np.array([saida['vol'] for saida in saidas])
+
+    esperada = motor_backtest.volatilidade_movel(retornos)
+    np.testing.assert_allclose(vol, esperada, rtol=0, atol=1e-12)
+    for j in range(n):
+        assert (regime[:, j] == motor_backtest.calcular_regime(esperada[:, j], concentracao[:, j], parametros)).all()
+    assert regime.std(axis=0).mean() > 0
+
+
+def test_carteira_de_baixa_com_ativo_fora_da_de_alta(mercado):
+    _, pesos_alta, pesos_baixa = mercado
+    with pytest.raises(ValueError, match='fora da carteira de alta vol'):
+        gatilho.AvaliadorDiario(pesos_alta.drop(columns='ETF3'), pesos_baixa)
@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import carteiras
+import dados
+import graficos
+
+
+@pytest.fixture(autouse=True)
+def cache_vazio():
+    graficos.limpar_cache()
+    yield
+    graficos.limpar_cache()
+
+
+# Acima do orçamento saem as menos usadas; uma leitura renova a figura
+def test_lru_limitado_por_bytes(monkeypatch):
+    monkeypatch.setattr(graficos, 'MAXIMO_BYTES', 10)
+    construidas = []
+
+    def figura(nome):
+        def construir():
+            construidas.append(nome)
+            return nome.encode() * 4
+        return graficos.obter(nome, construir)
+
+    figura('a')
+    figura('b')
+    assert figura('a') == b'aaaa' and construidas == ['a', 'b']
+    figura('c')
+    assert list(graficos._cache) == ['a', 'c'] and graficos._bytes == 8
+    figura('b')
+    assert construidas == ['a', 'b', 'c', 'b']
+    assert list(graficos._cache) == ['c', 'b']
+
+
+# A mais recente fica mesmo sozinha acima do orçamento
+def test_figura_acima_do_orcamento_fica_sozinha(monkeypatch):
+    monkeypatch.setattr(graficos, 'MAXIMO_BYTES', 10)
+    graficos.obter('a', lambda: b'a' * 4)
+    graficos.obter('grande', lambda: b'g' * 50)
+    assert list(graficos._cache) == ['grande'] and graficos._bytes == 50
+
+
+def test_chave_pelos_dados_e_parametros():
+    serie = pd.Series(np.linspace(0, 1, 20), index=pd.bdate_range('2024-01-01', periods=20), name='Fundo')
+    assert graficos.chave('histograma', serie, bins=80) == graficos.chave('histograma', serie.copy(), bins=80)
+    assert graficos.chave('histograma', serie, bins=80) != graficos.chave('histograma', serie, bins=40)
+    assert graficos.chave('histograma', serie, bins=80) != graficos.chave('histograma', serie.iloc[1:], bins=80)
+    assert graficos.chave('histograma', serie, bins=80) != graficos.chave('histograma', serie.rename('CDI'), bins=80)
+
+
+# As figuras Plotly das páginas são chaveadas pela versão do índice: uma
+# versão nova dos arquivos da carteira troca a chave, a mesma versão a mantém
+def test_chave_muda_com_a_versao_do_indice(tmp_path):
+    quali = tmp_path / 'quali.json'
+    shutil.copy(dados.ARQUIVO_QUALI, quali)
+    carteira = carteiras.nova_carteira('A', quali=str(quali))
+    carteiras.limpar_cache()
+    try:
+        indice = carteiras.indice(carteira)
+        janela = dict(indice=indice.versao, inicio='2021-01-04', fim='2022-12-30')
+        assert indice.versao is not None
+        assert graficos.chave('vol', **janela) == graficos.chave('vol', **dict(janela, indice=carteiras.indice(carteira).versao))
+
+        with open(quali, encoding='utf-8') as json_file:
+            conteudo = json.load(json_file)
+        quali.write_text(json.dumps(conteudo), encoding='utf-8')
+        estado = os.stat(quali)
+        os.utime(quali, ns=(estado.st_atime_ns, estado.st_mtime_ns + 10 ** 9))
+        nova = carteiras.indice(carteira)
+        assert nova.versao != indice.versao
+        assert graficos.chave('vol', **janela) != graficos.chave('vol', **dict(janela, indice=nova.versao))
+    finally:
+        carteiras.limpar_cache()
+
+
+def test_plotly_servida_do_cache():
+    go = pytest.importorskip('plotly.graph_objects')
+    construidas = []
+
+    def construir():
+        construidas.append(1)
+        return go.Figure(go.Scatter(x=[1, 2, 3], y=[3, 1, 2]))
+
+    primeira = graficos.plotly('linha', construir)
+    segunda = graficos.plotly('linha', construir)
+    assert len(construidas) == 1
+    assert list(primeira.data[0].y) == list(segunda.data[0].y) == [3, 1, 2]
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dados
+import indice_acumulado
+
+JANELAS = [('2019-10-10', '2025-10-31'), ('2021-03-15', '2023-07-20')]
+
+
+@pytest.fixture(scope='module')
+def comparacao():
+    return dados.carregar_comparacao()
+
+
+# O cálculo da página de backtest antes do índice: recorte, rebase,
+# taxa de adm na cota do fundo e agregações do pandas
+def referencia(comparacao, inicio, fim, taxa_adm):
+    recorte = comparacao.loc[inicio:fim]
+    recorte = recorte / recorte.iloc[0]
+    custo = indice_acumulado.custo_diario(taxa_adm)
+    recorte['Fundo'] = ((1 + recorte['Fundo'].pct_change()) / custo).fillna(1).cumprod()
+    return recorte.ffill()
+
+
+@pytest.mark.parametrize('inicio, fim', JANELAS)
+def test_curva_e_retorno_acumulado(comparacao, inicio, fim):
+    esperado = referencia(comparacao, inicio, fim, 0.75)
+    indice = indice_acumulado.IndiceAcumulado(comparacao, 0.75)
+    np.testing.assert_allclose(indice.curva(inicio, fim).to_numpy(), esperado.to_numpy(), rtol=1e-12)
+    np.testing.assert_allclose(indice.retorno_acumulado(inicio, fim).to_numpy(), esperado.iloc[-1].to_numpy(),
+                               rtol=1e-12)
+
+
+@pytest.mark.parametrize('inicio, fim', JANELAS)
+def test_retornos_anuais(comparacao, inicio, fim):
+    esperado = referencia(comparacao, inicio, fim, 0.75)
+    por_ano = esperado.groupby(esperado.index.year).agg(lambda serie: serie.iloc[-1] / serie.iloc[0] - 1)
+    anuais = indice_acumulado.IndiceAcumulado(comparacao, 0.75).retornos_anuais(inicio, fim, ['Fundo', 'CDI'])
+    np.testing.assert_allclose(anuais.to_numpy(), por_ano[['Fundo', 'CDI']].to_numpy(), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('inicio, fim', JANELAS)
+def test_excesso_mensal(comparacao, inicio, fim):
+    esperado = referencia(comparacao, inicio, fim, 0.75)[['CDI', 'Fundo']]
+    medias = esperado.groupby([esperado.index.year.rename('Ano'), esperado.index.month.rename('Mes')]).mean()
+    variacao = medias.pct_change().dropna()
+    diferenca = ((1 + variacao['Fundo']) / (1 + variacao['CDI']) - 1).rename('Diff')
+    tabela = pd.pivot_table(pd.DataFrame(diferenca), index='Mes', columns='Ano', values='Diff')
+    tabela = tabela.reindex(range(1, 13)).fillna(0)
+
+    excesso = indice_acumulado.IndiceAcumulado(comparacao, 0.75).excesso_mensal(inicio, fim)
+    np.testing.assert_allclose(excesso.to_numpy(), tabela.to_numpy(), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('inicio, fim', JANELAS)
+def test_vol_movel(comparacao, inicio, fim):
+    esperado = referencia(comparacao, inicio, fim, 0.75)['Fundo']
+    esperado = esperado.pct_change().rolling(21).std() * np.sqrt(252)
+    vol = indice_acumulado.IndiceAcumulado(comparacao, 0.75).vol_movel(inicio, fim, ['Fundo'])['Fundo']
+    assert (vol.isna() == esperado.isna()).all()
+    np.testing.assert_allclose(vol.dropna().to_numpy(), esperado.dropna().to_numpy(), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('inicio, fim', JANELAS)
+def test_excesso_anual(comparacao, inicio, fim):
+    esperado = referencia(comparacao, inicio, fim, 0.75)
+    por_ano = esperado.groupby(esperado.index.year).agg(lambda serie: serie.iloc[-1] / serie.iloc[0] - 1)
+    excesso = indice_acumulado.IndiceAcumulado(comparacao, 0.75).excesso_anual(inicio, fim, 'CDI', ['Fundo', 'IBOV'])
+    esperado = (1 + por_ano[['Fundo', 'IBOV']]).div(1 + por_ano['CDI'], axis=0) - 1
+    np.testing.assert_allclose(excesso.to_numpy(), esperado.to_numpy(), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('inicio, fim', JANELAS)
+def test_drawdown(comparacao, inicio, fim):
+    esperado = referencia(comparacao, inicio, fim, 0.75)[['Fundo', 'CDI', 'IBOV']]
+    esperado = esperado / esperado.cummax() - 1
+    drawdown = indice_acumulado.IndiceAcumulado(comparacao, 0.75).drawdown(inicio, fim, ['Fundo', 'CDI', 'IBOV'])
+    np.testing.assert_allclose(drawdown.to_numpy(), esperado.to_numpy(), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('inicio, fim', JANELAS)
+def test_sharpe_movel(comparacao, inicio, fim):
+    retornos = referencia(comparacao, inicio, fim, 0.75).pct_change()
+    excedente = retornos['Fundo'] - retornos['CDI']
+    esperado = excedente.rolling(21).mean() / excedente.rolling(21).std() * np.sqrt(252)
+    sharpe = indice_acumulado.IndiceAcumulado(comparacao, 0.75).sharpe_movel(inicio, fim, 'CDI', ['Fundo'])['Fundo']
+    assert (sharpe.isna() == esperado.isna()).all()
+    np.testing.assert_allclose(sharpe.dropna().to_numpy(), esperado.dropna().to_numpy(), rtol=1e-9)
@@ -0,0 +1,146 @@
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dados
+import gatilho
+import ingestao
+import motor_backtest
+
+CORTE = pd.Timestamp('2025-09-15')
+
+
+# Cópia dos arquivos do app num diretório temporário, com um painel de
+# preços sintético nas datas da comparação e uma fonte local (preços e
+# séries do SGS) que reproduz o histórico completo
+@pytest.fixture
+def historico(tmp_path, monkeypatch):
+    for arquivo in [dados.ARQUIVO_COMPARACAO, dados.ARQUIVO_QUALI,
+                    motor_backtest.ARQUIVO_PESOS_ALTA, motor_backtest.ARQUIVO_PESOS_BAIXA]:
+        shutil.copy(arquivo, tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    comparacao = pd.read_csv(dados.ARQUIVO_COMPARACAO, index_col=0, parse_dates=True)
+    comparacao = comparacao[~comparacao.index.duplicated()]
+    pesos_alta = motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_ALTA)
+    pesos_baixa = motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_BAIXA)
+    ativos = list(dict.fromkeys(list(pesos_alta.columns) + list(pesos_baixa.columns)))
+    rng = np.random.default_rng(0)
+    vols = rng.uniform(0.002, 0.02, len(ativos))
+    precos = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0.0003, vols, (len(comparacao), len(ativos))), axis=0),
+                          index=comparacao.index, columns=ativos)
+    precos.index.name = 'Data'
+
+    (tmp_path / 'fonte').mkdir()
+    pd.concat([comparacao.drop(columns=ingestao.CALCULADAS), precos], axis=1).to_csv('fonte/precos.csv')
+    cdi = comparacao['CDI'].pct_change() * 100
+    cdi.iloc[0] = 0.02
+    pd.DataFrame({'valor': cdi}).to_csv('fonte/sgs_12.csv')
+    meses = pd.date_range('2019-09-01', '2025-10-01', freq='MS', name='Data')
+    pd.DataFrame({'valor': rng.uniform(0.1, 0.6, len(meses))}, index=meses).to_csv('fonte/sgs_433.csv')
+    return comparacao, precos
+
+
+# Painéis cortados em CORTE, com a cota do fundo calculada pelo motor sobre
+# o histórico completo, que é devolvido
+def cortar(comparacao, precos, parametros):
+    completo = motor_backtest.executar_backtest(precos, motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_ALTA),
+                                                motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_BAIXA),
+                                                parametros)
+    precos.loc[:CORTE].to_csv(motor_backtest.ARQUIVO_PRECOS, lineterminator='\r\n')
+    cortada = comparacao.loc[:CORTE].copy()
+    cota = completo['Fundo'].reindex(cortada.index, method='ffill')
+    cortada['Fundo'] = (cota / cota.iloc[0]).to_numpy()
+    cortada.to_csv(dados.ARQUIVO_COMPARACAO, lineterminator='\r\n')
+    return completo
+
+
+def test_ingestao_incremental_igual_ao_historico_completo(historico):
+    comparacao, precos = historico
+    parametros = motor_backtest.carregar_parametros()
+    completo = cortar(comparacao, precos, parametros)
+
+    chamadas = []
+
+    class Fonte(ingestao.FonteArquivo):
+        def serie(self, codigo, inicio, fim):
+            chamadas.append(codigo)
+            return super().serie(codigo, inicio, fim)
+
+    fonte = Fonte('fonte')
+    assert ingestao.atualizar(fonte, fonte, hoje='2025-10-10', parametros=parametros) > 0
+    # No mesmo dia as séries não são consultadas de novo
+    assert ingestao.atualizar(fonte, fonte, hoje='2025-10-10', parametros=parametros) == 0
+    assert len(chamadas) == 2
+    ingestao.atualizar(fonte, fonte, hoje='2025-10-31', parametros=parametros)
+
+    atualizada = pd.read_csv(dados.ARQUIVO_COMPARACAO, index_col=0, parse_dates=True)
+    assert atualizada.index.equals(comparacao.index)
+    mercado = [coluna for coluna in comparacao.columns if coluna not in ingestao.CALCULADAS + ['Fundo']]
+    np.testing.assert_allclose(atualizada[mercado].to_numpy(), comparacao[mercado].to_numpy(), rtol=1e-12)
+    np.testing.assert_allclose(atualizada['CDI'].to_numpy(), comparacao['CDI'].to_numpy(), rtol=1e-12)
+    esperado = completo['Fundo'] / completo['Fundo'].iloc[0]
+    np.testing.assert_allclose(atualizada['Fundo'].to_numpy(), esperado.reindex(atualizada.index).to_numpy(),
+                               rtol=1e-12)
+
+    painel = pd.read_csv(motor_backtest.ARQUIVO_PRECOS, index_col=0, parse_dates=True)
+    np.testing.assert_allclose(painel.to_numpy(), precos.to_numpy(), rtol=1e-12)
+    assert open(motor_backtest.ARQUIVO_PRECOS, 'rb').read().count(b'\r\n') == len(painel) + 1
+
+
+# Os pregões novos passam pelo avaliador do gatilho, montado sobre o
+# histórico só na primeira ingestão e retomado do arquivo nas seguintes;
+# parâmetros novos ou um arquivo ilegível o refazem
+def test_gatilho_na_ingestao(historico, monkeypatch):
+    comparacao, precos = historico
+    parametros = motor_backtest.carregar_parametros()
+    completo = cortar(comparacao, precos, parametros)
+    montados = []
+    iniciar = gatilho.AvaliadorDiario.__init__
+
+    def contar(self, *args, **kwargs):
+        montados.append(1)
+        iniciar(self, *args, **kwargs)
+    monkeypatch.setattr(gatilho.AvaliadorDiario, '__init__', contar)
+
+    fonte = ingestao.FonteArquivo('fonte')
+    ingestao.atualizar(fonte, fonte, hoje='2025-10-10', parametros=parametros)
+    anterior = pd.Timestamp(ingestao.carregar_estado()['regime']['data'])
+    ingestao.atualizar(fonte, fonte, hoje='2025-10-31', parametros=parametros)
+    assert len(montados) == 1
+
+    regime = ingestao.carregar_estado()['regime']
+    assert regime['data'] == f'{precos.index[-1]:%Y-%m-%d}'
+    assert regime['valor'] == completo['Regime'].iloc[-1]
+    np.testing.assert_allclose(regime['vol'], completo['Vol Sinal'].iloc[-1], rtol=1e-10)
+    mudou = completo['Regime'].diff().fillna(0) != 0
+    assert regime['mudancas'] == [f'{data:%Y-%m-%d}' for data in completo.index[mudou & (completo.index > anterior)]]
+    pesos_alta = motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_ALTA)
+    pesos_baixa = motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_BAIXA)
+    insumos = motor_backtest.preparar_insumos(precos, pesos_alta, pesos_baixa)
+    alvo = insumos['alta' if regime['valor'] == motor_backtest.ALTA else 'baixa'][-1]
+    assert regime['pesos'] == {ativo: peso for ativo, peso in zip(insumos['ativos'], alvo) if peso != 0}
+
+    painel = motor_backtest.carregar_precos()
+    versao_pesos = [dados.versao(motor_backtest.ARQUIVO_PESOS_ALTA), dados.versao(motor_backtest.ARQUIVO_PESOS_BAIXA)]
+    avaliador = ingestao.avaliador_gravado(painel, pesos_alta, pesos_baixa, parametros, versao_pesos)
+    assert len(montados) == 1 and avaliador.data == painel.index[-1]
+    outros = dict(parametros, limite_dias=parametros['limite_dias'] + 1)
+    assert ingestao.avaliador_gravado(painel, pesos_alta, pesos_baixa, outros, versao_pesos).gatilho.parametros == outros
+    with open(ingestao.ARQUIVO_GATILHO, 'wb') as arquivo:
+        arquivo.write(b'truncado')
+    avaliador = ingestao.avaliador_gravado(painel, pesos_alta, pesos_baixa, parametros, versao_pesos)
+    assert len(montados) == 3 and avaliador.gatilho.regime[0] == completo['Regime'].iloc[-1]
+
+
+def test_criar_painel(historico):
+    _, precos = historico
+    fonte = ingestao.FonteArquivo('fonte')
+    assert ingestao.criar_painel(fonte) == len(precos)
+    painel = motor_backtest.carregar_precos()
+    assert list(painel.columns) == list(precos.columns)
+    np.testing.assert_allclose(painel.to_numpy(), precos.to_numpy(), rtol=1e-12)
+    with pytest.raises(ValueError, match='já existe'):
+        ingestao.criar_painel(fonte)
@@ -0,0 +1,111 @@
+import os
+import re
+import time
+import urllib.request
+
+import pytest
+
+import metricas
+
+
+@pytest.fixture(autouse=True)
+def registro_limpo():
+    metricas.limpar()
+    yield
+    metricas.limpar()
+
+
+def test_resumo_com_percentis_e_taxa_de_acerto():
+    for ms in range(1, 101):
+        metricas.registrar('pagina', ms / 1000)
+    metricas.cache('dados', True)
+    metricas.cache('dados', True)
+    metricas.cache('dados', False)
+    metricas.contar('bytes_lidos', 2048)
+
+    fotografia = metricas.resumo()
+    trecho = fotografia['trechos']['pagina']
+    assert trecho['contagem'] == 100
+    assert trecho['soma'] == pytest.approx(5.05)
+    # Percentil pelo posto mais próximo acima: posições 50 e 95 de 0 a 99
+    assert trecho['p50'] == pytest.approx(0.051)
+    assert trecho['p95'] == pytest.approx(0.096)
+    assert trecho['maximo'] == pytest.approx(0.100)
+    assert fotografia['caches']['dados'] == {'acertos': 2, 'faltas': 1, 'taxa_acerto': pytest.approx(2 / 3)}
+    assert fotografia['contadores']['bytes_lidos'] == 2048
+
+
+# Só as últimas AMOSTRAS_TRECHO medições entram nos percentis; contagem e
+# soma são de todas
+def test_percentis_das_ultimas_amostras():
+    for _ in range(metricas.AMOSTRAS_TRECHO):
+        metricas.registrar('etapa', 1.0)
+    for _ in range(metricas.AMOSTRAS_TRECHO):
+        metricas.registrar('etapa', 0.001)
+    trecho = metricas.resumo()['trechos']['etapa']
+    assert trecho['contagem'] == 2 * metricas.AMOSTRAS_TRECHO
+    assert trecho['maximo'] == 0.001
+
+
+def test_formato_prometheus():
+    metricas.registrar('pagina."Home"', 0.25)
+    metricas.cache('graficos', False)
+    texto = metricas.prometheus()
+    assert texto.endswith('\n')
+    amostra = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_]+="(\\.|[^"\\])*"(,[a-zA-Z_]+="(\\.|[^"\\])*")*\})? \S+$')
+    for linha in texto.splitlines():
+        assert linha.startswith('# TYPE ') or amostra.match(linha), linha
+    assert 'moria_trecho_segundos{trecho="pagina.\\"Home\\"",quantile="0.5"} 0.250000' in texto
+    assert 'moria_trecho_segundos_count{trecho="pagina.\\"Home\\""} 1' in texto
+    assert '# TYPE moria_cache_graficos_faltas_total counter\nmoria_cache_graficos_faltas_total 1\n' in texto
+
+
+# Cada etapa fecha a anterior; o fim fecha a última
+def test_cronometro(monkeypatch):
+    relogio = iter([10.0, 10.5, 12.0])
+    monkeypatch.setattr(metricas.time, 'perf_counter', lambda: next(relogio))
+    cronometro = metricas.Cronometro('pagina')
+    cronometro.etapa('dados')
+    cronometro.etapa('grafico')
+    cronometro.fim()
+    trechos = metricas.resumo()['trechos']
+    assert set(trechos) == {'pagina.dados', 'pagina.grafico'}
+    assert trechos['pagina.dados']['soma'] == 0.5 and trechos['pagina.grafico']['soma'] == 1.5
+
+
+def test_perfilar_grava_pagina_lenta(tmp_path, monkeypatch):
+    monkeypatch.setattr(metricas, 'DIRETORIO_PERFIS', str(tmp_path))
+    monkeypatch.setattr(metricas, '_perfis', metricas.deque(maxlen=metricas.MAXIMO_PERFIS))
+
+    monkeypatch.setattr(metricas, '_perfil_ativo', False)
+    with metricas.perfilar('Desligado', limite=0):
+        time.sleep(0.02)
+    assert os.listdir(tmp_path) == []
+
+    monkeypatch.setattr(metricas, '_perfil_ativo', True)
+    with metricas.perfilar('Rápida', limite=10):
+        time.sleep(0.02)
+    with metricas.perfilar('Lenta', limite=0):
+        time.sleep(0.05)
+    perfis = metricas.perfis()
+    assert [perfil['nome'] for perfil in perfis] == ['Lenta']
+    with open(perfis[0]['caminho'], encoding='utf-8') as arquivo:
+        linhas = arquivo.read().splitlines()
+    # Formato colapsado: quadros separados por ';' e a contagem no fim
+    assert all(re.match(r'^\S.*;.* \d+$', linha) for linha in linhas)
+    assert any('test_metricas.py:test_perfilar_grava_pagina_lenta' in linha for linha in linhas)
+
+
+def test_servir_so_localmente(monkeypatch):
+    monkeypatch.setattr(metricas, '_servidor', None)
+    monkeypatch.setattr(metricas, '_servidor_falhou', False)
+    metricas.registrar('pagina', 0.1)
+    servidor = metricas.servir(0)
+    try:
+        endereco, porta = servidor.server_address[:2]
+        assert endereco == '127.0.0.1'
+        with urllib.request.urlopen(f'http://127.0.0.1:{porta}/metrics') as resposta:
+            assert resposta.read().decode() == metricas.prometheus()
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import motor_backtest
+from motor_backtest import ALTA, BAIXA
+
+
+# As regras documentadas em motor_backtest escritas dia a dia, com
+# contadores de dias seguidos em cada gatilho e troca quando um deles chega a
+# limite_dias. Confere a vetorização das regras, não as regras em si: o
+# código offline que gerou a cota registrada não está no repositório.
+def regime_laco(vol, conc, parametros):
+    regime = motor_backtest.regime_inicial(parametros)
+    dias_baixa = dias_alta = 0
+    saida = []
+    for v, c in zip(vol, conc):
+        v = parametros['vol_semente'] if np.isnan(v) else v
+        c = parametros['concentracao_semente'] if np.isnan(c) else c
+        baixa = v > parametros['vol_gatilho_subir'] or c > parametros['concentracao_gatilho_subir']
+        alta = v < parametros['vol_gatilho_descer'] and c < parametros['concentracao_gatilho_descer']
+        dias_baixa = dias_baixa + 1 if baixa else 0
+        dias_alta = dias_alta + 1 if alta else 0
+        if dias_baixa >= parametros['limite_dias']:
+            regime = BAIXA
+        elif dias_alta >= parametros['limite_dias']:
+            regime = ALTA
+        saida.append(regime)
+    return np.array(saida)
+
+
+def test_volatilidade_movel_igual_ao_pandas(mercado):
+    precos, _, _ = mercado
+    retornos = precos.pct_change()
+    esperado = retornos.rolling(motor_backtest.JANELA_VOL).std() * np.sqrt(motor_backtest.DIAS_UTEIS)
+    vol = motor_backtest.volatilidade_movel(retornos.fillna(0.0).to_numpy())
+    np.testing.assert_allclose(vol, esperado.to_numpy(), rtol=0, atol=1e-12)
+
+
+def test_persistencia_igual_ao_contador():
+    condicao = np.random.default_rng(1).random(300) < 0.7
+    contador = 0
+    esperado = []
+    for valor in condicao:
+        contador = contador + 1 if valor else 0
+        esperado.append(contador >= 4)
+    assert (motor_backtest.persistencia(condicao, 4) == np.array(esperado)).all()
+
+
+def test_regime_vetorizado_igual_ao_laco(mercado, parametros):
+    sinais = motor_backtest.derivar_sinais(motor_backtest.preparar_insumos(*mercado))
+    regime = motor_backtest.calcular_regime(sinais['vol_sinal'], sinais['concentracao'], parametros)
+    esperado = regime_laco(sinais['vol_sinal'], sinais['concentracao'], parametros)
+    assert (regime == esperado).all()
+    assert 0 < (regime == ALTA).mean() < 1
+
+
+# Cota dia a dia: o regime no fechamento de t-1 escolhe a carteira do dia t,
+# com os últimos pesos conhecidos em t-1
+def test_cota_igual_ao_laco(mercado, parametros):
+    precos, pesos_alta, pesos_baixa = mercado
+    backtest = motor_backtest.executar_backtest(precos, pesos_alta, pesos_baixa, parametros)
+    retornos = precos.pct_change().fillna(0.0)
+    alta = pesos_alta.reindex(precos.index, method='ffill')
+    baixa = pesos_baixa.reindex(precos.index, method='ffill')
+
+    cota = [1.0]
+    for t in range(1, len(precos)):
+        pesos = alta.iloc[t - 1] if backtest['Regime'].iloc[t - 1] == ALTA else baixa.iloc[t - 1]
+        cota.append(cota[-1] * (1 + (pesos * retornos.iloc[t]).sum()))
+    np.testing.assert_allclose(backtest['Fundo'].to_numpy(), cota, rtol=1e-12)
+
+
+def test_preparar_insumos_rejeita_ativo_sem_preco(mercado):
+    precos, pesos_alta, pesos_baixa = mercado
+    with pytest.raises(ValueError, match="sem preço no painel: \\['ETF0'\\]"):
+        motor_backtest.preparar_insumos(precos.drop(columns='ETF0'), pesos_alta, pesos_baixa)
+
+
+def test_preparar_insumos_rejeita_ativo_so_na_baixa_vol(mercado):
+    precos, pesos_alta, pesos_baixa = mercado
+    with pytest.raises(ValueError, match="fora da carteira de alta vol: \\['ETF3'\\]"):
+        motor_backtest.preparar_insumos(precos, pesos_alta.drop(columns='ETF3'), pesos_baixa)
+
+
+def test_aderencia(mercado, parametros):
+    precos, pesos_alta, pesos_baixa = mercado
+    cota = motor_backtest.executar_backtest(precos, pesos_alta, pesos_baixa, parametros)['Fundo']
+    igual = motor_backtest.aderencia(cota, cota * 2)
+    assert igual['pregoes'] == len(cota)
+    assert igual['correlacao'] == pytest.approx(1.0)
+    assert igual['erro_rastreamento'] == pytest.approx(0.0, abs=1e-12)
+    assert igual['diferenca_acumulada'] == pytest.approx(0.0, abs=1e-12)
+    outra = motor_backtest.executar_backtest(precos, pesos_baixa, pesos_baixa, parametros)['Fundo']
+    assert motor_backtest.aderencia(cota, outra)['erro_rastreamento'] > 0.01
+
+
+def test_painel_ausente_indica_como_criar(tmp_path):
+    with pytest.raises(FileNotFoundError, match='--criar-painel'):
+        motor_backtest.carregar_precos(str(tmp_path / 'precos ETFs.csv'))
+    with pytest.raises(FileNotFoundError, match='--criar-painel'):
+        motor_backtest.reconstruir_comparacao(str(tmp_path / 'saida.csv'), caminho_precos=str(tmp_path / 'nada.csv'))
+    assert not (tmp_path / 'saida.csv').exists()
+
+
+def test_atualizar_fundo_sem_painel_devolve_a_comparacao(tmp_path):
+    comparacao = pd.DataFrame({'Fundo': [1.0, 1.01]}, index=pd.bdate_range('2024-01-01', periods=2))
+    assert motor_backtest.atualizar_fundo(comparacao, caminho_precos=str(tmp_path / 'nada.csv')) is comparacao
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('cvxpy')
+pypfopt = pytest.importorskip('pypfopt')
+
+import otimizacao_pesos  # noqa: E402
+from janela_movel import JanelaCovariancia  # noqa: E402
+
+JANELA = 120
+LISTAGEM = 300
+
+
+# ETF7 só começa a ter preço no pregão LISTAGEM
+@pytest.fixture
+def precos(mercado):
+    precos = mercado[0].copy()
+    precos.iloc[:LISTAGEM, 7] = np.nan
+    return precos
+
+
+def test_janela_marca_ativos_incompletos(precos):
+    retornos = precos.ffill().pct_change().iloc[1:].to_numpy()
+    janela = JanelaCovariancia(precos.shape[1], JANELA, recalibrar=50)
+    for t, retorno in enumerate(retornos):
+        janela.adicionar(retorno)
+        if janela.cheia:
+            # O primeiro retorno do ETF7 é o do pregão LISTAGEM + 1, posição LISTAGEM
+            esperado = t - JANELA + 1 >= LISTAGEM
+            assert janela.completos()[7] == esperado and janela.completos()[:7].all()
+
+
+# Mesmos pesos que a EfficientFrontier.efficient_risk do PyPortfolioOpt sobre
+# a janela de preços dos ETFs que já têm a janela inteira
+@pytest.mark.parametrize('vol_alvo', [0.08, 0.12])
+def test_pesos_iguais_ao_pypfopt(precos, vol_alvo):
+    from pypfopt import EfficientFrontier, expected_returns, risk_models
+
+    pesos = otimizacao_pesos.gerar_pesos(precos, [vol_alvo], JANELA, solver='CLARABEL')[vol_alvo]
+    assert pesos.index[0] == precos.index[JANELA]
+    datas = [precos.index[LISTAGEM + JANELA - 1], precos.index[LISTAGEM + JANELA], precos.index[-1]]
+    for data in datas:
+        fim = precos.index.get_loc(data)
+        janela = precos.iloc[fim - JANELA:fim + 1].dropna(axis=1, how='any')
+        fronteira = EfficientFrontier(expected_returns.mean_historical_return(janela),
+                                      risk_models.sample_cov(janela), weight_bounds=(0, 1))
+        fronteira.efficient_risk(vol_alvo)
+        esperado = pd.Series(fronteira.clean_weights(), dtype=np.float64).reindex(precos.columns, fill_value=0.0)
+        np.testing.assert_allclose(pesos.loc[data].to_numpy(), esperado.to_numpy(), atol=2e-3)
+    assert pesos.loc[:datas[0], 'ETF7'].eq(0).all()
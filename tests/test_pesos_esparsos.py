@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import motor_backtest
+import pesos_esparsos
+
+
+# Pesos diários densos (com alguns dias sem pesos) e o histórico esparso
+@pytest.fixture
+def densos(mercado):
+    precos, pesos_alta, pesos_baixa = mercado
+    alta = pesos_alta.reindex(precos.index, method='ffill')
+    alta.iloc[40:45] = 0.0
+    baixa = pesos_baixa.reindex(precos.index, method='ffill')
+    return alta, baixa
+
+
+def test_tabela_e_pesos_na_data(densos):
+    alta, _ = densos
+    historico = pesos_esparsos.HistoricoPesos.de_tabela(alta)
+    assert historico.tabela().equals(alta)
+    data = alta.index[123] + pd.Timedelta(hours=1)
+    np.testing.assert_array_equal(historico.pesos_em(data).to_numpy(), alta.iloc[123].to_numpy())
+
+
+def test_medias_por_periodo(densos):
+    alta, _ = densos
+    historico = pesos_esparsos.HistoricoPesos.de_tabela(alta)
+    anual = alta.groupby(alta.index.year).mean()
+    mensal = alta.groupby([alta.index.year, alta.index.month]).mean()
+    np.testing.assert_allclose(historico.media_periodo('anual').to_numpy(), anual.to_numpy(), rtol=0, atol=1e-15)
+    np.testing.assert_allclose(historico.media_periodo('mensal').to_numpy(), mensal.to_numpy(), rtol=0, atol=1e-15)
+    assert list(historico.media_periodo('mensal').index) == list(mensal.index)
+
+
+def test_giro_e_concentracao(densos):
+    alta, _ = densos
+    historico = pesos_esparsos.HistoricoPesos.de_tabela(alta)
+    giro = alta.diff().abs().sum(axis=1) / 2
+    giro.iloc[0] = alta.iloc[0].abs().sum() / 2
+    np.testing.assert_allclose(historico.giro().to_numpy(), giro.to_numpy(), rtol=0, atol=1e-15)
+    np.testing.assert_allclose(historico.concentracao().to_numpy(), motor_backtest.concentracao(alta.to_numpy()),
+                               rtol=0, atol=1e-15)
+
+
+def test_pesos_do_fundo_pelo_regime(densos):
+    alta, baixa = densos
+    regime = pd.Series(np.random.default_rng(2).integers(0, 2, len(alta)), index=alta.index)
+    fundo = pesos_esparsos.pesos_fundo(pesos_esparsos.HistoricoPesos.de_tabela(alta),
+                                       pesos_esparsos.HistoricoPesos.de_tabela(baixa), regime)
+    esperado = np.where(regime.to_numpy()[:, None] == motor_backtest.ALTA, alta.to_numpy(), baixa.to_numpy())
+    np.testing.assert_array_equal(fundo.tabela().to_numpy(), esperado)
+
+
+def test_salvar_e_carregar(densos, tmp_path):
+    alta, _ = densos
+    historico = pesos_esparsos.HistoricoPesos.de_tabela(alta)
+    lido = pesos_esparsos.HistoricoPesos.carregar(historico.salvar(str(tmp_path / 'alta.npz')))
+    assert lido.tabela().equals(alta)
+
+
+def test_historico_aplicado_reproduz_o_registro():
+    registro = pd.read_csv('Historico dos pesos.csv', index_col=0)
+    medias = pesos_esparsos.historico_aplicado().media_periodo('anual')
+    assert list(medias.index) == list(registro.index)
+    assert list(medias.columns) == list(registro.columns)
+    np.testing.assert_array_equal(medias.to_numpy(), registro.to_numpy())
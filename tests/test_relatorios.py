@@ -0,0 +1,67 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import carteiras
+import relatorios
+
+
+# Linha de comando numa saída temporária: a primeira execução gera, a segunda
+# pula o que não mudou, --forcar regera e uma taxa nova gera outro relatório
+def test_linha_de_comando_pula_relatorio_sem_mudanca(tmp_path, capsys):
+    saida = str(tmp_path / 'saida')
+    argumentos = ['--janela', '2021-01-04:2022-12-30', '--saida', saida, '--processos', '1']
+    assert relatorios.main(argumentos) == 0
+    assert capsys.readouterr().out.startswith('1 gerados, 0 sem mudança, 0 com erro')
+
+    (nome,) = [item for item in os.listdir(saida) if os.path.isdir(os.path.join(saida, item))]
+    diretorio = os.path.join(saida, nome)
+    with open(os.path.join(diretorio, relatorios.ARQUIVO_MANIFESTO)) as json_file:
+        manifesto = json.load(json_file)
+    assert 'resumo.json' in manifesto['arquivos'] and 'relatorio.html' in manifesto['arquivos']
+    assert all(os.path.exists(os.path.join(diretorio, arquivo)) for arquivo in manifesto['arquivos'])
+    assert os.path.exists(os.path.join(saida, relatorios.ARQUIVO_PLOTLY))
+
+    with open(os.path.join(diretorio, 'resumo.json'), encoding='utf-8') as json_file:
+        resumo = json.load(json_file)
+    indice = carteiras.indice(carteiras.nova_carteira(carteiras.NOME_PADRAO))
+    assert resumo['retornos_periodo']['Fundo'] == pytest.approx(
+        indice.retorno_acumulado('2021-01-04', '2022-12-30')['Fundo'] - 1)
+    i, j = indice.janela('2021-01-04', '2022-12-30')
+    assert resumo['data_inicial'] == indice.datas[i].strftime('%Y-%m-%d')
+    assert resumo['data_final'] == indice.datas[j].strftime('%Y-%m-%d')
+
+    modificado = os.stat(os.path.join(diretorio, 'relatorio.html')).st_mtime_ns
+    assert relatorios.main(argumentos) == 0
+    assert capsys.readouterr().out.startswith('0 gerados, 1 sem mudança')
+    assert os.stat(os.path.join(diretorio, 'relatorio.html')).st_mtime_ns == modificado
+
+    # Um arquivo listado no manifesto que sumiu faz o relatório ser regerado
+    os.remove(os.path.join(diretorio, 'resumo.json'))
+    assert relatorios.main(argumentos) == 0
+    assert capsys.readouterr().out.startswith('1 gerados, 0 sem mudança')
+
+    assert relatorios.main(argumentos + ['--forcar']) == 0
+    assert capsys.readouterr().out.startswith('1 gerados')
+    assert relatorios.main(argumentos + ['--taxa-adm', '1.5']) == 0
+    assert capsys.readouterr().out.startswith('1 gerados')
+    assert len([item for item in os.listdir(saida) if os.path.isdir(os.path.join(saida, item))]) == 2
+
+
+def test_tabelas_gravadas_iguais_as_calculadas(tmp_path):
+    relatorio = relatorios.novo_relatorio(inicio='2022-01-03', fim='2022-06-30')
+    resultado = relatorios.executar([relatorio], str(tmp_path), processos=1)
+    assert resultado == {'gerados': [relatorio['nome']], 'pulados': [], 'erros': {}}
+
+    _, tabelas = relatorios.calcular(relatorio)
+    for nome, tabela in tabelas.items():
+        caminho = os.path.join(tmp_path, relatorio['nome'], f'{nome}.{relatorios._extensao()}')
+        if caminho.endswith('.parquet'):
+            gravada = pd.read_parquet(caminho)
+        else:
+            gravada = pd.read_csv(caminho, index_col=list(range(tabela.index.nlevels)))
+        assert gravada.to_numpy().shape == tabela.to_numpy().shape
+        pd.testing.assert_frame_equal(gravada.reset_index(drop=True), tabela.rename(columns=str).reset_index(drop=True),
+                                      check_dtype=False, check_names=False)
@@ -0,0 +1,16 @@
+import os
+
+import tempo_importacao
+
+
+# Home e Equipe sem os módulos pesados e nenhuma página com os solvers. O app
+# roda numa cópia (links) em tmp_path, para os caches de dados não irem para o
+# repositório.
+def test_paginas_sem_modulos_proibidos(tmp_path):
+    raiz = os.path.dirname(tempo_importacao.APP)
+    for nome in os.listdir(raiz):
+        if not nome.startswith('.') and os.path.isfile(os.path.join(raiz, nome)):
+            os.symlink(os.path.join(raiz, nome), tmp_path / nome)
+    linhas, falhas = tempo_importacao.relatorio(app=str(tmp_path / 'moria.py'), com_orcamento=False)
+    assert len(linhas) == len(tempo_importacao.PAGINAS)
+    assert falhas == []
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import triagem
+from motor_backtest import DIAS_UTEIS
+
+
+# Cotas sintéticas de 12 fundos (um começa tarde, um encerra antes do fim e
+# um tem buracos) e o nível do CDI nas mesmas datas
+@pytest.fixture
+def painel():
+    rng = np.random.default_rng(3)
+    datas = pd.bdate_range('2020-01-01', periods=800)
+    nomes = [f'Fundo {i} {sufixo}' for i, sufixo in enumerate(['FIA', 'Mult', 'RF'] * 4)]
+    vols = rng.uniform(0.001, 0.02, len(nomes))
+    cotas = pd.DataFrame(np.cumprod(1 + rng.normal(0.0004, vols, (len(datas), len(nomes))), axis=0),
+                         index=datas, columns=nomes)
+    cotas.iloc[:300, 0] = np.nan
+    cotas.iloc[600:, 1] = np.nan
+    cotas.iloc[400:410, 2] = np.nan
+    cdi = pd.Series(np.cumprod(np.full(len(datas), 1.0004)), index=datas)
+    return cotas, cdi
+
+
+# Métricas de um fundo numa data de avaliação, direto com o pandas; None se
+# o fundo não cobre a janela toda
+def referencia(cotas, cdi, fundo, data, janela=triagem.JANELA):
+    serie = cotas[fundo]
+    fim = cotas.index.get_loc(data)
+    inicio = fim - janela
+    if serie.first_valid_index() > cotas.index[inicio] or serie.last_valid_index() < data:
+        return None
+    trecho = serie.ffill().iloc[inicio:fim + 1]
+    log_retornos = np.log(trecho).diff().dropna()
+    anos = janela / DIAS_UTEIS
+    razao = trecho.iloc[-1] / trecho.iloc[0]
+    razao_cdi = cdi.iloc[fim] / cdi.iloc[inicio]
+    vol = log_retornos.std() * np.sqrt(DIAS_UTEIS)
+    return {
+        'retorno': razao - 1,
+        'vol': vol,
+        'sharpe': (np.log(razao) - np.log(razao_cdi)) / anos / vol,
+        'drawdown_maximo': (trecho / trecho.cummax() - 1).min(),
+        'alfa_cdi': (razao / razao_cdi) ** (1 / anos) - 1
+    }
+
+
+def test_metricas_iguais_ao_pandas(painel):
+    cotas, cdi = painel
+    tabela = triagem.triar(cotas, cdi)
+    fins = cotas.index[np.r_[cotas.index.month[1:] != cotas.index.month[:-1], True]]
+    avaliadas = fins[fins >= cotas.index[triagem.JANELA]]
+    assert sorted(tabela['data'].unique()) == list(avaliadas)
+
+    for data in avaliadas:
+        for fundo in cotas.columns:
+            linha = tabela[(tabela['data'] == data) & (tabela['fundo'] == fundo)]
+            esperado = referencia(cotas, cdi, fundo, data)
+            if esperado is None:
+                assert linha.empty
+                continue
+            assert len(linha) == 1
+            for metrica, valor in esperado.items():
+                assert linha[metrica].iloc[0] == pytest.approx(valor, rel=1e-10, abs=1e-14)
+
+
+def test_lotes_pequenos_iguais(painel, monkeypatch):
+    cotas, cdi = painel
+    tabela = triagem.triar(cotas, cdi)
+    monkeypatch.setattr(triagem, 'MEMORIA_LOTE', len(cotas) * 8 * 8 * 5)
+    em_lotes = triagem.triar(cotas, cdi)
+    np.testing.assert_array_equal(em_lotes[triagem.METRICAS].to_numpy(), tabela[triagem.METRICAS].to_numpy())
+
+
+def test_melhores_por_categoria(painel):
+    cotas, cdi = painel
+    tabela = triagem.triar(cotas, cdi)
+    melhores = triagem.melhores(tabela, 2)
+    assert set(melhores['categoria']) == set(triagem.CATEGORIAS)
+    assert melhores.groupby(['data', 'categoria']).size().max() == 2
+    ultima = tabela[(tabela['data'] == tabela['data'].max()) & (tabela['categoria'] == 'Ações')]
+    primeiro = melhores[(melhores['data'] == tabela['data'].max()) & (melhores['categoria'] == 'Ações')].iloc[0]
+    assert primeiro['sharpe'] == ultima['sharpe'].max()
+
+
+# CDI que só começa no meio do painel e falta numa data de avaliação: sem
+# cdi_padrao o Sharpe das janelas anteriores some (e é listado); com ele, é o
+# de um CDI estendido para trás à taxa dada
+def test_cdi_incompleto(painel):
+    cotas, cdi = painel
+    buraco = cdi.index.get_loc(triagem.triar(cotas, cdi)['data'].unique()[-2])
+    parcial = cdi.iloc[400:].drop(cdi.index[buraco])
+    tabela = triagem.triar(cotas, parcial)
+    sem_sharpe = triagem.janelas_sem_metrica(tabela)
+    com_cdi = tabela['data'] >= cdi.index[400 + triagem.JANELA]
+    assert set(sem_sharpe.index) == set(tabela.loc[~com_cdi, 'data'])
+    assert tabela.loc[com_cdi, 'sharpe'].notna().all()
+
+    estendido = cdi.copy()
+    estendido.iloc[:400] = cdi.iloc[400] * 1.05 ** (-np.arange(400, 0, -1) / DIAS_UTEIS)
+    estendido.iloc[buraco] = estendido.iloc[buraco - 1]
+    esperado = triagem.triar(cotas, estendido)
+    com_reserva = triagem.triar(cotas, parcial, cdi_padrao=0.05)
+    assert triagem.janelas_sem_metrica(com_reserva).empty
+    np.testing.assert_allclose(com_reserva[triagem.METRICAS].to_numpy(), esperado[triagem.METRICAS].to_numpy(),
+                               rtol=1e-10)
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import motor_backtest
+import varredura
+
+
+@pytest.fixture
+def insumos(mercado):
+    return motor_backtest.preparar_insumos(*mercado)
+
+
+# Lotes pequenos no pool de processos dão as mesmas métricas, na mesma ordem,
+# que a avaliação serial de cada combinação
+def test_paralelo_igual_ao_serial(insumos, parametros):
+    combinacoes = varredura.amostrar({'limite_dias': (2, 15), 'vol_gatilho_subir': (0.08, 0.16)}, 40, parametros, 1)
+    serial = varredura.executar_varredura(insumos, combinacoes, processos=1)
+    paralelo = varredura.executar_varredura(insumos, combinacoes, processos=2, tamanho_lote=7)
+    np.testing.assert_array_equal(paralelo, serial)
+
+    sinais = motor_backtest.derivar_sinais(insumos)
+    for valores, linha in zip(combinacoes[:5], serial):
+        resultado = motor_backtest.avaliar(sinais, dict(zip(varredura.NOMES_PARAMETROS, valores)))
+        np.testing.assert_allclose(linha, [resultado[nome] for nome in varredura.NOMES_METRICAS], rtol=1e-6)
+
+
+# Os eixos voltam exatos (float64) e as métricas com a forma da grade
+def test_cubo_da_grade(insumos, parametros, tmp_path):
+    eixos = {'limite_dias': [3, 8], 'vol_gatilho_subir': [0.11, 0.13, 0.15]}
+    combinacoes, forma = varredura.gerar_grade(eixos, parametros)
+    metricas = varredura.executar_varredura(insumos, combinacoes, processos=1)
+    cubo = varredura.carregar_cubo(varredura.salvar_cubo(str(tmp_path / 'cubo.npz'), combinacoes, metricas, forma))
+
+    assert cubo['parametros'].dtype == np.float64
+    np.testing.assert_array_equal(cubo['parametros'], combinacoes)
+    coluna = varredura.NOMES_PARAMETROS.index('vol_gatilho_subir')
+    assert set(cubo['parametros'][:, coluna]) == {0.11, 0.13, 0.15}
+    assert cubo['metricas'].shape == forma + (len(varredura.NOMES_METRICAS),)
+    np.testing.assert_array_equal(cubo['metricas'].reshape(len(combinacoes), -1), metricas)
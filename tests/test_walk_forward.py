@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import motor_backtest
+import varredura
+import walk_forward
+
+
+@pytest.fixture
+def insumos(mercado):
+    return motor_backtest.preparar_insumos(*mercado)
+
+
+# Testes colados, sem sobreposição, cobrindo do fim do primeiro treino ao
+# último dia; cada treino é a janela imediatamente anterior ao seu teste
+@pytest.mark.parametrize('n_dias, treino, teste', [(500, 200, 100), (480, 200, 100), (250, 200, 100), (200, 200, 100)])
+def test_bordas_das_dobras(n_dias, treino, teste):
+    dobras = walk_forward.gerar_dobras(n_dias, treino, teste)
+    if n_dias <= treino:
+        assert dobras == []
+        return
+    assert dobras[0][1] == treino and dobras[-1][2] == n_dias
+    for (inicio_treino, inicio_teste, fim_teste), seguinte in zip(dobras, dobras[1:] + [None]):
+        assert inicio_teste - inicio_treino == treino
+        assert 0 < fim_teste - inicio_teste <= teste
+        if seguinte is not None:
+            assert seguinte[1] == fim_teste and fim_teste - inicio_teste == teste
+
+
+# A vol do teste usa o fim do treino como aquecimento: é a vol móvel do
+# trecho inteiro (treino + teste) restrita aos dias de teste
+def test_vol_do_teste_aquecida_pelo_treino(insumos, parametros):
+    sinais = motor_backtest.derivar_sinais(insumos)
+    candidatos = np.array([[parametros[nome] for nome in varredura.NOMES_PARAMETROS]])
+    dobra = (100, 300, 360)
+    resultado = walk_forward.executar_dobra(sinais, dobra, candidatos)
+
+    trecho = walk_forward._recortar(sinais, dobra[0], dobra[2])
+    regime = motor_backtest.calcular_regime(trecho['vol_sinal'], trecho['concentracao'], parametros)
+    retornos = pd.Series(motor_backtest.retorno_fundo(trecho, regime))
+    vol = (retornos.rolling(motor_backtest.JANELA_VOL).std() * np.sqrt(motor_backtest.DIAS_UTEIS)).iloc[200:]
+    assert vol.notna().all()
+    assert resultado['teste']['vol_media'] == pytest.approx(vol.mean(), rel=1e-10)
+    na_banda = vol.between(parametros['limite_vol_baixa'], parametros['limite_vol_alta'])
+    assert resultado['teste']['tempo_na_banda'] == pytest.approx(na_banda.mean())
+    assert resultado['teste']['retorno_acumulado'] == pytest.approx(np.prod(1 + retornos.iloc[200:]) - 1, rel=1e-12)
+
+
+def test_paralelo_igual_ao_serial(insumos, parametros):
+    candidatos, _ = varredura.gerar_grade({'limite_dias': [3, 8], 'vol_gatilho_subir': [0.10, 0.14]}, parametros)
+    serial = walk_forward.executar(insumos, candidatos, 200, 100, processos=1)
+    paralelo = walk_forward.executar(insumos, candidatos, 200, 100, processos=2)
+
+    tempos = [coluna for coluna in serial['dobras'] if coluna.startswith('tempo_')]
+    esperado = serial['dobras'].drop(columns=tempos)
+    obtido = paralelo['dobras'].drop(columns=tempos)
+    assert len(esperado) == len(walk_forward.gerar_dobras(len(insumos['datas']), 200, 100))
+    pd.testing.assert_frame_equal(obtido, esperado, rtol=1e-12)
+    pd.testing.assert_series_equal(paralelo['cota'], serial['cota'], rtol=1e-12)
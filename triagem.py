@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+
+import analitico
+import dados
+from motor_backtest import DIAS_UTEIS
+
+# Triagem de fundos por janelas móveis, em lotes de fundos.
+#
+# O painel de cotas (datas x fundos) é processado em blocos de colunas cujo
+# tamanho respeita MEMORIA_LOTE. Em cada bloco o log da cota e somas
+# prefixadas dos retornos, dos quadrados e dos dias sem cota são calculados
+# uma vez; retorno, vol, Sharpe e alfa sobre o CDI de qualquer janela saem
+# das diferenças dessas somas nas bordas, para todos os fundos do bloco de
+# uma vez. Só o drawdown máximo percorre a janela (um maximum.accumulate por
+# data de avaliação). Vol e Sharpe usam retornos logarítmicos. Janelas em
+# que o fundo ainda não existia (ou já tinha encerrado) ficam de fora do
+# ranking.
+#
+# Sharpe e alfa precisam do CDI nas duas pontas da janela. A série de CDI da
+# comparação só começa em 2019-10; antes disso (e depois do fim dela) essas
+# métricas ficam NaN, a menos que `cdi_padrao` dê uma taxa anual constante
+# para estender o nível do CDI. Datas de cota sem CDI no meio da série
+# repetem o último nível. janelas_sem_metrica lista as datas de avaliação que
+# o ranking por uma métrica deixaria de fora.
+
+JANELA = DIAS_UTEIS
+MEMORIA_LOTE = 256 * 1024 * 1024
+METRICAS = ['retorno', 'vol', 'sharpe', 'drawdown_maximo', 'alfa_cdi']
+CATEGORIAS = ['RF', 'Ações', 'Multimercado']
+
+ARQUIVO_FUNDOS = 'DataFrame Melhores Fundos Atualizado.csv'
+
+
+def carregar_cotas(caminho=ARQUIVO_FUNDOS):
+    return dados.carregar_tabela(caminho)
+
+
+# Categoria pelo nome do fundo, pelas siglas que a convenção da CVM/Anbima
+# costuma pôr nos nomes (FIA, Mult, RF, DI...). É uma heurística: nomes fora
+# da convenção (ex.: 'BB FMP FGTS Vale Migracao') ficam em 'Outros' e somem
+# do ranking por categoria, e a sigla no nome nem sempre é a classificação
+# Anbima vigente. Para o universo real, passe a classificação oficial em
+# `categorias` de triar.
+def classificar(nome):
+    nome = f' {nome.upper()} '
+    if ' FIA ' in nome or ' ACOES ' in nome or ' AÇÕES ' in nome:
+        return 'Ações'
+    if ' MULT ' in nome or ' FIM ' in nome or ' MULTIMERCADO ' in nome:
+        return 'Multimercado'
+    if ' RF ' in nome or ' DI ' in nome or ' RENDA FIXA ' in nome:
+        return 'RF'
+    return 'Outros'
+
+
+def _somas(matriz):
+    zeros = np.zeros((1,) + matriz.shape[1:])
+    return np.concatenate([zeros, np.cumsum(matriz, axis=0)])
+
+
+# Métricas das janelas que terminam nas posições `fins` para um bloco de
+# fundos. `log_cdi` é o log do nível do CDI nas mesmas datas (NaN onde não há).
+def metricas_bloco(cotas, log_cdi, fins, janela):
+    # Buracos no meio da série repetem a última cota; antes da primeira e
+    # depois da última o fundo não existe
+    existe = ~np.isnan(cotas)
+    faltando = (np.cumsum(existe, axis=0) == 0) | (np.cumsum(existe[::-1], axis=0)[::-1] == 0)
+    cota = pd.DataFrame(cotas).ffill().to_numpy()
+    log_cota = np.log(cota)
+    retornos = np.diff(log_cota, axis=0, prepend=np.nan)
+    retornos_validos = np.nan_to_num(retornos)
+
+    soma_faltando = _somas((faltando | np.isnan(retornos)).astype(np.int32))
+    soma = _somas(retornos_validos)
+    soma_quad = _somas(retornos_validos ** 2)
+
+    inicios = fins - janela
+    completos = (soma_faltando[fins + 1] - soma_faltando[inicios + 1]) == 0
+    n = janela
+    media = (soma[fins + 1] - soma[inicios + 1]) / n
+    variancia = ((soma_quad[fins + 1] - soma_quad[inicios + 1]) - n * media ** 2) / (n - 1)
+    vol = np.sqrt(np.clip(variancia, 0, None) * DIAS_UTEIS)
+
+    log_retorno = log_cota[fins] - log_cota[inicios]
+    log_retorno_cdi = (log_cdi[fins] - log_cdi[inicios])[:, None]
+    anos = n / DIAS_UTEIS
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = (log_retorno - log_retorno_cdi) / anos / vol
+    alfa = np.expm1((log_retorno - log_retorno_cdi) / anos)
+
+    drawdown = np.empty_like(vol)
+    for k, (i, j) in enumerate(zip(inicios, fins)):
+        drawdown[k] = analitico.drawdown_maximo(cota[i:j + 1])
+
+    resultado = {
+        'retorno': np.expm1(log_retorno),
+        'vol': vol,
+        'sharpe': sharpe,
+        'drawdown_maximo': drawdown,
+        'alfa_cdi': alfa
+    }
+    return {nome: np.where(completos, valores, np.nan) for nome, valores in resultado.items()}
+
+
+# Log do nível do CDI nas datas das cotas. Buracos no meio repetem o último
+# nível; antes do primeiro e depois do último o nível cresce à taxa anual
+# `cdi_padrao` (se dada) a partir da ponta conhecida.
+def log_cdi_nas_datas(cdi, datas, cdi_padrao=None):
+    cdi = cdi[~cdi.index.duplicated(keep='last')].dropna().sort_index()
+    log_cdi = np.log(cdi.reindex(cdi.index.union(datas)).ffill().reindex(datas).to_numpy(dtype=np.float64))
+    conhecidos = np.flatnonzero(~np.isnan(log_cdi))
+    if cdi_padrao is None or len(conhecidos) == 0:
+        return log_cdi
+    taxa = np.log1p(cdi_padrao) / DIAS_UTEIS
+    posicoes = np.arange(len(log_cdi))
+    primeiro, ultimo = conhecidos[0], conhecidos[-1]
+    log_cdi[:primeiro] = log_cdi[primeiro] - taxa * (primeiro - posicoes[:primeiro])
+    log_cdi[ultimo + 1:] = log_cdi[ultimo] + taxa * (posicoes[ultimo + 1:] - ultimo)
+    return log_cdi
+
+
+# Métricas de todos os fundos em cada data de avaliação (fim de cada mês, por
+# padrão). Devolve uma tabela longa: data, fundo, categoria e as métricas.
+def triar(cotas, cdi=None, datas_avaliacao=None, janela=JANELA, categorias=None, cdi_padrao=None):
+    cotas = cotas.sort_index()
+    datas = cotas.index
+    if cdi is None:
+        cdi = dados.carregar_comparacao()['CDI']
+    log_cdi = log_cdi_nas_datas(cdi, datas, cdi_padrao)
+
+    if datas_avaliacao is None:
+        fins = np.flatnonzero(np.r_[datas.month[1:] != datas.month[:-1], True])
+    else:
+        fins = datas.searchsorted(pd.DatetimeIndex(datas_avaliacao), side='right') - 1
+    fins = np.unique(fins[fins >= janela])
+
+    # Cotas, cota preenchida, log, retornos, máscaras e três somas prefixadas
+    # por fundo
+    por_fundo = len(datas) * 8 * 9
+    tamanho = max(1, MEMORIA_LOTE // por_fundo)
+    fundos = list(cotas.columns)
+    valores = {nome: np.empty((len(fins), len(fundos))) for nome in METRICAS}
+    for inicio in range(0, len(fundos), tamanho):
+        bloco = cotas.iloc[:, inicio:inicio + tamanho].to_numpy(dtype=np.float64)
+        resultado = metricas_bloco(bloco, log_cdi, fins, janela)
+        for nome in METRICAS:
+            valores[nome][:, inicio:inicio + tamanho] = resultado[nome]
+
+    categorias = categorias or {}
+    tabela = pd.DataFrame({
+        'data': np.repeat(datas[fins], len(fundos)),
+        'fundo': np.tile(fundos, len(fins)),
+        'categoria': np.tile([categorias.get(f, classificar(f)) for f in fundos], len(fins)),
+        **{nome: valores[nome].ravel() for nome in METRICAS}
+    })
+    return tabela.dropna(subset=['retorno'])
+
+
+# Os `n` melhores fundos de cada categoria em cada data pela `metrica`. A
+# vol é ordenada do menor para o maior; as demais do maior para o menor (o
+# drawdown é negativo). Fundos sem a métrica na data ficam de fora; veja
+# janelas_sem_metrica.
+def melhores(tabela, n=5, metrica='sharpe', categorias=CATEGORIAS):
+    crescente = metrica in ('vol',)
+    tabela = tabela[tabela['categoria'].isin(categorias)].dropna(subset=[metrica])
+    ordenada = tabela.sort_values(['data', 'categoria', metrica], ascending=[True, True, crescente])
+    return ordenada.groupby(['data', 'categoria'], sort=False).head(n).reset_index(drop=True)
+
+
+# Datas de avaliação em que nenhum fundo tem a `metrica` (ex.: Sharpe antes
+# do início do CDI sem cdi_padrao), com quantos fundos ficaram de fora
+def janelas_sem_metrica(tabela, metrica='sharpe'):
+    por_data = tabela.groupby('data')[metrica].agg(['count', 'size'])
+    sem_metrica = por_data[por_data['count'] == 0]
+    return sem_metrica['size'].rename('fundos')
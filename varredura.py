@@ -0,0 +1,221 @@
+import argparse
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import custos
+import motor_backtest
+
+# Varredura de parâmetros do gatilho em paralelo.
+#
+# O processo principal carrega preços e pesos uma única vez e os coloca em
+# blocos de memória compartilhada; cada worker só anexa esses blocos (sem
+# cópia e sem reler CSV), deriva os sinais do motor uma vez e avalia lotes
+# de combinações. O resultado é um cubo compacto (.npz) com os parâmetros e
+# as métricas de cada combinação. Com custos_negociacao (veja custos.py), as
+# métricas incluem as líquidas de custos, calculadas com as matrizes de
+# negociação do MotorCustos montadas uma vez por processo.
+#
+#   python varredura.py --spread 0.002 --corretagem 0.0005
+
+NOMES_PARAMETROS = list(motor_backtest.PARAMETROS_PADRAO)
+NOMES_METRICAS = ['retorno_acumulado', 'vol_media', 'tempo_na_banda']
+TAMANHO_LOTE = 256
+
+_sinais_worker = None
+_custos_worker = None
+_blocos_worker = None
+
+
+def nomes_metricas(com_custos=False):
+    return NOMES_METRICAS + (custos.NOMES_METRICAS if com_custos else [])
+
+
+# Coloca arrays em memória compartilhada. Devolve os blocos (que o chamador
+# deve fechar e liberar) e os descritores que os workers usam para anexar.
+def compartilhar(arrays):
+    blocos = []
+    descritores = {}
+    for nome, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        bloco = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        copia = np.ndarray(array.shape, dtype=array.dtype, buffer=bloco.buf)
+        copia[...] = array
+        blocos.append(bloco)
+        descritores[nome] = (bloco.name, array.shape, array.dtype.str)
+    return blocos, descritores
+
+
+# Quem cria o bloco é quem o libera; os workers só anexam. Antes do Python
+# 3.13 não há `track`, e o resource_tracker (único para a árvore de processos)
+# já conhece o bloco pelo registro do processo principal.
+def _abrir_bloco(nome):
+    try:
+        return shared_memory.SharedMemory(name=nome, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=nome)
+
+
+def anexar(descritores):
+    blocos = []
+    arrays = {}
+    for nome, (bloco_nome, forma, tipo) in descritores.items():
+        bloco = _abrir_bloco(bloco_nome)
+        array = np.ndarray(forma, dtype=np.dtype(tipo), buffer=bloco.buf)
+        array.flags.writeable = False
+        blocos.append(bloco)
+        arrays[nome] = array
+    return blocos, arrays
+
+
+def liberar(blocos):
+    for bloco in blocos:
+        bloco.close()
+        bloco.unlink()
+
+
+# Sinais e motor de custos de um worker, a partir dos blocos compartilhados
+def iniciar_worker(descritores, ativos, custos_negociacao):
+    blocos, insumos = anexar(descritores)
+    insumos.update(datas=None, ativos=ativos)
+    return blocos, motor_backtest.derivar_sinais(insumos), custos.motor_negociacao(insumos, custos_negociacao)
+
+
+def _iniciar_worker(descritores, ativos, custos_negociacao):
+    global _sinais_worker, _custos_worker, _blocos_worker
+    _blocos_worker, _sinais_worker, _custos_worker = iniciar_worker(descritores, ativos, custos_negociacao)
+
+
+def avaliar_lote(sinais, combinacoes, motor_custos=None):
+    nomes = nomes_metricas(motor_custos is not None)
+    metricas = np.empty((len(combinacoes), len(nomes)), dtype=np.float32)
+    for i, valores in enumerate(combinacoes):
+        parametros = dict(zip(NOMES_PARAMETROS, valores))
+        resultado = motor_backtest.avaliar(sinais, parametros)
+        if motor_custos is not None:
+            resultado.update(custos.resumo_liquido(sinais, motor_custos, resultado['regime']))
+        metricas[i] = [resultado[nome] for nome in nomes]
+    return metricas
+
+
+def _avaliar_lote_worker(combinacoes):
+    return avaliar_lote(_sinais_worker, combinacoes, _custos_worker)
+
+
+# Produto cartesiano dos eixos informados; os parâmetros ausentes ficam no
+# valor de `base`. Devolve as combinações (K x 9) e a forma da grade.
+def gerar_grade(eixos, base=None):
+    base = dict(motor_backtest.PARAMETROS_PADRAO if base is None else base)
+    valores = [np.atleast_1d(eixos.get(nome, [base[nome]])) for nome in NOMES_PARAMETROS]
+    forma = tuple(len(v) for v in valores)
+    combinacoes = np.array(list(itertools.product(*valores)), dtype=np.float64)
+    return combinacoes, forma
+
+
+# Amostra uniforme dentro de `intervalos` ({nome: (minimo, maximo)});
+# limite_dias é sorteado entre inteiros.
+def amostrar(intervalos, n, base=None, semente=None):
+    base = dict(motor_backtest.PARAMETROS_PADRAO if base is None else base)
+    rng = np.random.default_rng(semente)
+    combinacoes = np.tile([base[nome] for nome in NOMES_PARAMETROS], (n, 1)).astype(np.float64)
+    for j, nome in enumerate(NOMES_PARAMETROS):
+        if nome not in intervalos:
+            continue
+        minimo, maximo = intervalos[nome]
+        if nome == 'limite_dias':
+            combinacoes[:, j] = rng.integers(minimo, maximo + 1, n)
+        else:
+            combinacoes[:, j] = rng.uniform(minimo, maximo, n)
+    return combinacoes
+
+
+def executar_varredura(insumos, combinacoes, processos=None, tamanho_lote=TAMANHO_LOTE, custos_negociacao=None):
+    combinacoes = np.asarray(combinacoes, dtype=np.float64)
+    lotes = [combinacoes[i:i + tamanho_lote] for i in range(0, len(combinacoes), tamanho_lote)]
+    processos = processos or os.cpu_count() or 1
+
+    if processos == 1 or len(lotes) == 1:
+        sinais = motor_backtest.derivar_sinais(insumos)
+        motor_custos = custos.motor_negociacao(insumos, custos_negociacao)
+        resultados = [avaliar_lote(sinais, lote, motor_custos) for lote in lotes]
+    else:
+        arrays = {nome: insumos[nome] for nome in ('retornos', 'alta', 'baixa')}
+        blocos, descritores = compartilhar(arrays)
+        try:
+            with ProcessPoolExecutor(processos, initializer=_iniciar_worker,
+                                     initargs=(descritores, insumos['ativos'], custos_negociacao)) as executor:
+                resultados = list(executor.map(_avaliar_lote_worker, lotes))
+        finally:
+            liberar(blocos)
+
+    if not resultados:
+        return np.empty((0, len(nomes_metricas(bool(custos_negociacao)))), dtype=np.float32)
+    return np.concatenate(resultados)
+
+
+def salvar_cubo(caminho, combinacoes, metricas, forma=None, nomes=None):
+    np.savez_compressed(caminho,
+                        nomes_parametros=np.array(NOMES_PARAMETROS),
+                        nomes_metricas=np.array(NOMES_METRICAS if nomes is None else nomes),
+                        parametros=np.asarray(combinacoes, dtype=np.float64),
+                        metricas=np.asarray(metricas, dtype=np.float32),
+                        forma=np.array(forma if forma is not None else (len(metricas),)))
+    return caminho
+
+
+# Lê o cubo salvo. Para grades, as métricas voltam com a forma da grade mais
+# o eixo das métricas: metricas[i_limite_dias, ..., i_metrica].
+def carregar_cubo(caminho):
+    with np.load(caminho) as dados:
+        forma = tuple(dados['forma'])
+        cubo = {
+            'nomes_parametros': list(dados['nomes_parametros']),
+            'nomes_metricas': list(dados['nomes_metricas']),
+            'parametros': dados['parametros'],
+            'metricas': dados['metricas']
+        }
+    cubo['metricas'] = cubo['metricas'].reshape(forma + (len(cubo['nomes_metricas']),))
+    return cubo
+
+
+def varrer(eixos=None, intervalos=None, n_amostras=1000, caminho='varredura.npz', processos=None, semente=None,
+           custos_negociacao=None):
+    insumos = motor_backtest.preparar_insumos(motor_backtest.carregar_precos(),
+                                              motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_ALTA),
+                                              motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_BAIXA))
+    base = motor_backtest.carregar_parametros()
+    if eixos is not None:
+        combinacoes, forma = gerar_grade(eixos, base)
+    else:
+        combinacoes, forma = amostrar(intervalos or {}, n_amostras, base, semente), None
+    metricas = executar_varredura(insumos, combinacoes, processos, custos_negociacao=custos_negociacao)
+    return salvar_cubo(caminho, combinacoes, metricas, forma, nomes_metricas(bool(custos_negociacao)))
+
+
+# Argumentos --spread/--corretagem/--impacto, também usados no walk-forward
+def adicionar_argumentos_custos(parser):
+    for nome in ('spread', 'corretagem', 'impacto'):
+        parser.add_argument(f'--{nome}', type=float, help=f'{nome} por ativo, fração do valor negociado')
+
+
+# custos_negociacao dos argumentos; None se nenhum foi informado
+def custos_dos_argumentos(argumentos):
+    informados = {nome: getattr(argumentos, nome) for nome in ('spread', 'corretagem', 'impacto')}
+    informados = {nome: valor for nome, valor in informados.items() if valor is not None}
+    return informados or None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Varre a grade de parâmetros do gatilho.')
+    adicionar_argumentos_custos(parser)
+    argumentos = parser.parse_args()
+    print(varrer(eixos={
+        'limite_dias': [5, 8, 13, 21],
+        'vol_gatilho_subir': np.arange(0.10, 0.181, 0.01),
+        'vol_gatilho_descer': np.arange(0.05, 0.101, 0.01),
+        'concentracao_gatilho_subir': [0.4, 0.5, 0.6, 0.7],
+        'concentracao_gatilho_descer': [0.4, 0.5, 0.6, 0.7]
+    }, custos_negociacao=custos_dos_argumentos(argumentos)))
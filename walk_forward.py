@@ -0,0 +1,207 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import custos
+import motor_backtest
+import varredura
+
+# Validação walk-forward do gatilho.
+#
+# O histórico é dividido em dobras móveis: em cada uma os parâmetros são
+# calibrados na janela de treino (a combinação de `candidatos` com melhor
+# `metrica`, respeitando o teto de vol média) e aplicados na janela de teste
+# seguinte. As janelas de teste não se sobrepõem e, costuradas, formam a cota
+# fora da amostra. Os sinais do motor não dependem dos parâmetros, então são
+# derivados uma vez por processo; o regime e a vol móvel do teste são
+# calculados desde o início do treino, para chegar ao teste com o estado que
+# teriam ao vivo.
+#
+# As dobras rodam num pool de processos. Como na varredura, preços e pesos
+# ficam em memória compartilhada e cada worker só os anexa.
+#
+# Com custos_negociacao (veja custos.py), cada dobra também mede as métricas
+# líquidas de custos no treino e no teste, e a calibração pode escolher pela
+# líquida:
+#
+#   python walk_forward.py --spread 0.002 --corretagem 0.0005 --metrica retorno_liquido
+
+TREINO = 2 * motor_backtest.DIAS_UTEIS
+TESTE = motor_backtest.DIAS_UTEIS // 2
+VOL_MAXIMA = 0.12
+
+GRADE_PADRAO = {
+    'limite_dias': [5, 10, 13, 20],
+    'vol_gatilho_subir': [0.11, 0.13, 0.15],
+    'vol_gatilho_descer': [0.06, 0.07, 0.08]
+}
+
+_sinais_worker = None
+_custos_worker = None
+_blocos_worker = None
+
+
+# (inicio_treino, inicio_teste, fim_teste) em posições; o fim é exclusivo
+def gerar_dobras(n_dias, treino=TREINO, teste=TESTE):
+    dobras = []
+    inicio_teste = treino
+    while inicio_teste < n_dias:
+        dobras.append((inicio_teste - treino, inicio_teste, min(inicio_teste + teste, n_dias)))
+        inicio_teste += teste
+    return dobras
+
+
+def _recortar(sinais, inicio, fim):
+    return {nome: valores[inicio:fim] for nome, valores in sinais.items() if nome != 'datas'}
+
+
+# Índice da melhor combinação: maior `metrica` entre as que ficam dentro do
+# teto de vol média; se nenhuma fica, a de menor vol média.
+def escolher(metricas, metrica='retorno_acumulado', vol_maxima=VOL_MAXIMA, nomes=varredura.NOMES_METRICAS):
+    coluna = nomes.index(metrica)
+    vol = metricas[:, nomes.index('vol_media')]
+    dentro = np.nan_to_num(vol, nan=np.inf) <= vol_maxima
+    if not dentro.any():
+        return int(np.nanargmin(vol))
+    return int(np.nanargmax(np.where(dentro, metricas[:, coluna], -np.inf)))
+
+
+def executar_dobra(sinais, dobra, candidatos, metrica='retorno_acumulado', vol_maxima=VOL_MAXIMA, motor_custos=None):
+    inicio_treino, inicio_teste, fim_teste = dobra
+    nomes = varredura.nomes_metricas(motor_custos is not None)
+    relogio = time.perf_counter()
+    custos_treino = None if motor_custos is None else motor_custos.recortar(inicio_treino, inicio_teste)
+    metricas_treino = varredura.avaliar_lote(_recortar(sinais, inicio_treino, inicio_teste), candidatos, custos_treino)
+    melhor = escolher(metricas_treino, metrica, vol_maxima, nomes)
+    parametros = dict(zip(varredura.NOMES_PARAMETROS, candidatos[melhor]))
+    tempo_calibracao = time.perf_counter() - relogio
+
+    relogio = time.perf_counter()
+    trecho = _recortar(sinais, inicio_treino, fim_teste)
+    regime = motor_backtest.calcular_regime(trecho['vol_sinal'], trecho['concentracao'], parametros)
+    # A vol móvel do teste começa aquecida com o fim do treino
+    retornos_trecho = motor_backtest.retorno_fundo(trecho, regime)
+    retornos = retornos_trecho[inicio_teste - inicio_treino:]
+    teste = motor_backtest.metricas_cota(retornos_trecho, parametros, inicio_teste - inicio_treino)
+    teste = {nome: float(teste[nome]) for nome in varredura.NOMES_METRICAS}
+    retornos_liquidos = None
+    if motor_custos is not None:
+        custos_trecho = motor_custos.recortar(inicio_treino, fim_teste)
+        teste.update(custos.resumo_liquido(trecho, custos_trecho, regime, inicio_teste - inicio_treino))
+        custo = custos_trecho.custo_diario(regime)[0, inicio_teste - inicio_treino:]
+        retornos_liquidos = (1 + retornos) * (1 - custo) - 1
+    tempo_teste = time.perf_counter() - relogio
+
+    return {
+        'dobra': dobra,
+        'parametros': parametros,
+        'treino': dict(zip(nomes, metricas_treino[melhor].tolist())),
+        'teste': teste,
+        'retornos': retornos,
+        'retornos_liquidos': retornos_liquidos,
+        'tempo_calibracao': tempo_calibracao,
+        'tempo_teste': tempo_teste
+    }
+
+
+def _iniciar_worker(descritores, ativos, custos_negociacao):
+    global _sinais_worker, _custos_worker, _blocos_worker
+    _blocos_worker, _sinais_worker, _custos_worker = varredura.iniciar_worker(descritores, ativos, custos_negociacao)
+
+
+def _executar_dobra_worker(argumentos):
+    return executar_dobra(_sinais_worker, *argumentos, motor_custos=_custos_worker)
+
+
+def executar(insumos, candidatos, treino=TREINO, teste=TESTE, metrica='retorno_acumulado',
+             vol_maxima=VOL_MAXIMA, processos=None, custos_negociacao=None):
+    candidatos = np.asarray(candidatos, dtype=np.float64)
+    dobras = gerar_dobras(len(insumos['datas']), treino, teste)
+    argumentos = [(dobra, candidatos, metrica, vol_maxima) for dobra in dobras]
+    processos = processos or os.cpu_count() or 1
+
+    relogio = time.perf_counter()
+    if processos == 1 or len(dobras) <= 1:
+        sinais = motor_backtest.derivar_sinais(insumos)
+        motor_custos = custos.motor_negociacao(insumos, custos_negociacao)
+        resultados = [executar_dobra(sinais, *a, motor_custos=motor_custos) for a in argumentos]
+    else:
+        arrays = {nome: insumos[nome] for nome in ('retornos', 'alta', 'baixa')}
+        blocos, descritores = varredura.compartilhar(arrays)
+        try:
+            with ProcessPoolExecutor(min(processos, len(dobras)), initializer=_iniciar_worker,
+                                     initargs=(descritores, insumos['ativos'], custos_negociacao)) as executor:
+                resultados = list(executor.map(_executar_dobra_worker, argumentos))
+        finally:
+            varredura.liberar(blocos)
+    return relatorio(insumos['datas'], resultados, time.perf_counter() - relogio)
+
+
+# Tabela por dobra (datas, parâmetros escolhidos, métricas de treino e teste,
+# tempos) e a cota fora da amostra costurada (e a líquida de custos, se houve)
+def relatorio(datas, resultados, tempo_total):
+    linhas = []
+    retornos = []
+    liquidos = []
+    for resultado in resultados:
+        inicio_treino, inicio_teste, fim_teste = resultado['dobra']
+        linha = {
+            'inicio_treino': datas[inicio_treino],
+            'inicio_teste': datas[inicio_teste],
+            'fim_teste': datas[fim_teste - 1],
+            'tempo_calibracao': resultado['tempo_calibracao'],
+            'tempo_teste': resultado['tempo_teste']
+        }
+        linha.update({f'treino_{nome}': valor for nome, valor in resultado['treino'].items()})
+        linha.update({f'teste_{nome}': valor for nome, valor in resultado['teste'].items()})
+        linha.update(resultado['parametros'])
+        linhas.append(linha)
+        retornos.append(resultado['retornos'])
+        if resultado.get('retornos_liquidos') is not None:
+            liquidos.append(resultado['retornos_liquidos'])
+
+    inicio = resultados[0]['dobra'][1] if resultados else 0
+    retornos = np.concatenate(retornos) if retornos else np.array([])
+    indice = datas[inicio:inicio + len(retornos)]
+    saida = {
+        'dobras': pd.DataFrame(linhas),
+        'cota': pd.Series(np.cumprod(1 + retornos), index=indice, name='Fundo fora da amostra'),
+        'tempo_total': tempo_total
+    }
+    if liquidos:
+        saida['cota_liquida'] = pd.Series(np.cumprod(1 + np.concatenate(liquidos)), index=indice,
+                                          name='Fundo fora da amostra, líquido de custos')
+    return saida
+
+
+def walk_forward(eixos=None, treino=TREINO, teste=TESTE, metrica='retorno_acumulado', processos=None,
+                 custos_negociacao=None):
+    insumos = motor_backtest.preparar_insumos(motor_backtest.carregar_precos(),
+                                              motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_ALTA),
+                                              motor_backtest.carregar_pesos(motor_backtest.ARQUIVO_PESOS_BAIXA))
+    candidatos, _ = varredura.gerar_grade(GRADE_PADRAO if eixos is None else eixos, motor_backtest.carregar_parametros())
+    return executar(insumos, candidatos, treino, teste, metrica, processos=processos,
+                    custos_negociacao=custos_negociacao)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Validação walk-forward do gatilho.')
+    varredura.adicionar_argumentos_custos(parser)
+    parser.add_argument('--metrica', default='retorno_acumulado',
+                        choices=varredura.nomes_metricas(True), help='métrica maximizada no treino')
+    argumentos = parser.parse_args()
+    custos_negociacao = varredura.custos_dos_argumentos(argumentos)
+    resultado = walk_forward(metrica=argumentos.metrica, custos_negociacao=custos_negociacao)
+    colunas = ['inicio_teste', 'fim_teste', 'tempo_calibracao', f'treino_{argumentos.metrica}',
+               'teste_retorno_acumulado', 'teste_vol_media', 'teste_tempo_na_banda']
+    if custos_negociacao:
+        colunas += ['teste_retorno_liquido', 'teste_giro_anual']
+    print(resultado['dobras'][list(dict.fromkeys(colunas))].to_string(index=False))
+    print(f'Retorno fora da amostra: {resultado["cota"].iloc[-1] - 1:.2%}')
+    if custos_negociacao:
+        print(f'Retorno fora da amostra, líquido de custos: {resultado["cota_liquida"].iloc[-1] - 1:.2%}')
+    print(f'Tempo total: {resultado["tempo_total"]:.2f} s')